@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+""" Wall time of compiling G-code programs to the realTimePlayer stream
+    against number of worker processes.
+    Usage: PYTHONPATH=src python benchmark/bench_compile.py [-r 10] [files]
+"""
+
+from __future__ import print_function
+import argparse
+import contextlib
+import glob
+import io
+import multiprocessing
+import os
+import time
+
+from cnc.compiler import Compiler, CompilerException
+from cnc.gcode import GCode
+from cnc.gmachine import GMachine
+from cnc.hal import HalFileExporter
+from cnc.rtstream import ENCODING_ANGLE, RtStreamWriter
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def program_lines(path, repeat):
+    """ Program without the trailing lines which stop it, repeated. """
+    with open(path) as f:
+        lines = [line for line in f
+                 if line.strip().lower() not in ('exit', 'quit')]
+    return lines * repeat
+
+
+def run_sequential(lines):
+    """ Line by line like cnc/main.py does, stdout goes to /dev/null. """
+    stream = io.BytesIO()
+    start = time.time()
+    hal = HalFileExporter(open_stream=False)
+    hal._rt_writer = RtStreamWriter(stream, ENCODING_ANGLE)
+    machine = GMachine(hal)
+    with open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull):
+        for line in lines:
+            machine.do_command(GCode.parse_line(line.strip()))
+        machine.release()
+    return time.time() - start
+
+
+def run(lines, jobs):
+    stream = io.BytesIO()
+    start = time.time()
+    try:
+        Compiler(stream, ENCODING_ANGLE, jobs).compile(lines)
+    except CompilerException as e:
+        print('ERROR ' + str(e))
+    return time.time() - start, len(stream.getvalue())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('files', nargs='*', default=sorted(
+        glob.glob(os.path.join(ROOT, 'gcode', 'test*.gcode'))))
+    parser.add_argument('-r', '--repeat', type=int, default=10,
+                        help="repeat each program to make it longer")
+    parser.add_argument('-j', '--max-jobs', type=int,
+                        default=multiprocessing.cpu_count())
+    args = parser.parse_args()
+    print("{:<20} {:>5} {:>10} {:>10} {:>8}".format(
+        "program", "jobs", "bytes", "wall, s", "speedup"))
+    for path in args.files:
+        lines = program_lines(path, args.repeat)
+        print("{:<20} {:>5} {:>10} {:>10.3f}".format(
+            os.path.basename(path), "seq", "", run_sequential(lines)))
+        base = None
+        for jobs in range(1, args.max_jobs + 1):
+            wall, size = run(lines, jobs)
+            base = base or wall
+            print("{:<20} {:>5} {:>10} {:>10.3f} {:>8.2f}".format(
+                os.path.basename(path), jobs, size, wall, base / wall))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+""" Microbenchmark of Coordinates: memory of one object, time of
+    arithmetic, of iterating PathGenerator and of running a program through
+    GMachine without output.
+    Usage: PYTHONPATH=src python benchmark/bench_coordinates.py
+"""
+
+from __future__ import print_function
+import os
+import time
+import tracemalloc
+
+from cnc.coordinates import Coordinates
+from cnc.gcode import GCode
+from cnc.gmachine import GMachine
+from cnc.path import PathGenerator
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def arithmetic():
+    a = Coordinates(1.0, 2.0, 3.0, 4.0)
+    b = Coordinates(0.5, 0.25, 0.125, 0.0)
+    for _ in range(100000):
+        c = abs(a - b) * 0.5 + b
+        c.is_zero()
+        c.length()
+
+
+def path_iteration():
+    for velocity in (60, 600, 6000) * 20:
+        delta = Coordinates(30.0, -20.0, 5.0, 0.0)
+        for _ in PathGenerator(delta, delta, velocity):
+            pass
+
+
+class NullHal(object):
+    def check_valid_position(self, x, y, z):
+        return True
+
+    def check_valid_segment(self, start, end):
+        return True
+
+    def move(self, generator):
+        generator.sample_all()
+
+    def spindle_control(self, percent):
+        pass
+
+    def join(self):
+        pass
+
+    def deinit(self):
+        pass
+
+
+def program():
+    lines = [line.strip() for line in
+             open(os.path.join(ROOT, 'gcode', 'test1.gcode'))
+             if line.strip() != 'exit'] * 200
+    machine = GMachine(NullHal())
+    for line in lines:
+        machine.do_command(GCode.parse_line(line))
+    machine.release()
+
+
+def instances(count=100000):
+    """ Memory of Coordinates objects which are alive.
+    :return: Tuple of bytes and memory blocks per object.
+    """
+    a = Coordinates(1.0, 2.0, 3.0, 4.0)
+    b = Coordinates(0.5, 0.25, 0.125, 0.0)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    alive = [a - b for _ in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, 'filename')
+    size = sum(stat.size_diff for stat in stats)
+    blocks = sum(stat.count_diff for stat in stats)
+    del alive
+    return size / count, blocks / count
+
+
+def main():
+    size, blocks = instances()
+    print("Coordinates object: {:.1f} bytes, {:.2f} memory blocks"
+          .format(size, blocks))
+    for function in (arithmetic, path_iteration, program):
+        start = time.time()
+        function()
+        print("{:<16} {:>8.3f} s".format(function.__name__,
+                                         time.time() - start))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+""" Benchmark suite of the planning and kinematics hot paths. Each case is
+    run several times and the best time is reported with the rate of
+    processed items. For cases which produce samples the rate is in samples
+    per second and is compared with real time, i.e. 1 / REAL_TIME_DT samples
+    per second, planning has to be faster than 1.0x to keep realTimePlayer
+    busy.
+    Results can be saved as JSON and compared with a baseline saved the same
+    way. Results hold the host (HOST_KEYS), rates depend on it, so the exit
+    code is 1 if any case is slower than the baseline by more than the
+    tolerance only when the baseline was saved on the same host, otherwise
+    the comparison is just printed with a warning.
+    benchmark/baseline.json is the reference result of one development
+    machine. To check a change for regressions save the baseline locally
+    before the change and compare with it after:
+        PYTHONPATH=src python benchmark/run.py -o baseline.json
+        PYTHONPATH=src python benchmark/run.py -b baseline.json
+    Regenerate benchmark/baseline.json the same way with
+    -o benchmark/baseline.json when cases change.
+    Usage: PYTHONPATH=src python benchmark/run.py [-r 5] [-k parse]
+                          [-o results.json] [-b baseline.json] [-t 0.1]
+"""
+
+from __future__ import print_function
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+from cnc.config import REAL_TIME_DT, DELTA_Z_OFFSET
+from cnc.coordinates import Coordinates
+from cnc.gcode import GCode
+from cnc.gmachine import GMachine
+from cnc.hal import HalFileExporter
+from cnc.path import PathGenerator
+from cnc.rtstream import ENCODING_ANGLE, FRAME_SIZE, RtStreamWriter, \
+    encode_header
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# results format, increment when cases change incompatibly
+RESULTS_VERSION = 1
+
+# rates are compared strictly only if all these fields of results match
+HOST_KEYS = ('machine', 'cpu', 'python', 'numpy')
+
+
+def cpu_name():
+    """ Model name of the processor, architecture if it is unknown. """
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except (IOError, OSError):
+        pass
+    return platform.processor() or platform.machine()
+
+
+class NullSink(object):
+    """ File object which drops everything, but counts what it gets. """
+    def __init__(self):
+        self.bytes = 0
+        self.lines = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+        if isinstance(data, str):
+            self.lines += data.count('\n')
+
+    def frames(self):
+        """ Number of frames of binary stream. """
+        return (self.bytes - len(encode_header(ENCODING_ANGLE))) // FRAME_SIZE
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def program_lines(name):
+    """ Program without the trailing lines which stop it. """
+    with open(os.path.join(ROOT, 'gcode', name)) as f:
+        return [line.strip() for line in f
+                if line.strip().lower() not in ('exit', 'quit')]
+
+
+def movements():
+    """ Linear movements of different lengths and velocities. """
+    result = []
+    for velocity in (60, 600, 6000):
+        for delta in ((10.0, -5.0, 2.0, 0.0), (-3.0, 8.0, -1.0, 0.0),
+                      (2.0, 2.0, 0.0, 0.0)):
+            delta = Coordinates(*delta)
+            result.append((delta, delta, velocity))
+    return result * 5
+
+
+# Each case prepares everything which is not measured and returns a function
+# which runs the measured part and returns the number of processed items.
+
+def case_parse_line():
+    lines = (program_lines('test1.gcode')
+             + program_lines('test2.gcode')) * 400
+
+    def run():
+        for line in lines:
+            GCode.parse_line(line)
+        return len(lines)
+    return 'lines', run
+
+
+def case_path_iteration():
+    moves = movements()
+
+    def run():
+        count = 0
+        for delta, new_pos, velocity in moves:
+            for _ in PathGenerator(delta, new_pos, velocity):
+                count += 1
+        return count
+    return 'samples', run
+
+
+def case_update_from_new_tip_pos():
+    robot = HalFileExporter(open_stream=False).robot
+    tip_pos = [row[0:3] / 1000 + np.array([0.0, 0.0, DELTA_Z_OFFSET])
+               for delta, new_pos, velocity in movements()
+               for row in PathGenerator(delta, new_pos,
+                                        velocity).sample_all()]
+
+    def run():
+        for pos in tip_pos:
+            robot.update_from_new_tip_pos(pos)
+        return len(tip_pos)
+    return 'samples', run
+
+
+def _hal_move(binary):
+    hal = HalFileExporter(open_stream=False)
+    sink = NullSink()
+    if binary:
+        hal._rt_writer = RtStreamWriter(sink, ENCODING_ANGLE)
+    moves = movements()
+
+    def run():
+        sink.bytes = len(encode_header(ENCODING_ANGLE))
+        sink.lines = 0
+        with contextlib.redirect_stdout(sink):
+            for delta, new_pos, velocity in moves:
+                hal.move(PathGenerator(delta, new_pos, velocity))
+        return sink.frames() if binary else sink.lines
+    return 'samples', run
+
+
+def case_hal_move_text():
+    return _hal_move(False)
+
+
+def case_hal_move_angle():
+    return _hal_move(True)
+
+
+def _end_to_end(name, binary):
+    lines = program_lines(name) * 5
+
+    def run():
+        hal = HalFileExporter(open_stream=False)
+        sink = NullSink()
+        stream = NullSink()
+        if binary:
+            hal._rt_writer = RtStreamWriter(stream, ENCODING_ANGLE)
+        machine = GMachine(hal)
+        with contextlib.redirect_stdout(sink):
+            for line in lines:
+                machine.do_command(GCode.parse_line(line))
+            machine.release()
+        return stream.frames() if binary else sink.lines
+    return 'samples', run
+
+
+def case_end_to_end_test1_text():
+    return _end_to_end('test1.gcode', False)
+
+
+def case_end_to_end_test2_text():
+    return _end_to_end('test2.gcode', False)
+
+
+def case_end_to_end_test1_angle():
+    return _end_to_end('test1.gcode', True)
+
+
+def case_end_to_end_test2_angle():
+    return _end_to_end('test2.gcode', True)
+
+
+CASES = [(name[len('case_'):], function)
+         for name, function in sorted(globals().items())
+         if name.startswith('case_')]
+
+
+def measure(prepare, repeat):
+    """ Run case.
+    :return: dict with the results.
+    """
+    unit, run = prepare()
+    run()  # warm up caches
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        items = run()
+        times.append(time.perf_counter() - start)
+    best = min(times)
+    result = {'unit': unit, 'items': items, 'best_s': best,
+              'median_s': sorted(times)[len(times) // 2],
+              'rate': items / best}
+    if unit == 'samples':
+        result['realtime'] = result['rate'] * REAL_TIME_DT
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """ Compare rates with baseline.
+    :return: list of names of cases which are slower than baseline.
+    """
+    slower = []
+    for name, result in sorted(results['cases'].items()):
+        base = baseline['cases'].get(name)
+        if base is None:
+            continue
+        ratio = result['rate'] / base['rate']
+        if ratio < 1.0 - tolerance:
+            slower.append(name)
+        print("{:<28} {:>8.2f}x{}".format(
+            name, ratio, "  SLOWER" if name in slower else ""))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark suite of the planning and kinematics.")
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help="number of measured runs of each case")
+    parser.add_argument('-k', '--filter', default='',
+                        help="run only cases with this substring in name")
+    parser.add_argument('-o', '--output', help="save results to JSON file")
+    parser.add_argument('-b', '--baseline',
+                        help="compare with results saved before")
+    parser.add_argument('-t', '--tolerance', type=float, default=0.1,
+                        help="allowed slowdown comparing to baseline")
+    args = parser.parse_args()
+
+    results = {'version': RESULTS_VERSION,
+               'python': platform.python_version(),
+               'numpy': np.__version__,
+               'machine': platform.machine(),
+               'cpu': cpu_name(),
+               'cases': {}}
+    print("{:<28} {:>8} {:>9} {:>10} {:<8} {:>9}".format(
+        "case", "items", "best, s", "rate", "", "realtime"))
+    for name, prepare in CASES:
+        if args.filter not in name:
+            continue
+        result = measure(prepare, args.repeat)
+        results['cases'][name] = result
+        realtime = result.get('realtime')
+        print("{:<28} {:>8} {:>9.4f} {:>10.0f} {:<8} {:>9}".format(
+            name, result['items'], result['best_s'], result['rate'],
+            result['unit'] + '/s',
+            "" if realtime is None else "{:.1f}x".format(realtime)))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('version') != RESULTS_VERSION:
+            print("baseline has different version, not compared")
+            return
+        print("\ncomparing with " + args.baseline)
+        other = [key for key in HOST_KEYS
+                 if baseline.get(key) != results[key]]
+        if compare(results, baseline, args.tolerance):
+            if other:
+                print("WARNING baseline was saved on another host ({}), "
+                      "slower cases are not failed, save the baseline "
+                      "locally with -o".format(", ".join(
+                          "{} {} != {}".format(key, baseline.get(key),
+                                               results[key])
+                          for key in other)))
+            else:
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
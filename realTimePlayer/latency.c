@@ -0,0 +1,89 @@
+#include <string.h>
+
+#include "latency.h"
+
+void lat_hist_add(lat_hist_t *hist, long ns)
+{
+	long bucket = ns / LAT_BUCKET_NS;
+
+	if (bucket < 0)
+		bucket = 0;
+	else if (bucket >= LAT_BUCKETS)
+		bucket = LAT_BUCKETS - 1;
+	hist->buckets[bucket]++;
+	if (hist->count == 0 || ns < hist->min_ns)
+		hist->min_ns = ns;
+	if (hist->count == 0 || ns > hist->max_ns)
+		hist->max_ns = ns;
+	hist->sum_ns += ns;
+	hist->count++;
+}
+
+static void dump_hist_json(FILE *f, const char *name, const lat_hist_t *hist)
+{
+	const char *sep = "";
+	int i;
+
+	fprintf(f, "  \"%s\": {\n", name);
+	fprintf(f, "    \"count\": %lu,\n", hist->count);
+	fprintf(f, "    \"min_ns\": %ld,\n", hist->count ? hist->min_ns : 0);
+	fprintf(f, "    \"max_ns\": %ld,\n", hist->count ? hist->max_ns : 0);
+	fprintf(f, "    \"mean_ns\": %.0f,\n", hist->count ? hist->sum_ns / hist->count : 0.0);
+	fprintf(f, "    \"bucket_ns\": %ld,\n", LAT_BUCKET_NS);
+	/* only non empty buckets, [lower bound in ns, count] */
+	fprintf(f, "    \"histogram\": [");
+	for (i = 0; i < LAT_BUCKETS; i++) {
+		if (hist->buckets[i] == 0)
+			continue;
+		fprintf(f, "%s[%ld, %lu]", sep, i * LAT_BUCKET_NS, hist->buckets[i]);
+		sep = ", ";
+	}
+	fprintf(f, "]\n  }");
+}
+
+static void dump_hist_csv(FILE *f, const char *name, const lat_hist_t *hist)
+{
+	int i;
+
+	for (i = 0; i < LAT_BUCKETS; i++)
+		if (hist->buckets[i])
+			fprintf(f, "%s,%ld,%lu\n", name, i * LAT_BUCKET_NS, hist->buckets[i]);
+}
+
+int rt_stats_dump(const rt_stats_t *stats, const char *path, int csv)
+{
+	FILE *f = stdout;
+
+	if (path != NULL && strcmp(path, "-") != 0) {
+		f = fopen(path, "w");
+		if (f == NULL) {
+			printf("can't open %s\n", path);
+			return -1;
+		}
+	}
+
+	if (csv) {
+		fprintf(f, "metric,bucket_ns,count\n");
+		fprintf(f, "ticks,,%lu\n", stats->ticks);
+		fprintf(f, "missed_periods,,%lu\n", stats->missed_periods);
+		fprintf(f, "underruns,,%lu\n", stats->underruns);
+		dump_hist_csv(f, "wakeup_latency", &stats->wakeup);
+		dump_hist_csv(f, "pwm_write", &stats->pwm_write);
+	} else {
+		fprintf(f, "{\n");
+		fprintf(f, "  \"period_ns\": %lu,\n", stats->period_ns);
+		fprintf(f, "  \"ticks\": %lu,\n", stats->ticks);
+		fprintf(f, "  \"missed_periods\": %lu,\n", stats->missed_periods);
+		fprintf(f, "  \"underruns\": %lu,\n", stats->underruns);
+		dump_hist_json(f, "wakeup_latency", &stats->wakeup);
+		fprintf(f, ",\n");
+		dump_hist_json(f, "pwm_write", &stats->pwm_write);
+		fprintf(f, "\n}\n");
+	}
+
+	if (f != stdout)
+		fclose(f);
+	else
+		fflush(f);
+	return 0;
+}
@@ -0,0 +1,40 @@
+#ifndef LATENCY_H
+#define LATENCY_H
+
+#include <stdio.h>
+
+/*
+ * Timing statistics of the real time loop. Everything lives in fixed,
+ * preallocated arrays so recording a sample never allocates nor locks.
+ * Samples above the last bucket are counted in it.
+ */
+
+#define LAT_BUCKET_NS 10000L
+#define LAT_BUCKETS 2000
+
+typedef struct lat_hist {
+	unsigned long buckets[LAT_BUCKETS];
+	unsigned long count;
+	long min_ns;
+	long max_ns;
+	double sum_ns;
+} lat_hist_t;
+
+typedef struct rt_stats {
+	unsigned long period_ns;
+	unsigned long ticks;
+	/* deadlines already passed when the thread woke up */
+	unsigned long missed_periods;
+	unsigned long underruns;
+	/* wakeup time minus deadline */
+	lat_hist_t wakeup;
+	/* time spent writing the three duty cycles */
+	lat_hist_t pwm_write;
+} rt_stats_t;
+
+void lat_hist_add(lat_hist_t *hist, long ns);
+
+/* path NULL or "-" dumps to stdout */
+int rt_stats_dump(const rt_stats_t *stats, const char *path, int csv);
+
+#endif
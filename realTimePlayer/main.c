@@ -1,149 +1,297 @@
 #include <limits.h>
 #include <pthread.h>
+#include <fcntl.h>
+#include <stdatomic.h>
 #include <sched.h>
+#include <signal.h>
 #include <stdio.h>
 #include <stdlib.h>
+#include <string.h>
 #include <unistd.h>
 #include <sys/mman.h>
 #include <time.h>
 
-//#define FAKE_TARGET
-
-#define PWM_PERIOD_NS 20000000UL
-#define RT_PERIOD_US  (PWM_PERIOD_NS/1000)
-
+#include "rtstream.h"
+#include "ringbuf.h"
+#include "latency.h"
 
-#define MODEL_M 531034.0
-#define MODEL_H 1550000.0
-
-
-typedef struct linkedList {
-	float ang[3];
-	unsigned int duty[3];
-	struct linkedList *next;
-} linkedList_t;
+//#define FAKE_TARGET
 
-linkedList_t *pos_list_head = NULL;
-linkedList_t *pos_list_current = NULL;
+#define PWM_PERIOD_NS DEFAULT_PERIOD_NS
+#define DEFAULT_PWM_ROOT "/sys/class/pwm/pwmchip0"
+
+#define DEFAULT_RING_FRAMES 4096
+#define DEFAULT_PREFILL_FRAMES 50
+
+/* the shortest period the real time loop can wait */
+#define MIN_PERIOD_NS 1000
+
+/* params_state, stream_params are written by the reader thread only */
+#define PARAMS_PENDING 0
+#define PARAMS_READY 1
+#define PARAMS_FAILED 2
+
+typedef struct underrun_stats {
+	unsigned long count;
+	unsigned long longest;
+	unsigned long first_tick;
+} underrun_stats_t;
+
+/* pwm chip directory, a plain directory can stand in for tests */
+const char *pwm_root = DEFAULT_PWM_ROOT;
+/* duty_cycle files, opened once */
+int duty_fd[RT_CHANNELS];
+
+/* whole stream loaded before playing */
+rt_track_t track;
+
+/* streaming mode, the ring is filled by the reader thread while playing */
+int streaming = 0;
+const char *stream_path = NULL;
+size_t prefill_frames = DEFAULT_PREFILL_FRAMES;
+rt_ring_t ring;
+rt_stream_params_t stream_params;
+int reader_status = 0;
+/* stream_params are final once it is PARAMS_READY (release/acquire) */
+atomic_int params_state;
+atomic_int player_done;
+/* the real time thread could not play */
+int player_status = 0;
+underrun_stats_t underruns;
+
+/* timing of the real time loop, dumped at the end and on SIGUSR1 */
+rt_stats_t stats;
+const char *stats_path = NULL;
+int stats_csv = 0;
 
 void timespec_add_us(struct timespec *t, long us)
 {
 	t->tv_nsec += us*1000;
-	if (t->tv_nsec > 1000000000) {
+	if (t->tv_nsec >= 1000000000) {
 		t->tv_nsec = t->tv_nsec - 1000000000;// + ms*1000000;
 		t->tv_sec += 1;
 	}
 }
 
-unsigned int ang_to_duty(float angle){
-	return (unsigned int)(MODEL_M*angle + MODEL_H);
+long timespec_diff_ns(const struct timespec *a, const struct timespec *b)
+{
+	return (a->tv_sec - b->tv_sec) * 1000000000L + (a->tv_nsec - b->tv_nsec);
 }
 
-void init_channel(int channelNb) {
-	char pwm_path[35];
-	char enable_path[35];
-	char duty_path[35];
-	char period_path[35];
-	const unsigned long int pwm_period = PWM_PERIOD_NS;
+static void write_attr(const char *path, const char *value)
+{
 	FILE *fd;
 
-	sprintf(pwm_path,"/sys/class/pwm/pwmchip0/pwm%d",channelNb);
-	sprintf(enable_path,"/sys/class/pwm/pwmchip0/pwm%d/enable",channelNb);
-	sprintf(period_path,"/sys/class/pwm/pwmchip0/pwm%d/period",channelNb);
+	fd = fopen(path,"w");
+	if(fd == NULL) {
+		printf("can't open %s\n",path);
+		exit(-2);
+	}
+	fprintf(fd,"%s",value);
+	fclose(fd);
+}
+
+/* export and enable the channel, returns the duty_cycle descriptor */
+int init_channel(int channelNb) {
+	char pwm_path[PATH_MAX];
+	char attr_path[PATH_MAX + 16];
+	char value[32];
+	const unsigned long int pwm_period = PWM_PERIOD_NS;
+	int fd;
+
+	snprintf(pwm_path,sizeof(pwm_path),"%s/pwm%d",pwm_root,channelNb);
 
 	if( access( pwm_path, F_OK ) == -1 ) {
-		fd = fopen("/sys/class/pwm/pwmchip0/export","w");
-		if(fd == NULL) {
-			printf("can't open %s\n",pwm_path);
-			exit(-2);
-		}
-		fprintf(fd,"%d",channelNb);
-		fclose(fd);
+		snprintf(attr_path,sizeof(attr_path),"%s/export",pwm_root);
+		snprintf(value,sizeof(value),"%d",channelNb);
+		write_attr(attr_path,value);
 	}
 
-	fd = fopen(period_path,"w");
-	if(fd == NULL) {
-		printf("can't open %s\n",period_path);
+	snprintf(attr_path,sizeof(attr_path),"%s/period",pwm_path);
+	snprintf(value,sizeof(value),"%lu",pwm_period);
+	write_attr(attr_path,value);
+
+	snprintf(attr_path,sizeof(attr_path),"%s/enable",pwm_path);
+	write_attr(attr_path,"1");
+
+	snprintf(attr_path,sizeof(attr_path),"%s/duty_cycle",pwm_path);
+	fd = open(attr_path,O_WRONLY);
+	if(fd < 0) {
+		printf("can't open %s\n",attr_path);
 		exit(-2);
 	}
-	fprintf(fd,"%lu",pwm_period);
-	fclose(fd);
+	return fd;
+}
 
-	fd = fopen(enable_path,"w");
-	if(fd == NULL) {
-		printf("can't open %s\n",enable_path);
-		exit(-2);
+
+/* publish stream_params, the header is applied before the first frame */
+static void set_params_state(int state)
+{
+	if (atomic_load_explicit(&params_state, memory_order_relaxed) == PARAMS_PENDING)
+		atomic_store_explicit(&params_state, state, memory_order_release);
+}
+
+static int ring_push_wait(void *ctx, const rt_frame_t *frame)
+{
+	const struct timespec backoff = { 0, 1000000 };
+
+	set_params_state(PARAMS_READY);
+	while (!rt_ring_push(&ring, frame)) {
+		if (atomic_load(&player_done))
+			return -1;
+		nanosleep(&backoff, NULL);
 	}
-	fprintf(fd,"1");
-	fclose(fd);
+	return 0;
 }
 
+void *reader_func(void *data)
+{
+	reader_status = rt_stream_read(stream_path, &stream_params, ring_push_wait, NULL);
+	/* no frames, params are final only now */
+	set_params_state(reader_status ? PARAMS_FAILED : PARAMS_READY);
+	rt_ring_set_eof(&ring);
+	return NULL;
+}
 
-void *thread_func(void *data)
+/* wait for the reader thread to read the stream header, returns the
+ * params_state */
+static int wait_params(void)
 {
-	struct timespec next;
-	struct timespec now;
+	const struct timespec backoff = { 0, 1000000 };
+	int state;
 
-#ifndef FAKE_TARGET
-	const char *pwm_path0 = "/sys/class/pwm/pwmchip0/pwm0/duty_cycle";
-	const char *pwm_path1 = "/sys/class/pwm/pwmchip0/pwm1/duty_cycle";
-	const char *pwm_path2 = "/sys/class/pwm/pwmchip0/pwm2/duty_cycle";
+	while ((state = atomic_load_explicit(&params_state, memory_order_acquire)) == PARAMS_PENDING)
+		nanosleep(&backoff, NULL);
+	return state;
+}
 
+/* wait for the reader thread to fill the ring before starting to play */
+static void wait_prefill(void)
+{
+	const struct timespec backoff = { 0, 1000000 };
+	size_t prefill = prefill_frames;
 
+	if (prefill > rt_ring_capacity(&ring))
+		prefill = rt_ring_capacity(&ring);
+	while (rt_ring_count(&ring) < prefill && !rt_ring_eof(&ring))
+		nanosleep(&backoff, NULL);
+}
 
-	//setbuf(fd_pwm0, NULL);
-	//setbuf(fd_pwm1, NULL);
-	//setbuf(fd_pwm2, NULL);
+/* Get the frame to play at this tick. Returns 0 at the end of the stream,
+ * -1 on underrun (the previous duty cycles are kept), 1 otherwise. */
+static int next_frame(size_t tick, const rt_frame_t **frame, rt_frame_t *buf)
+{
+	static unsigned long current_run = 0;
 
-#endif
+	if (!streaming) {
+		if (tick >= track.count)
+			return 0;
+		*frame = &track.frames[tick];
+		return 1;
+	}
 
-	clock_gettime(CLOCK_REALTIME, &next);
-	pos_list_current = pos_list_head;
-	while (pos_list_current->next) {
-		FILE *fd_pwm0;
-		FILE *fd_pwm1;
-		FILE *fd_pwm2;
-		timespec_add_us(&next, RT_PERIOD_US);
+	if (rt_ring_pop(&ring, buf)) {
+		current_run = 0;
+		*frame = buf;
+		return 1;
+	}
+	if (rt_ring_eof(&ring)) {
+		/* eof is set after the last push, the ring may have been
+		 * filled between the two checks */
+		if (!rt_ring_pop(&ring, buf))
+			return 0;
+		current_run = 0;
+		*frame = buf;
+		return 1;
+	}
 
-		clock_nanosleep(CLOCK_REALTIME, TIMER_ABSTIME, &next, NULL);
+	if (underruns.count == 0)
+		underruns.first_tick = tick;
+	underruns.count++;
+	current_run++;
+	if (current_run > underruns.longest)
+		underruns.longest = current_run;
+	return -1;
+}
+
+void *thread_func(void *data)
+{
+	struct timespec next;
+	struct timespec now;
+	struct timespec write_start;
+	struct timespec written;
+	long rt_period_us;
+	long late_ns;
+	rt_frame_t buf;
+	const rt_frame_t *frame;
+	size_t tick;
+	int ret;
 #ifndef FAKE_TARGET
-		fd_pwm0 = fopen(pwm_path0,"w");
-		if(fd_pwm0 == NULL) {
-			printf("can't open %s\n",pwm_path0);
+	int i;
+#endif
+
+	if (streaming) {
+		if (wait_params() != PARAMS_READY) {
+			printf("can't read the stream\n");
+			player_status = -2;
+			atomic_store(&player_done, 1);
 			return NULL;
 		}
-		fd_pwm1 = fopen(pwm_path1,"w");
-		if(fd_pwm1 == NULL) {
-			printf("can't open %s\n",pwm_path1);
+		if (stream_params.period_ns < MIN_PERIOD_NS) {
+			printf("stream period %lu ns is too short\n", stream_params.period_ns);
+			player_status = -2;
+			atomic_store(&player_done, 1);
 			return NULL;
 		}
-		fd_pwm2 = fopen(pwm_path2,"w");
-		if(fd_pwm2 == NULL) {
-			printf("can't open %s\n",pwm_path2);
-			return NULL;
+		wait_prefill();
+		rt_period_us = stream_params.period_ns / 1000;
+	} else {
+		rt_period_us = track.params.period_ns / 1000;
+	}
+	stats.period_ns = rt_period_us * 1000;
+
+	clock_gettime(CLOCK_REALTIME, &next);
+	for (tick = 0; ; tick++) {
+		timespec_add_us(&next, rt_period_us);
+
+		clock_nanosleep(CLOCK_REALTIME, TIMER_ABSTIME, &next, NULL);
+		clock_gettime(CLOCK_REALTIME, &now);
+		late_ns = timespec_diff_ns(&now, &next);
+		lat_hist_add(&stats.wakeup, late_ns);
+		if (late_ns >= (long)stats.period_ns)
+			stats.missed_periods += late_ns / stats.period_ns;
+		stats.ticks++;
+
+		ret = next_frame(tick, &frame, &buf);
+		if (ret == 0)
+			break;
+		if (ret < 0) {
+			stats.underruns = underruns.count;
+			continue;
 		}
-#endif
 
 //      printf("nextTimeis: %lds, %luns\n", next.tv_sec, next.tv_nsec);
 
 
-		printf("%f %f %f\n",pos_list_current->ang[0],
-							pos_list_current->ang[1],
-							pos_list_current->ang[2]);
+		printf("%f %f %f\n",frame->ang[0],
+							frame->ang[1],
+							frame->ang[2]);
+		clock_gettime(CLOCK_REALTIME, &write_start);
 #ifndef FAKE_TARGET
-		//printf("writing duty of %d in channel 0\n", pos_list_current->duty[0]);
-		fprintf(fd_pwm0,"%d",pos_list_current->duty[0]);
-		//printf("writing duty of %d in channel 1\n", pos_list_current->duty[1]);
-		fprintf(fd_pwm1,"%d",pos_list_current->duty[1]);
-		//printf("writing duty of %d in channel 2\n", pos_list_current->duty[2]);
-		fprintf(fd_pwm2,"%d",pos_list_current->duty[2]);
-		fclose(fd_pwm0);
-		fclose(fd_pwm1);
-		fclose(fd_pwm2);
+		/* one unbuffered write per channel, no path lookup */
+		for (i = 0; i < RT_CHANNELS; i++) {
+			if (pwrite(duty_fd[i], frame->duty_txt[i], frame->duty_len[i], 0) < 0) {
+				printf("can't write duty cycle of channel %d: %m\n", i);
+				break;
+			}
+		}
+		if (i != RT_CHANNELS)
+			break;
 #endif
-
-		pos_list_current = pos_list_current->next;
+		clock_gettime(CLOCK_REALTIME, &written);
+		lat_hist_add(&stats.pwm_write, timespec_diff_ns(&written, &write_start));
 	}
+	atomic_store(&player_done, 1);
 	return NULL;
 }
 
@@ -153,37 +301,68 @@ int main(int argc, char* argv[])
 	struct sched_param param;
 	pthread_attr_t attr;
 	pthread_t thread;
+	pthread_t reader;
 	int ret = 0;
-	char *cmd_str = NULL;
-	size_t cmd_size = 0;
-	float x, y, z;
-
-	pos_list_head = malloc(sizeof(linkedList_t));
-	pos_list_current = pos_list_head;
-
-	while( getline(&cmd_str, &cmd_size, stdin) != -1) {
-		if (sscanf(cmd_str,"rt-cmd:POS %f %f %f",&x, &y, &z) != 0) {
-
-			pos_list_current->ang[0] = x;
-			pos_list_current->ang[1] = y;
-			pos_list_current->ang[2] = z;
-			pos_list_current->duty[0] = ang_to_duty(x);
-			pos_list_current->duty[1] = ang_to_duty(y);
-			pos_list_current->duty[2] = ang_to_duty(z);
-			pos_list_current->next = malloc(sizeof(linkedList_t));
-
-			pos_list_current = pos_list_current->next;
-			pos_list_current->next = NULL;
+	size_t ring_frames = DEFAULT_RING_FRAMES;
+	sigset_t sigset;
+	const struct timespec poll_period = { 0, 100000000 };
+	int opt;
+	static rt_calibration_t calibration;
+
+	while ((opt = getopt(argc, argv, "f:sb:p:r:l:ck:")) != -1) {
+		switch (opt) {
+		case 'k':
+			/* before the stream is read */
+			if (rt_calibration_load(&calibration, optarg))
+				exit(-2);
+			rt_stream_set_calibration(&calibration);
+			break;
+		case 'l':
+			stats_path = optarg;
+			break;
+		case 'c':
+			stats_csv = 1;
+			break;
+		case 'f':
+			stream_path = optarg;
+			break;
+		case 'r':
+			pwm_root = optarg;
+			break;
+		case 's':
+			streaming = 1;
+			break;
+		case 'b':
+			ring_frames = strtoul(optarg, NULL, 0);
+			break;
+		case 'p':
+			prefill_frames = strtoul(optarg, NULL, 0);
+			break;
+		default:
+			printf("usage: %s [-f stream] [-k calibration] [-r pwm_root] [-l stats_file [-c]] [-s [-b ring_frames] [-p prefill_frames]]\n", argv[0]);
+			exit(-1);
 		}
 	}
-	if (cmd_str != NULL) {
-		free(cmd_str);
+
+	if (streaming) {
+		/* the ring is filled by the reader thread once memory is locked */
+		if (ring_frames == 0 || rt_ring_init(&ring, ring_frames)) {
+			printf("can't create the ring buffer\n");
+			exit(-2);
+		}
+	} else if (rt_track_load(&track, stream_path)) {
+		/* text or binary stream, from the file or stdin */
+		printf("can't load the stream\n");
+		exit(-2);
+	} else if (track.params.period_ns < MIN_PERIOD_NS) {
+		printf("stream period %lu ns is too short\n", track.params.period_ns);
+		exit(-2);
 	}
 
 #ifndef FAKE_TARGET
-	init_channel(0);
-	init_channel(1);
-	init_channel(2);
+	duty_fd[0] = init_channel(0);
+	duty_fd[1] = init_channel(1);
+	duty_fd[2] = init_channel(2);
 #endif
 
 	/* Lock memory */
@@ -225,6 +404,22 @@ int main(int argc, char* argv[])
 		exit(-2);
 	}
 
+	/* SIGUSR1 is handled by the main thread only, see below */
+	sigemptyset(&sigset);
+	sigaddset(&sigset, SIGUSR1);
+	pthread_sigmask(SIG_BLOCK, &sigset, NULL);
+	atomic_init(&player_done, 0);
+	atomic_init(&params_state, PARAMS_PENDING);
+
+	/* The reader thread keeps default scheduling */
+	if (streaming) {
+		ret = pthread_create(&reader, NULL, reader_func, NULL);
+		if (ret) {
+			printf("create reader pthread failed\n");
+			exit(-2);
+		}
+	}
+
 	/* Create a pthread with specified attributes */
 	ret = pthread_create(&thread, &attr, thread_func, NULL);
 	if (ret) {
@@ -232,19 +427,42 @@ int main(int argc, char* argv[])
 		exit(-2);
 	}
 
+	/* Dump the statistics on SIGUSR1 until the thread is done, the
+	 * snapshot can be off by the period being played */
+	while (!atomic_load(&player_done)) {
+		if (sigtimedwait(&sigset, NULL, &poll_period) == SIGUSR1)
+			rt_stats_dump(&stats, stats_path, stats_csv);
+	}
+
 	/* Join the thread and wait until it is done */
 	ret = pthread_join(thread, NULL);
-	if (ret)
+	if (ret) {
 		printf("join pthread failed: %m\n");
 		exit(-2);
+	}
+
+#ifndef FAKE_TARGET
+	close(duty_fd[0]);
+	close(duty_fd[1]);
+	close(duty_fd[2]);
+#endif
 
-	pos_list_current = pos_list_head;
-	while(pos_list_current) {
-		linkedList_t *to_free;
-		to_free = pos_list_current;
-		pos_list_current = pos_list_current->next;
-		if (to_free != NULL)
-			free(to_free);
+	stats.underruns = underruns.count;
+	if (stats_path)
+		rt_stats_dump(&stats, stats_path, stats_csv);
+
+	if (streaming) {
+		pthread_join(reader, NULL);
+		if (underruns.count)
+			printf("underrun: %lu periods missed, longest %lu, first at period %lu\n",
+			       underruns.count, underruns.longest, underruns.first_tick);
+		else
+			printf("underrun: none\n");
+		rt_ring_free(&ring);
+		if (reader_status || player_status)
+			ret = -2;
+	} else {
+		rt_track_free(&track);
 	}
 
 	return ret;
@@ -0,0 +1,31 @@
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include "ringbuf.h"
+
+int rt_ring_init(rt_ring_t *ring, size_t capacity)
+{
+	size_t size = 1;
+
+	while (size < capacity)
+		size <<= 1;
+	ring->frames = malloc(size * sizeof(rt_frame_t));
+	if (ring->frames == NULL) {
+		printf("can't allocate a ring of %zu frames\n", size);
+		return -1;
+	}
+	/* touch every page now, they are locked by mlockall() afterwards */
+	memset(ring->frames, 0, size * sizeof(rt_frame_t));
+	ring->mask = size - 1;
+	atomic_init(&ring->head, 0);
+	atomic_init(&ring->tail, 0);
+	atomic_init(&ring->eof, 0);
+	return 0;
+}
+
+void rt_ring_free(rt_ring_t *ring)
+{
+	free(ring->frames);
+	ring->frames = NULL;
+}
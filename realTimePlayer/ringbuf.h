@@ -0,0 +1,75 @@
+#ifndef RINGBUF_H
+#define RINGBUF_H
+
+#include <stdatomic.h>
+#include <stddef.h>
+
+#include "rtstream.h"
+
+/*
+ * Lock-free single-producer/single-consumer ring of frames.
+ * The reader thread is the only one calling rt_ring_push(), the real time
+ * thread is the only one calling rt_ring_pop(). head and tail are free
+ * running counters, the capacity is a power of two.
+ */
+typedef struct rt_ring {
+	rt_frame_t *frames;
+	size_t mask;
+	_Atomic size_t head;
+	_Atomic size_t tail;
+	atomic_int eof;
+} rt_ring_t;
+
+/* Preallocate and prefault the ring. Returns 0 on success. */
+int rt_ring_init(rt_ring_t *ring, size_t capacity);
+void rt_ring_free(rt_ring_t *ring);
+
+static inline size_t rt_ring_capacity(const rt_ring_t *ring)
+{
+	return ring->mask + 1;
+}
+
+static inline size_t rt_ring_count(rt_ring_t *ring)
+{
+	return atomic_load_explicit(&ring->head, memory_order_acquire) -
+	       atomic_load_explicit(&ring->tail, memory_order_acquire);
+}
+
+/* Returns 0 when the ring is full. */
+static inline int rt_ring_push(rt_ring_t *ring, const rt_frame_t *frame)
+{
+	size_t head = atomic_load_explicit(&ring->head, memory_order_relaxed);
+	size_t tail = atomic_load_explicit(&ring->tail, memory_order_acquire);
+
+	if (head - tail > ring->mask)
+		return 0;
+	ring->frames[head & ring->mask] = *frame;
+	atomic_store_explicit(&ring->head, head + 1, memory_order_release);
+	return 1;
+}
+
+/* Returns 0 when the ring is empty. */
+static inline int rt_ring_pop(rt_ring_t *ring, rt_frame_t *frame)
+{
+	size_t tail = atomic_load_explicit(&ring->tail, memory_order_relaxed);
+	size_t head = atomic_load_explicit(&ring->head, memory_order_acquire);
+
+	if (head == tail)
+		return 0;
+	*frame = ring->frames[tail & ring->mask];
+	atomic_store_explicit(&ring->tail, tail + 1, memory_order_release);
+	return 1;
+}
+
+/* Producer side, no more frames will be pushed. */
+static inline void rt_ring_set_eof(rt_ring_t *ring)
+{
+	atomic_store_explicit(&ring->eof, 1, memory_order_release);
+}
+
+static inline int rt_ring_eof(rt_ring_t *ring)
+{
+	return atomic_load_explicit(&ring->eof, memory_order_acquire);
+}
+
+#endif
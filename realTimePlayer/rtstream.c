@@ -0,0 +1,439 @@
+#define _GNU_SOURCE
+#include <errno.h>
+#include <fcntl.h>
+#include <math.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+
+#include "rtstream.h"
+
+#define READ_CHUNK_SIZE (64*1024)
+#define FRAME_SIZE (RT_CHANNELS*4)
+
+typedef struct rt_reader {
+	rt_stream_params_t *params;
+	rt_frame_cb cb;
+	void *ctx;
+} rt_reader_t;
+
+static const rt_calibration_t *calibration = NULL;
+
+void rt_stream_set_calibration(const rt_calibration_t *cal)
+{
+	calibration = cal;
+}
+
+int rt_calibration_load(rt_calibration_t *cal, const char *path)
+{
+	FILE *f;
+	char *line = NULL;
+	size_t size = 0;
+	char *comment;
+	char extra;
+	int channel;
+	double ang;
+	double duty;
+	size_t n;
+	int number = 0;
+	int fields;
+	int ret = 0;
+
+	memset(cal, 0, sizeof(*cal));
+	f = fopen(path, "r");
+	if (f == NULL) {
+		printf("can't open calibration %s: %m\n", path);
+		return -1;
+	}
+	while (ret == 0 && getline(&line, &size, f) != -1) {
+		number++;
+		comment = strchr(line, '#');
+		if (comment)
+			*comment = '\0';
+		fields = sscanf(line, "%d %lf %lf %c", &channel, &ang, &duty, &extra);
+		if (fields == EOF)
+			continue;
+		if (fields != 3 || channel < 0 || channel >= RT_CHANNELS ||
+		    !isfinite(ang) || !isfinite(duty)) {
+			printf("calibration line %d: should be channel, angle and pulse width\n",
+			       number);
+			ret = -1;
+			break;
+		}
+		n = cal->count[channel];
+		if (n == RT_CAL_MAX_POINTS || (n && ang <= cal->ang[channel][n - 1]) ||
+		    (n && duty == cal->duty[channel][n - 1]) ||
+		    (n > 1 && (duty - cal->duty[channel][n - 1]) *
+		     (cal->duty[channel][1] - cal->duty[channel][0]) < 0)) {
+			printf("calibration line %d: too many points or points are not monotonic\n",
+			       number);
+			ret = -1;
+			break;
+		}
+		cal->ang[channel][n] = ang;
+		cal->duty[channel][n] = duty;
+		cal->count[channel]++;
+	}
+	for (channel = 0; ret == 0 && channel < RT_CHANNELS; channel++) {
+		if (cal->count[channel] < 2) {
+			printf("calibration of channel %d should have at least 2 points\n",
+			       channel);
+			ret = -1;
+		}
+	}
+	free(line);
+	fclose(f);
+	return ret;
+}
+
+/* interpolate table, the same way as numpy.interp() of the planner */
+static double interp(double x, const double *xp, const double *fp, size_t count)
+{
+	size_t j;
+
+	if (x <= xp[0])
+		return fp[0];
+	if (x >= xp[count - 1])
+		return fp[count - 1];
+	for (j = 1; x >= xp[j]; j++)
+		;
+	j--;
+	return (fp[j + 1] - fp[j]) / (xp[j + 1] - xp[j]) * (x - xp[j]) + fp[j];
+}
+
+unsigned int rt_ang_to_duty(const rt_stream_params_t *params, int channel,
+			    float angle)
+{
+	double duty;
+
+	if (calibration)
+		return (unsigned int)interp(angle, calibration->ang[channel],
+					    calibration->duty[channel],
+					    calibration->count[channel]);
+	duty = params->model_m*angle + params->model_h;
+	if (duty < params->pulse_min)
+		return params->pulse_min;
+	if (duty > params->pulse_max)
+		return params->pulse_max;
+	return (unsigned int)duty;
+}
+
+float rt_duty_to_ang(const rt_stream_params_t *params, int channel,
+		     unsigned int duty)
+{
+	const double *ang;
+	const double *pulse;
+	double sign;
+	double x;
+	size_t count;
+	size_t j;
+
+	if (!calibration)
+		return (float)((duty - params->model_h) / params->model_m);
+	count = calibration->count[channel];
+	ang = calibration->ang[channel];
+	pulse = calibration->duty[channel];
+	/* pulse widths are monotonic, but can decrease */
+	sign = pulse[count - 1] > pulse[0] ? 1.0 : -1.0;
+	x = sign*duty;
+	if (x <= sign*pulse[0])
+		return (float)ang[0];
+	if (x >= sign*pulse[count - 1])
+		return (float)ang[count - 1];
+	for (j = 1; x >= sign*pulse[j]; j++)
+		;
+	j--;
+	return (float)((ang[j + 1] - ang[j]) / (pulse[j + 1] - pulse[j]) *
+		       (duty - pulse[j]) + ang[j]);
+}
+
+void rt_frame_format(rt_frame_t *frame)
+{
+	int i;
+
+	for (i = 0; i < RT_CHANNELS; i++)
+		frame->duty_len[i] = snprintf(frame->duty_txt[i], RT_DUTY_TXT_SIZE,
+					      "%u\n", frame->duty[i]);
+}
+
+static int emit_angles(rt_reader_t *reader, const float ang[RT_CHANNELS])
+{
+	rt_frame_t frame;
+	int i;
+
+	for (i = 0; i < RT_CHANNELS; i++) {
+		frame.ang[i] = ang[i];
+		frame.duty[i] = rt_ang_to_duty(reader->params, i, ang[i]);
+	}
+	rt_frame_format(&frame);
+	return reader->cb(reader->ctx, &frame);
+}
+
+static int apply_header(rt_stream_params_t *params, const rt_stream_header_t *hdr)
+{
+	if (hdr->version != RT_STREAM_VERSION || hdr->channels != RT_CHANNELS ||
+	    hdr->header_size < sizeof(rt_stream_header_t) ||
+	    hdr->pulse_min > hdr->pulse_max ||
+	    (hdr->encoding != RT_ENC_ANGLE && hdr->encoding != RT_ENC_DUTY)) {
+		printf("unsupported stream header\n");
+		return -1;
+	}
+	params->period_ns = hdr->dt_ns;
+	params->model_m = hdr->model_slope;
+	params->model_h = hdr->model_intercept;
+	params->pulse_min = hdr->pulse_min;
+	params->pulse_max = hdr->pulse_max;
+	if ((hdr->flags & RT_FLAG_CALIBRATED) && hdr->encoding == RT_ENC_ANGLE &&
+	    !calibration)
+		printf("stream was planned for calibrated servos, but no calibration is loaded (-k)\n");
+	return 0;
+}
+
+/* decode whole frames, data does not need to be aligned */
+static int decode_frames(rt_reader_t *reader, int encoding,
+			 const unsigned char *data, size_t count)
+{
+	size_t n;
+	int i;
+	int ret = 0;
+
+	for (n = 0; ret == 0 && n < count; n++, data += FRAME_SIZE) {
+		if (encoding == RT_ENC_ANGLE) {
+			float ang[RT_CHANNELS];
+			memcpy(ang, data, sizeof(ang));
+			ret = emit_angles(reader, ang);
+		} else {
+			rt_frame_t frame;
+			memcpy(frame.duty, data, sizeof(frame.duty));
+			for (i = 0; i < RT_CHANNELS; i++)
+				frame.ang[i] = rt_duty_to_ang(reader->params, i,
+							      frame.duty[i]);
+			rt_frame_format(&frame);
+			ret = reader->cb(reader->ctx, &frame);
+		}
+	}
+	return ret;
+}
+
+static int parse_text_line(rt_reader_t *reader, const char *line)
+{
+	float ang[RT_CHANNELS];
+
+	if (sscanf(line, "rt-cmd:POS %f %f %f", &ang[0], &ang[1], &ang[2]) != 3)
+		return 0;
+	return emit_angles(reader, ang);
+}
+
+static int load_text(rt_reader_t *reader, int fd, const char *prefix, size_t prefix_len)
+{
+	FILE *f;
+	char *cmd_str = NULL;
+	size_t cmd_size = 0;
+	const char *nl;
+	ssize_t len;
+	int ret = 0;
+
+	f = fdopen(fd, "r");
+	if (f == NULL) {
+		printf("can't open stream: %m\n");
+		return -1;
+	}
+	/* the first bytes were already consumed to detect the format, lines
+	 * which end in them are shorter than a command, e.g. blank lines */
+	while ((nl = memchr(prefix, '\n', prefix_len)) != NULL) {
+		prefix_len -= nl + 1 - prefix;
+		prefix = nl + 1;
+	}
+	if (prefix_len) {
+		char *first;
+
+		len = getline(&cmd_str, &cmd_size, f);
+		first = malloc(prefix_len + (len > 0 ? len : 0) + 1);
+		if (first == NULL) {
+			fclose(f);
+			free(cmd_str);
+			return -1;
+		}
+		memcpy(first, prefix, prefix_len);
+		if (len > 0)
+			memcpy(first + prefix_len, cmd_str, len);
+		first[prefix_len + (len > 0 ? len : 0)] = '\0';
+		ret = parse_text_line(reader, first);
+		free(first);
+	}
+	while (ret == 0 && getline(&cmd_str, &cmd_size, f) != -1)
+		ret = parse_text_line(reader, cmd_str);
+
+	free(cmd_str);
+	fclose(f);
+	return ret;
+}
+
+static int load_binary_map(rt_reader_t *reader, int fd, size_t size)
+{
+	const unsigned char *map;
+	rt_stream_header_t hdr;
+	int ret;
+
+	if (size < sizeof(hdr)) {
+		printf("stream header is truncated\n");
+		return -1;
+	}
+	map = mmap(NULL, size, PROT_READ, MAP_PRIVATE, fd, 0);
+	if (map == MAP_FAILED) {
+		printf("can't map stream: %m\n");
+		return -1;
+	}
+	madvise((void *)map, size, MADV_SEQUENTIAL);
+	memcpy(&hdr, map, sizeof(hdr));
+	ret = apply_header(reader->params, &hdr);
+	if (ret == 0 && hdr.header_size > size)
+		ret = -1;
+	if (ret == 0)
+		ret = decode_frames(reader, hdr.encoding, map + hdr.header_size,
+				    (size - hdr.header_size) / FRAME_SIZE);
+	if (ret == 0 && (size - hdr.header_size) % FRAME_SIZE)
+		printf("stream ends with a partial frame, ignored\n");
+	munmap((void *)map, size);
+	return ret;
+}
+
+static int read_full(int fd, void *buf, size_t size)
+{
+	size_t done = 0;
+	ssize_t n;
+
+	while (done < size) {
+		n = read(fd, (char *)buf + done, size - done);
+		if (n < 0 && errno == EINTR)
+			continue;
+		if (n <= 0)
+			break;
+		done += n;
+	}
+	return done;
+}
+
+static int load_binary_pipe(rt_reader_t *reader, int fd, const char *prefix, size_t prefix_len)
+{
+	rt_stream_header_t hdr;
+	unsigned char *buf;
+	size_t used = 0;
+	size_t skip;
+	ssize_t n;
+	int ret;
+
+	memcpy(&hdr, prefix, prefix_len);
+	if (read_full(fd, (char *)&hdr + prefix_len, sizeof(hdr) - prefix_len)
+	    != (int)(sizeof(hdr) - prefix_len)) {
+		printf("stream header is truncated\n");
+		return -1;
+	}
+	ret = apply_header(reader->params, &hdr);
+	if (ret)
+		return ret;
+
+	buf = malloc(READ_CHUNK_SIZE);
+	if (buf == NULL)
+		return -1;
+	/* skip header extension of newer minor versions */
+	skip = hdr.header_size - sizeof(hdr);
+	while (skip) {
+		n = read_full(fd, buf, skip < READ_CHUNK_SIZE ? skip : READ_CHUNK_SIZE);
+		if (n <= 0)
+			break;
+		skip -= n;
+	}
+	for (;;) {
+		n = read(fd, buf + used, READ_CHUNK_SIZE - used);
+		if (n < 0 && errno == EINTR)
+			continue;
+		if (n <= 0)
+			break;
+		used += n;
+		ret = decode_frames(reader, hdr.encoding, buf, used / FRAME_SIZE);
+		if (ret)
+			break;
+		/* keep a partial frame for the next read */
+		memmove(buf, buf + used - used % FRAME_SIZE, used % FRAME_SIZE);
+		used %= FRAME_SIZE;
+	}
+	if (ret == 0 && used)
+		printf("stream ends with a partial frame, ignored\n");
+	free(buf);
+	return ret;
+}
+
+int rt_stream_read(const char *path, rt_stream_params_t *params,
+		   rt_frame_cb cb, void *ctx)
+{
+	rt_reader_t reader = { params, cb, ctx };
+	char magic[4];
+	struct stat st;
+	int fd = STDIN_FILENO;
+	int len;
+	int ret;
+
+	params->period_ns = DEFAULT_PERIOD_NS;
+	params->model_m = DEFAULT_MODEL_M;
+	params->model_h = DEFAULT_MODEL_H;
+	params->pulse_min = DEFAULT_PULSE_MIN;
+	params->pulse_max = DEFAULT_PULSE_MAX;
+
+	if (path != NULL && strcmp(path, "-") != 0) {
+		fd = open(path, O_RDONLY);
+		if (fd < 0) {
+			printf("can't open %s\n", path);
+			return -1;
+		}
+	}
+
+	len = read_full(fd, magic, sizeof(magic));
+	if (len == sizeof(magic) && memcmp(magic, RT_STREAM_MAGIC, sizeof(magic)) == 0) {
+		if (fstat(fd, &st) == 0 && S_ISREG(st.st_mode))
+			ret = load_binary_map(&reader, fd, st.st_size);
+		else
+			ret = load_binary_pipe(&reader, fd, magic, len);
+		if (fd != STDIN_FILENO)
+			close(fd);
+	} else {
+		/* load_text() closes the descriptor */
+		ret = load_text(&reader, fd, magic, len > 0 ? len : 0);
+	}
+	return ret;
+}
+
+static int track_append(void *ctx, const rt_frame_t *frame)
+{
+	rt_track_t *track = ctx;
+	rt_frame_t *frames;
+	size_t capacity;
+
+	if (track->count == track->capacity) {
+		capacity = track->capacity ? track->capacity * 2 : 4096;
+		frames = realloc(track->frames, capacity * sizeof(rt_frame_t));
+		if (frames == NULL) {
+			printf("can't allocate %zu frames\n", capacity);
+			return -1;
+		}
+		track->frames = frames;
+		track->capacity = capacity;
+	}
+	track->frames[track->count++] = *frame;
+	return 0;
+}
+
+int rt_track_load(rt_track_t *track, const char *path)
+{
+	memset(track, 0, sizeof(*track));
+	return rt_stream_read(path, &track->params, track_append, track);
+}
+
+void rt_track_free(rt_track_t *track)
+{
+	free(track->frames);
+	memset(track, 0, sizeof(*track));
+}
@@ -0,0 +1,118 @@
+#ifndef RTSTREAM_H
+#define RTSTREAM_H
+
+#include <stdint.h>
+#include <stddef.h>
+
+/*
+ * Angle stream read from the python planner, see src/cnc/rtstream.py for
+ * the layout. Two flavours are accepted:
+ *  - text: "rt-cmd:POS a0 a1 a2" lines, everything else is ignored
+ *  - binary: fixed header followed by float32 angles or uint32 duty cycles
+ * Multi-byte fields are little endian, same as the Raspberry Pi.
+ */
+
+#define RT_STREAM_MAGIC "RPDS"
+#define RT_STREAM_VERSION 1
+#define RT_CHANNELS 3
+
+#define RT_ENC_ANGLE 0
+#define RT_ENC_DUTY  1
+
+/* servos have calibration tables instead of the duty model */
+#define RT_FLAG_CALIBRATED 1
+
+#define DEFAULT_PERIOD_NS 20000000UL
+#define DEFAULT_MODEL_M 531034.0
+#define DEFAULT_MODEL_H 1550000.0
+#define DEFAULT_PULSE_MIN 600000UL
+#define DEFAULT_PULSE_MAX 2500000UL
+
+typedef struct __attribute__((packed)) rt_stream_header {
+	char magic[4];
+	uint16_t version;
+	uint16_t header_size;
+	uint16_t encoding;
+	uint16_t channels;
+	uint32_t dt_ns;
+	float motor_offset[RT_CHANNELS];
+	float model_slope;
+	float model_intercept;
+	uint32_t pulse_min;
+	uint32_t pulse_max;
+	uint32_t flags;
+} rt_stream_header_t;
+
+/* "%u\n" of a 32 bits duty cycle */
+#define RT_DUTY_TXT_SIZE 12
+
+typedef struct rt_frame {
+	float ang[RT_CHANNELS];
+	unsigned int duty[RT_CHANNELS];
+	/* duty cycles preformatted for the sysfs writes */
+	char duty_txt[RT_CHANNELS][RT_DUTY_TXT_SIZE];
+	unsigned char duty_len[RT_CHANNELS];
+} rt_frame_t;
+
+/* timing and duty model, from the binary header or the defaults */
+typedef struct rt_stream_params {
+	unsigned long period_ns;
+	double model_m;
+	double model_h;
+	/* duty cycles of the model are clamped to them */
+	unsigned long pulse_min;
+	unsigned long pulse_max;
+} rt_stream_params_t;
+
+/* called for every decoded frame, a non zero return aborts the reading */
+typedef int (*rt_frame_cb)(void *ctx, const rt_frame_t *frame);
+
+typedef struct rt_track {
+	rt_frame_t *frames;
+	size_t count;
+	size_t capacity;
+	rt_stream_params_t params;
+} rt_track_t;
+
+/* Read a stream frame by frame, path NULL or "-" reads stdin. Files are
+ * mmapped, pipes are read in large chunks. params is filled before the
+ * first frame is passed to cb. Returns 0 on success. */
+int rt_stream_read(const char *path, rt_stream_params_t *params,
+		   rt_frame_cb cb, void *ctx);
+
+/* Load a whole stream in memory. Returns 0 on success. */
+int rt_track_load(rt_track_t *track, const char *path);
+void rt_track_free(rt_track_t *track);
+
+/* fill duty_txt and duty_len from duty */
+void rt_frame_format(rt_frame_t *frame);
+
+/*
+ * Per channel piecewise linear calibration of servos, the same file as
+ * SERVO_CALIBRATION_PATH of the planner, see src/servo/calibration.py.
+ * Both accept the same tables: all RT_CHANNELS channels, 2 to
+ * RT_CAL_MAX_POINTS points each, strictly increasing angles in the order of
+ * lines and strictly monotonic pulse widths. Angles out of the table are
+ * clamped to its ends.
+ */
+#define RT_CAL_MAX_POINTS 64
+
+typedef struct rt_calibration {
+	size_t count[RT_CHANNELS];
+	double ang[RT_CHANNELS][RT_CAL_MAX_POINTS];
+	double duty[RT_CHANNELS][RT_CAL_MAX_POINTS];
+} rt_calibration_t;
+
+/* Load calibration file. Returns 0 on success. */
+int rt_calibration_load(rt_calibration_t *cal, const char *path);
+
+/* Use calibration for the streams read after the call, NULL for the duty
+ * model. */
+void rt_stream_set_calibration(const rt_calibration_t *cal);
+
+unsigned int rt_ang_to_duty(const rt_stream_params_t *params, int channel,
+			    float angle);
+float rt_duty_to_ang(const rt_stream_params_t *params, int channel,
+		     unsigned int duty);
+
+#endif
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+""" Compile G-code program to the binary stream for realTimePlayer ahead of
+    time. The program runs through a pipeline:
+        parse, plan, sample             main process, line by line
+        inverse kinematics, encode      process pool, in chunks of samples
+        write                           main process, in order of chunks
+    Stream is byte-identical to the stream which HalFileExporter writes when
+    the same program runs with RT_STREAM_FORMAT 'angle' or 'duty'.
+"""
+
+from __future__ import division
+import argparse
+import bisect
+import multiprocessing
+import sys
+from collections import deque
+
+import cnc.logging_config as logging_config
+from cnc.gcode import GCode, GCodeException
+from cnc.gmachine import GMachine, GMachineException
+from cnc.hal import *
+
+# minimum number of samples sent to a worker at once
+CHUNK_SAMPLES = 16384
+
+# state of the worker process: robot, motor offsets and stream encoding
+_worker = None
+
+
+class CompilerException(Exception):
+    """ Exceptions while compiling program.
+    """
+    pass
+
+
+def _init_worker(robot, motor_offset, encoding):
+    global _worker
+    _worker = (robot, motor_offset, encoding)
+
+
+def _solve_chunk(samples, starts):
+    """ Inverse kinematics and encoding of chunk of samples.
+    :param samples: (N, 3) array of X, Y and Z positions in mm.
+    :param starts: indexes of the first samples of movements in chunk.
+    :return: Tuple of encoded frames and index of the first unreachable
+             sample, -1 if there is no such sample. Frames of the movements
+             before the one with unreachable sample are returned then, like
+             hal writes them before it fails.
+    """
+    robot, motor_offset, encoding = _worker
+    tip_pos = samples / 1000
+    tip_pos[:, 2] += DELTA_Z_OFFSET
+    if IK_TOLERANCE_MM is None:
+        angles, valid = robot.solve_tip_positions(tip_pos)
+    else:
+        # each movement separately, like hal does
+        ends = list(starts[1:]) + [len(tip_pos)]
+        solutions = [robot.solve_tip_path(tip_pos[start:end],
+                                          IK_TOLERANCE_MM / 1000)
+                     for start, end in zip(starts, ends)]
+        angles = np.concatenate([a for a, _ in solutions])
+        valid = np.concatenate([v for _, v in solutions])
+    invalid = np.flatnonzero(~valid)
+    if len(invalid):
+        invalid = int(invalid[0])
+        end = starts[bisect.bisect_right(starts, invalid) - 1]
+        return encode_frames(motor_offset - angles[:end], encoding), invalid
+    return encode_frames(motor_offset - angles, encoding), -1
+
+
+class _CompilerHal(HalFileExporter):
+    """ Hal which passes samples of movements to the compiler instead of
+        running them.
+    """
+    def __init__(self, sink):
+        HalFileExporter.__init__(self, open_stream=False)
+        self._sink = sink
+
+    def move(self, generator):
+        self._sink(generator.sample_all(),
+                   getattr(generator, 'source_line', None))
+
+
+class Compiler(object):
+    """ Compiles program and writes the stream to file object.
+    """
+
+    def __init__(self, fh, encoding=ENCODING_ANGLE, jobs=None,
+                 chunk_samples=CHUNK_SAMPLES):
+        """ Create compiler.
+        :param fh: binary file object for the stream.
+        :param encoding: ENCODING_ANGLE or ENCODING_DUTY.
+        :param jobs: number of worker processes, all CPUs if None, 1 solves
+                     in the main process.
+        :param chunk_samples: minimum number of samples in chunk.
+        """
+        self._fh = fh
+        self._encoding = encoding
+        self._jobs = jobs or multiprocessing.cpu_count()
+        self._chunk_samples = chunk_samples
+        self._hal = _CompilerHal(self._collect)
+        self._pool = None
+        self._line_number = 0
+        # samples of the chunk being collected and source lines of them
+        self._buffer = []
+        self._buffered = 0
+        self._origins = []
+        self._pending = deque()
+        self.frames = 0
+
+    def _collect(self, samples, source_line):
+        self._origins.append((self._buffered, source_line))
+        self._buffer.append(samples[:, 0:3])
+        self._buffered += len(samples)
+        if self._buffered >= self._chunk_samples:
+            self._submit()
+
+    def _submit(self):
+        if not self._buffer:
+            return
+        chunk = np.concatenate(self._buffer)
+        starts = [offset for offset, _ in self._origins]
+        if self._pool is None:
+            result = _solve_chunk(chunk, starts)
+        else:
+            result = self._pool.apply_async(_solve_chunk, (chunk, starts))
+        self._pending.append((result, self._origins))
+        self._buffer = []
+        self._buffered = 0
+        self._origins = []
+        # keep workers busy, but don't let results pile up in memory
+        while len(self._pending) > 2 * self._jobs:
+            self._write_next()
+
+    def _write_next(self):
+        result, origins = self._pending.popleft()
+        if self._pool is not None:
+            result = result.get()
+        frames, invalid = result
+        self._fh.write(frames)
+        self.frames += len(frames) // FRAME_SIZE
+        if invalid >= 0:
+            offsets = [offset for offset, _ in origins]
+            _, line_number = origins[bisect.bisect_right(offsets, invalid) - 1]
+            raise CompilerException("line {}: Impossible delta geometry"
+                                    .format(line_number))
+
+    def compile(self, lines):
+        """ Compile program. Like cnc/main.py does, compilation stops at the
+            first bad line, but everything before it is written. 'exit' or
+            'quit' line ends the program.
+        :param lines: iterable of gcode lines.
+        :return: number of written frames.
+        """
+        robot = self._hal.robot
+        motor_offset = self._hal.motor_offset
+        if self._jobs > 1:
+            self._pool = multiprocessing.Pool(
+                self._jobs, _init_worker,
+                (robot, motor_offset, self._encoding))
+        else:
+            _init_worker(robot, motor_offset, self._encoding)
+        machine = GMachine(self._hal)
+        error = None
+        try:
+            self._fh.write(encode_header(self._encoding))
+            for self._line_number, line in enumerate(lines, 1):
+                line = line.strip()
+                if line == 'quit' or line == 'exit':
+                    break
+                machine.source_line = self._line_number
+                try:
+                    machine.do_command(GCode.parse_line(line))
+                except (GCodeException, GMachineException) as e:
+                    error = "line {}: {}".format(self._line_number, e)
+                    break
+            machine.release()
+            self._submit()
+            while self._pending:
+                self._write_next()
+        finally:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool = None
+        if error is not None:
+            raise CompilerException(error)
+        return self.frames
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compile G-code program to realTimePlayer stream.")
+    parser.add_argument('program', help="G-code file")
+    parser.add_argument('stream', help="output stream file")
+    parser.add_argument('-e', '--encoding', choices=sorted(RT_STREAM_ENCODINGS),
+                        default='angle', help="stream encoding")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="number of worker processes, all CPUs by default")
+    args = parser.parse_args()
+    logging_config.debug_disable()
+    try:
+        with open(args.program, 'r') as program, \
+                open(args.stream, 'wb') as fh:
+            compiler = Compiler(fh, RT_STREAM_ENCODINGS[args.encoding],
+                                args.jobs)
+            frames = compiler.compile(program)
+    except CompilerException as e:
+        print('ERROR ' + str(e))
+        sys.exit(1)
+    print("{} frames written to {}".format(frames, args.stream))
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,17 @@ MOTOR0_OFFSET_RAD = -0.16
 MOTOR1_OFFSET_RAD = -0.16
 MOTOR2_OFFSET_RAD = -0.16
 
+# Linear model of the servo pulse width, duty = slope * angle + intercept.
+SERVO_MODEL_SLOPE_NS_PER_RAD = 531034.0
+SERVO_MODEL_INTERCEPT_NS = 1550000.0
+SERVO_PULSE_MIN_NS = 600000
+SERVO_PULSE_MAX_NS = 2500000
+# Per channel calibration tables of servos which replace the linear model and
+# the pulse limits above, see src/servo/calibration.py for the file format.
+# realTimePlayer has to load the same file (-k) to play 'text' and 'angle'
+# streams, 'duty' streams carry calibrated duty cycles. None disables it.
+SERVO_CALIBRATION_PATH = None
+
 # Maximum velocity for each axis in millimeter per minute.
 MAX_VELOCITY_MM_PER_MIN_X = 24000
 MAX_VELOCITY_MM_PER_MIN_Y = 12000
@@ -21,7 +32,12 @@ MIN_VELOCITY_MM_PER_MIN = 1
 
 # Mixed settings.
 TIP_MAX_ACCELERATION_MM_PER_S2 = 3000  # for all axis, mm per sec^2
+TIP_MAX_JERK_MM_PER_S3 = 60000  # for 'scurve' velocity profile, mm per sec^3
 SPINDLE_MAX_RPM = 10000
+# Maximum angular velocity of motors, rad per sec. When set, velocity of each
+# movement is lowered so no motor turns faster anywhere on the path, movements
+# where motors are slow enough keep the programmed velocity. None disables it.
+MOTOR_MAX_SPEED_RAD_PER_S = None
 
 # -----------------------------------------------------------------------------
 # Pins configuration.
@@ -36,11 +52,85 @@ FAN_PIN = 27
 # buffer will be prepared firstly and then command will run.
 # Before enabling this feature, please make sure that board performance is
 # enough for streaming pulses(faster then real time).
+# The stream is flushed after each move, realTimePlayer has to be started in
+# streaming mode (-s) to play it while the next moves are planned.
 INSTANT_RUN = False
 
+# Number of movements queued for writing. With non zero value movements are
+# written by a separate thread while the next lines are parsed and planned,
+# see AsyncHalFileExporter. Zero writes each movement before the next line.
+# HalServoDirect always queues at least one movement.
+HAL_QUEUE_SIZE = 0
+
 # If this parameter is False, error will be raised on command with velocity
 # more than maximum velocity specified here. If this parameter is True,
 # velocity would be decreased(proportional for all axises) to fit the maximum
 # velocity.
 AUTO_VELOCITY_ADJUSTMENT = True
 
+# Velocity profile of movements: 'trapezoidal' switches acceleration
+# instantly, 'scurve' changes acceleration with TIP_MAX_JERK_MM_PER_S3 which
+# excites the arms much less and allows higher TIP_MAX_ACCELERATION_MM_PER_S2.
+VELOCITY_PROFILE = 'trapezoidal'
+
+# Number of linear movements to look ahead. Consecutive movements are joined
+# without stopping at each vertex, velocity at the junction depends on the
+# angle between movements. Set to 0 to start and stop each movement at zero
+# velocity. Queued movements run when there is no more input for a while,
+# i.e. after each typed line of the interactive shell or when the server has
+# no queued lines.
+LOOKAHEAD_SEGMENTS = 16
+# Maximum deviation of the tip from the corner of two movements, larger
+# values allow faster junctions.
+JUNCTION_DEVIATION_MM = 0.05
+
+# Maximum difference of the distances from the arc center to the start and
+# to the end of G2/G3 arc.
+ARC_RADIUS_TOLERANCE_MM = 0.01
+
+# Reachable workspace is precomputed on a grid with this cell size to check
+# positions and movements quickly. The grid is cached in WORKSPACE_CACHE_DIR
+# (None disables the cache) and rebuilt when the geometry changes.
+WORKSPACE_GRID_MM = 1.0
+WORKSPACE_CACHE_DIR = '~/.cache/pycnc'
+
+# Programs run from file with a binary RT_STREAM_FORMAT are compiled once and
+# cached in TRAJECTORY_CACHE_DIR (None disables the cache), the next run of
+# the same program with the same config streams the cached file without
+# planning. Least recently used programs are removed to keep the cache under
+# TRAJECTORY_CACHE_MAX_MB.
+TRAJECTORY_CACHE_DIR = '~/.cache/pycnc/trajectories'
+TRAJECTORY_CACHE_MAX_MB = 512
+
+# Format of the stream sent to realTimePlayer: 'text' for 'rt-cmd:POS' lines,
+# 'angle' for binary float32 angles or 'duty' for binary precomputed duty
+# cycles, see cnc/rtstream.py. Stream is written to RT_STREAM_PATH (file or
+# fifo), binary formats require it, text is printed to stdout if it is None.
+RT_STREAM_FORMAT = 'text'
+RT_STREAM_PATH = None
+
+# G-code server, see cnc/server.py. Each connection can send up to
+# SERVER_QUEUE_SIZE lines ahead of the line being run.
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8888
+SERVER_QUEUE_SIZE = 16
+
+# Drive servos from this process through the kernel PWM sysfs interface
+# instead of writing the stream for realTimePlayer, see HalServoDirect.
+SERVO_DIRECT = False
+SERVO_SYSFS_ROOT = '/sys/class/pwm/pwmchip0'
+SERVO_CHANNELS = (0, 1, 2)
+# SCHED_FIFO priority of the thread which plays samples to servos, None keeps
+# the default scheduling policy.
+SERVO_SCHED_PRIORITY = None
+
+# Inverse kinematics is solved for each sample if None. Otherwise it is solved
+# for a part of samples and angles of the others are interpolated, so the tip
+# position of each sample deviates from the path by no more than
+# IK_TOLERANCE_MM, see DeltaMechanics.solve_tip_path().
+IK_TOLERANCE_MM = None
+
+# Tip position of each sample is written to TIP_LOG_PATH as 'tip: X Y Z'
+# lines for diagnostics, None disables it.
+TIP_LOG_PATH = None
+
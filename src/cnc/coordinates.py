@@ -1,28 +1,54 @@
 from __future__ import division
 import math
 
+import numpy as np
+
+# number of digits after the point which are significant for comparison
+ROUND_DIGITS = 10
+
 
 class Coordinates(object):
     """ This object represent machine coordinates.
         Machine supports 3 axis, so there are X, Y and Z.
+        Values are kept as is, they are rounded to ROUND_DIGITS digits only
+        where coordinates are compared or printed.
     """
+    __slots__ = ('x', 'y', 'z', 'e')
+
     def __init__(self, x, y, z, e):
         """ Create object.
         :param x: x coordinated.
         :param y: y coordinated.
         :param z: z coordinated.
         """
-        self.x = round(x, 10)
-        self.y = round(y, 10)
-        self.z = round(z, 10)
-        self.e = round(e, 10)
+        self.x = x
+        self.y = y
+        self.z = z
+        self.e = e
 
     def is_zero(self):
         """ Check if all coordinates are zero.
         :return: boolean value.
         """
-        return (self.x == 0.0 and self.y == 0.0 and self.z == 0.0
-                and self.e == 0.0)
+        return (round(self.x, ROUND_DIGITS) == 0.0
+                and round(self.y, ROUND_DIGITS) == 0.0
+                and round(self.z, ROUND_DIGITS) == 0.0
+                and round(self.e, ROUND_DIGITS) == 0.0)
+
+    def rounded(self):
+        """ Round values to ROUND_DIGITS digits.
+        :return: New rounded object.
+        """
+        return Coordinates(round(self.x, ROUND_DIGITS),
+                           round(self.y, ROUND_DIGITS),
+                           round(self.z, ROUND_DIGITS),
+                           round(self.e, ROUND_DIGITS))
+
+    def as_array(self):
+        """ Get values as numpy array.
+        :return: np.array(4,) of X, Y, Z and E values.
+        """
+        return np.array((self.x, self.y, self.z, self.e), dtype=np.float64)
 
     def length(self):
         """ Calculate the length of vector.
@@ -77,13 +103,51 @@ class Coordinates(object):
         """
         return Coordinates(self.x / v, self.y / v, self.z / v, self.e / v)
 
+    def __iadd__(self, other):
+        self.x += other.x
+        self.y += other.y
+        self.z += other.z
+        self.e += other.e
+        return self
+
+    def __isub__(self, other):
+        self.x -= other.x
+        self.y -= other.y
+        self.z -= other.z
+        self.e -= other.e
+        return self
+
+    def __imul__(self, v):
+        self.x *= v
+        self.y *= v
+        self.z *= v
+        self.e *= v
+        return self
+
+    def __itruediv__(self, v):
+        self.x /= v
+        self.y /= v
+        self.z /= v
+        self.e /= v
+        return self
+
+    __idiv__ = __itruediv__
+
     def __eq__(self, other):
-        return self.x == other.x and self.y == other.y and self.z == other.z \
-               and self.e == other.e
+        return round(self.x, ROUND_DIGITS) == round(other.x, ROUND_DIGITS) \
+            and round(self.y, ROUND_DIGITS) == round(other.y, ROUND_DIGITS) \
+            and round(self.z, ROUND_DIGITS) == round(other.z, ROUND_DIGITS) \
+            and round(self.e, ROUND_DIGITS) == round(other.e, ROUND_DIGITS)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
 
     def __str__(self):
-        return '(' + str(self.x) + ', ' + str(self.y) + ', ' + str(self.z) \
-               + ', ' + str(self.e) + ')'
+        r = self.rounded()
+        return '(' + str(r.x) + ', ' + str(r.y) + ', ' + str(r.z) \
+               + ', ' + str(r.e) + ')'
 
     def __abs__(self):
         return Coordinates(abs(self.x), abs(self.y), abs(self.z),  abs(self.e))
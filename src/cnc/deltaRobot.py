@@ -66,6 +66,8 @@ class DeltaMechanics:
             Set the new position of the tip.
 
             Updates the internal variables such as motor angular positions.
+            This is a thin wrapper around solve_tip_positions() so that single
+            point and batch results are bit-identical.
 
             Parameters
             ----------
@@ -79,9 +81,222 @@ class DeltaMechanics:
         if not tip_pos.shape == (3,):
             raise ValueError('the position of the tip should by a 3x1 vector')
         self.tip_pos = tip_pos
-        x = tip_pos[0]
-        y = tip_pos[1]
-        z = tip_pos[2]
+        angles, motor_valid = self._inverse_kinematics(tip_pos.reshape(1, 3))
+
+        for mot, angle, valid in zip(self.motors, angles[0], motor_valid[0]):
+            mot.valid = bool(valid)
+            if valid:
+                mot.angle = angle
+
+        self.valid = all(mot.valid for mot in self.motors)
+
+    def solve_tip_positions(self, tip_pos):
+        """
+            Solve the inverse kinematics for a batch of tip positions.
+
+            The internal state (motors, tip_pos, valid) is not modified.
+
+            Parameters
+            ----------
+            tip_pos : np.array(N,3)
+                Positions of the tip, one [x,y,z] per row
+
+            Returns
+            -------
+            angles : np.array(N,3)
+                Motor angles, nan where no solution exists
+            valid : np.array(N,) of bool
+                True where all three angles exist and are within the motor
+                limits
+        """
+        tip_pos = np.asarray(tip_pos, dtype=np.float64)
+        if tip_pos.ndim != 2 or tip_pos.shape[1] != 3:
+            raise ValueError('the positions of the tip should by a Nx3 array')
+        angles, motor_valid = self._inverse_kinematics(tip_pos)
+        return angles, motor_valid.all(axis=1)
+
+    def solve_motor_angles(self, angles):
+        """
+            Solve the forward kinematics for a batch of motor angles.
+
+            Each arm constrains the tip to a sphere of radius l around its
+            elbow, the same equations the inverse kinematics solves, so the
+            tip is the lower intersection of three spheres.
+
+            Parameters
+            ----------
+            angles : np.array(N,3)
+                Motor angles, one row per position
+
+            Returns
+            -------
+            tip_pos : np.array(N,3)
+                Positions of the tip, nan where spheres don't intersect
+            valid : np.array(N,) of bool
+                True where the position exists
+        """
+        angles = np.asarray(angles, dtype=np.float64)
+        if angles.ndim != 2 or angles.shape[1] != 3:
+            raise ValueError('the motor angles should by a Nx3 array')
+        cos = np.cos(angles)
+        sin = np.sin(angles)
+        sqrt3 = np.sqrt(3.0)
+        # centers of the spheres, elbows shifted by the tip joints
+        c1 = np.column_stack((np.zeros(len(angles)),
+                              -self.a - self.L*cos[:, 0],
+                              -self.L*sin[:, 0]))
+        c2 = np.column_stack((-self.b + sqrt3/2.0*self.L*cos[:, 1],
+                              -self.c + self.L*cos[:, 1]/2.0,
+                              -self.L*sin[:, 1]))
+        c3 = np.column_stack((self.b - sqrt3/2.0*self.L*cos[:, 2],
+                              -self.c + self.L*cos[:, 2]/2.0,
+                              -self.L*sin[:, 2]))
+
+        # trilateration in the frame with c1 at origin, c2 on x axis and c3
+        # in xy plane
+        with np.errstate(invalid='ignore', divide='ignore'):
+            d = np.linalg.norm(c2 - c1, axis=1)
+            ex = (c2 - c1) / d[:, np.newaxis]
+            i = np.einsum('ij,ij->i', ex, c3 - c1)
+            ey = c3 - c1 - i[:, np.newaxis]*ex
+            ey /= np.linalg.norm(ey, axis=1)[:, np.newaxis]
+            ez = np.cross(ex, ey)
+            j = np.einsum('ij,ij->i', ey, c3 - c1)
+            # equal radii
+            x = d/2.0
+            y = (i**2 + j**2)/(2.0*j) - i*x/j
+            z = np.sqrt(self.l**2 - x**2 - y**2)
+
+        tip_pos = c1 + x[:, np.newaxis]*ex + y[:, np.newaxis]*ey
+        # the tip is below the base
+        z = np.where(ez[:, 2] > 0, -z, z)
+        tip_pos += z[:, np.newaxis]*ez
+        valid = np.isfinite(tip_pos).all(axis=1)
+        return tip_pos, valid
+
+    def solve_tip_path(self, tip_pos, tolerance):
+        """
+            Solve the inverse kinematics for a path of tip positions
+            adaptively.
+
+            The path is split in intervals recursively. Angles are solved
+            exactly at the ends of intervals and at their quarter points.
+            When motors move linearly between the ends of interval, tip
+            deviation from the path at these points is estimated with the
+            Jacobian first, if it is less than tolerance, angles inside the
+            interval are interpolated linearly along the path length and
+            the tip position of each interpolated sample is checked with
+            the forward kinematics. Intervals with any sample which deviates
+            more than tolerance, or with singular positions, are split down
+            to single samples. So tip positions of all the returned angles
+            are within tolerance from the path, positions between the
+            samples are not checked. Where kinematics is nearly linear,
+            e.g. long straight movements far from the workspace edge, only
+            a few positions are solved exactly.
+
+            Interpolated angles are always within the motor limits.
+
+            Parameters
+            ----------
+            tip_pos : np.array(N,3)
+                Positions of the tip, one [x,y,z] per row, in path order
+            tolerance : float
+                Maximum deviation of the tip
+
+            Returns
+            -------
+            angles : np.array(N,3)
+                Motor angles, nan where no solution exists
+            valid : np.array(N,) of bool
+                False where angles were solved exactly and are not valid
+        """
+        tip_pos = np.asarray(tip_pos, dtype=np.float64)
+        if tip_pos.ndim != 2 or tip_pos.shape[1] != 3:
+            raise ValueError('the positions of the tip should by a Nx3 array')
+        n = len(tip_pos)
+        angles = np.full((n, 3), np.nan)
+        valid = np.ones(n, dtype=bool)
+        solved = np.zeros(n, dtype=bool)
+        if n == 0:
+            return angles, valid
+        path = np.concatenate(([0.0], np.cumsum(
+            np.linalg.norm(np.diff(tip_pos, axis=0), axis=1))))
+
+        def solve(index):
+            index = index[~solved[index]]
+            if len(index):
+                angles[index], motor_valid = \
+                    self._inverse_kinematics(tip_pos[index])
+                valid[index] = motor_valid.all(axis=1)
+                solved[index] = True
+
+        def interpolate(lo, hi, index):
+            length = path[hi] - path[lo]
+            fraction = np.divide(path[index] - path[lo], length,
+                                 out=np.zeros(np.shape(index)),
+                                 where=length > 0)
+            return angles[lo] + fraction[..., np.newaxis] \
+                * (angles[hi] - angles[lo])
+
+        lo = np.array([0])
+        hi = np.array([n - 1])
+        solve(np.array([0, n - 1]))
+        while len(lo):
+            span = hi - lo
+            lo = lo[span >= 2]
+            hi = hi[span >= 2]
+            span = span[span >= 2]
+            if len(lo) == 0:
+                break
+            checks = np.column_stack((lo + span // 4, lo + span // 2,
+                                      lo + 3 * span // 4))
+            solve(np.unique(checks))
+            delta = angles[checks] - interpolate(lo[:, np.newaxis],
+                                                 hi[:, np.newaxis], checks)
+            jacobian = self.jacobian(tip_pos[checks].reshape(-1, 3),
+                                     angles[checks].reshape(-1, 3))
+            finite = np.isfinite(jacobian).all(axis=(1, 2)) \
+                & np.isfinite(delta.reshape(-1, 3)).all(axis=1)
+            jacobian[~finite] = np.eye(3)
+            try:
+                deviation = np.linalg.solve(jacobian,
+                                            delta.reshape(-1, 3, 1))
+                deviation = np.linalg.norm(deviation[:, :, 0], axis=1)
+                deviation[~finite] = np.inf
+            except np.linalg.LinAlgError:
+                deviation = np.full(len(jacobian), np.inf)
+            deviation = deviation.reshape(-1, 3).max(axis=1)
+            ok = (deviation <= tolerance) & valid[lo] & valid[hi] \
+                & valid[checks].all(axis=1)
+            # interpolate insides of all the good intervals at once
+            good = np.flatnonzero(ok)
+            count = hi[good] - lo[good] - 1
+            interval = np.repeat(good, count)
+            first = lo[interval]
+            last = hi[interval]
+            index = first + 1 + np.arange(count.sum()) \
+                - np.repeat(np.cumsum(count) - count, count)
+            inside = ~solved[index]
+            interval = interval[inside]
+            index = index[inside]
+            interpolated = interpolate(first[inside], last[inside], index)
+            # the estimation misses deviation between the checked points
+            tip, tip_valid = self.solve_motor_angles(interpolated)
+            with np.errstate(invalid='ignore'):
+                bad = ~tip_valid | (np.linalg.norm(tip - tip_pos[index],
+                                                   axis=1) > tolerance)
+            ok[interval[bad]] = False
+            keep = ok[interval]
+            angles[index[keep]] = interpolated[keep]
+            split = np.column_stack((lo[~ok], checks[~ok], hi[~ok]))
+            lo = split[:, 0:4].ravel()
+            hi = split[:, 1:5].ravel()
+        return angles, valid
+
+    def _inverse_kinematics(self, tip_pos):
+        x = tip_pos[:, 0]
+        y = tip_pos[:, 1]
+        z = tip_pos[:, 2]
 
         alpha = x**2 + y**2 + z**2 + self.L**2 - self.l**2
 
@@ -97,33 +312,32 @@ class DeltaMechanics:
         f3 = 2.0*z*self.L
         g3 = alpha + self.b**2 + self.c**2 + 2.0*(-x*self.b + y*self.c)
 
-        self.motors[0].set_angle(self._solve_ipk(e1, f1, g1))
-        self.motors[1].set_angle(self._solve_ipk(e2, f2, g2))
-        self.motors[2].set_angle(self._solve_ipk(e3, f3, g3))
+        angles = np.column_stack((self._solve_ipk(e1, f1, g1),
+                                  self._solve_ipk(e2, f2, g2),
+                                  self._solve_ipk(e3, f3, g3)))
 
-        motor_validity = [mot.valid for mot in self.motors]
-        if all(motor_validity):
-            self.valid = True
-        else:
-            self.valid = False
+        angle_min = np.array([mot.angle_min for mot in self.motors])
+        angle_max = np.array([mot.angle_max for mot in self.motors])
+        motor_valid = (angle_min <= angles) & (angles <= angle_max)
+        return angles, motor_valid
 
     def _solve_ipk(self, e, f, g):
         delta = e**2 + f**2 - g**2
-        if delta >= 0:
-            pos_sol_t = (-f + np.sqrt(delta)) / (g-e)
-            neg_sol_t = (-f - np.sqrt(delta)) / (g-e)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sqrt_delta = np.sqrt(delta)
+            pos_sol_t = (-f + sqrt_delta) / (g-e)
+            neg_sol_t = (-f - sqrt_delta) / (g-e)
 
-            pos_sol = 2.0 * math.atan(pos_sol_t)
-            neg_sol = 2.0 * math.atan(neg_sol_t)
-            return self._best_angle(pos_sol, neg_sol)
-        else:
-            return np.nan
+        pos_sol = 2.0 * np.arctan(pos_sol_t)
+        neg_sol = 2.0 * np.arctan(neg_sol_t)
+        return np.where(delta >= 0, self._best_angle(pos_sol, neg_sol), np.nan)
 
     def update_motor_speed_from_tip_speed(self, tip_speed):
         """
             Set the speed of the tip.
 
-            Updates the speed internal variable : theta_prime.
+            Updates the speed internal variable : theta_prime. This is a thin
+            wrapper around motor_speeds().
 
             Parameters
             ----------
@@ -140,49 +354,105 @@ class DeltaMechanics:
             return
         if not tip_speed.shape == (3, 1):
             raise ValueError('the speed of the tip should by a 3x1 vector')
-        x = self.tip_pos[0]
-        y = self.tip_pos[1]
-        z = self.tip_pos[2]
-
-        theta0 = self.motors[0].angle
-        theta1 = self.motors[1].angle
-        theta2 = self.motors[2].angle
-
-        ma = np.matrix([[x,
-                         y + self.a + self.L * np.cos(theta0),
-                         z + self.L * np.sin(theta0)],
-                        [2*(x+self.b)-np.sqrt(3)*self.L*np.cos(theta1),
-                         2*(y+self.c)-self.L*np.cos(theta1),
-                         2*(z+self.L*np.sin(theta1))],
-                        [2*(x-self.b)+np.sqrt(3)*self.L*np.cos(theta2),
-                         2*(y+self.c)-self.L*np.cos(theta2),
-                         2*(z+self.L*np.sin(theta2))]])
-
-        inv_mb = np.matrix([[1.0/(self.L*((y+self.a)*np.sin(theta0)-z*np.cos(theta0))),
-                             0,
-                             0],
-                            [0,
-                             -1.0/(self.L*((np.sqrt(3)*(x+self.b)+y+self.c)*np.sin(theta1)+2.0*z*np.cos(theta1))),
-                             0],
-                            [0,
-                             0,
-                             1.0/(self.L*((np.sqrt(3)*(x-self.b)-y-self.c)*np.sin(theta2)-2.0*z*np.cos(theta2)))]])
-
-        self.theta_prime = inv_mb * ma * tip_speed
+        theta_prime = self.motor_speeds(self.tip_pos.reshape(1, 3),
+                                        tip_speed.reshape(1, 3),
+                                        self.motor_angles().reshape(1, 3))
+        self.theta_prime = theta_prime.reshape(3, 1)
+
+    def jacobian(self, tip_pos, angles=None):
+        """
+            Compute the Jacobian of the inverse kinematics for a batch of tip
+            positions.
+
+            Each arm is constrained by e*cos(theta) + f*sin(theta) + g = 0,
+            see _inverse_kinematics(), so by the implicit function theorem
+            d(theta)/d(p) = -(dF/dp) / (dF/d(theta)). The Jacobian is
+            infinite at singular positions where dF/d(theta) is zero.
+
+            Parameters
+            ----------
+            tip_pos : np.array(N,3)
+                Positions of the tip, one [x,y,z] per row
+            angles : np.array(N,3)
+                Motor angles at the positions, solved if None
+
+            Returns
+            -------
+            jacobian : np.array(N,3,3)
+                Motor angular velocity per tip velocity, row per motor
+        """
+        tip_pos = np.asarray(tip_pos, dtype=np.float64)
+        if tip_pos.ndim != 2 or tip_pos.shape[1] != 3:
+            raise ValueError('the positions of the tip should by a Nx3 array')
+        if angles is None:
+            angles, _ = self._inverse_kinematics(tip_pos)
+        x = tip_pos[:, 0]
+        y = tip_pos[:, 1]
+        z = tip_pos[:, 2]
+        cos = np.cos(angles)
+        sin = np.sin(angles)
+        sqrt3 = np.sqrt(3.0)
+
+        d_pos = np.empty((len(tip_pos), 3, 3))
+        d_pos[:, 0, 0] = 2.0*x
+        d_pos[:, 0, 1] = 2.0*(y + self.a + self.L*cos[:, 0])
+        d_pos[:, 0, 2] = 2.0*(z + self.L*sin[:, 0])
+        d_pos[:, 1, 0] = 2.0*(x + self.b) - sqrt3*self.L*cos[:, 1]
+        d_pos[:, 1, 1] = 2.0*(y + self.c) - self.L*cos[:, 1]
+        d_pos[:, 1, 2] = 2.0*(z + self.L*sin[:, 1])
+        d_pos[:, 2, 0] = 2.0*(x - self.b) + sqrt3*self.L*cos[:, 2]
+        d_pos[:, 2, 1] = 2.0*(y + self.c) - self.L*cos[:, 2]
+        d_pos[:, 2, 2] = 2.0*(z + self.L*sin[:, 2])
+
+        d_theta = np.column_stack((
+            -2.0*self.L*((y + self.a)*sin[:, 0] - z*cos[:, 0]),
+            self.L*((sqrt3*(x + self.b) + y + self.c)*sin[:, 1]
+                    + 2.0*z*cos[:, 1]),
+            -self.L*((sqrt3*(x - self.b) - y - self.c)*sin[:, 2]
+                     - 2.0*z*cos[:, 2])))
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return -d_pos / d_theta[:, :, np.newaxis]
+
+    def motor_speeds(self, tip_pos, tip_speed, angles=None):
+        """
+            Compute motor angular velocities for a batch of tip positions and
+            velocities.
+
+            The internal state (motors, tip_pos, theta_prime) is not
+            modified.
+
+            Parameters
+            ----------
+            tip_pos : np.array(N,3)
+                Positions of the tip, one [x,y,z] per row
+            tip_speed : np.array(N,3)
+                Velocities of the tip, one [v_x,v_y,v_z] per row
+            angles : np.array(N,3)
+                Motor angles at the positions, solved if None
+
+            Returns
+            -------
+            theta_prime : np.array(N,3)
+                Angular velocity of each motor
+        """
+        tip_speed = np.asarray(tip_speed, dtype=np.float64)
+        jacobian = self.jacobian(tip_pos, angles)
+        if tip_speed.shape != jacobian.shape[0:2]:
+            raise ValueError('the speeds of the tip should by a Nx3 array')
+        with np.errstate(invalid='ignore'):
+            return np.einsum('nij,nj->ni', jacobian, tip_speed)
 
     def _best_angle(self, angle1, angle2):
-        r1 = -self.wb - self.L*math.cos(angle1)
-        h1 = -self.L*math.cos(angle1)
+        r1 = -self.wb - self.L*np.cos(angle1)
+        h1 = -self.L*np.cos(angle1)
         d1 = r1**2 + h1**2
 
-        r2 = -self.wb - self.L*math.cos(angle2)
-        h2 = -self.L * math.cos(angle2)
+        r2 = -self.wb - self.L*np.cos(angle2)
+        h2 = -self.L * np.cos(angle2)
         d2 = r2 ** 2 + h2 ** 2
 
-        if d1 > d2:
-            return angle1
-        else:
-            return angle2
+        return np.where(d1 > d2, angle1, angle2)
 
 
 if __name__ == '__main__':
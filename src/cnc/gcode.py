@@ -4,8 +4,10 @@ from cnc.coordinates import Coordinates
 
 # extract letter-digit pairs
 g_pattern = re.compile('([A-Z])([-+]?[0-9.]+)')
+# line which consists of letter-digit pairs only
+line_pattern = re.compile('(?:[A-Z][-+]?[0-9.]+)+$')
 # white spaces and comments start with ';' and in '()'
-clean_pattern = re.compile('\s+|\(.*?\)|;.*')
+clean_pattern = re.compile(r'\s+|\(.*?\)|;.*')
 
 
 class GCodeException(Exception):
@@ -14,15 +16,46 @@ class GCodeException(Exception):
     pass
 
 
+class _MalformedNumber(str):
+    """ Value which isn't a number, fails when it is read like float() of
+        it would.
+    """
+    __slots__ = ()
+
+    def __mul__(self, other):
+        return float(self) * other
+
+    __rmul__ = __mul__
+
+
 class GCode(object):
     """ This object represent single line of gcode.
         Do not create it manually, use parse_line() instead.
+        Values are converted to numbers once, when line is parsed, but
+        malformed numbers fail only when they are read.
     """
+    __slots__ = ('params', '_command')
+
     def __init__(self, params):
         """ Create object.
-        :param params: dict with gcode key-values.
+        :param params: dict with gcode key-values, values are strings.
         """
-        self.params = params
+        if 'G' in params:
+            code = params['G']
+            if code[0] == '0':
+                code = code[1:]
+            self._command = 'G' + code
+        elif 'M' in params:
+            self._command = 'M' + params['M']
+        else:
+            self._command = None
+        self.params = {}
+        for k, v in params.items():
+            try:
+                self.params[k] = float(v)
+            except ValueError:
+                # keep it, get() fails on it like on any other bad number
+                self.params[k] = _MalformedNumber(v)
 
     def has(self, arg_name):
         """
@@ -41,7 +74,7 @@ class GCode(object):
         """
         if arg_name not in self.params:
             return default
-        return float(self.params[arg_name]) * multiply
+        return self.params[arg_name] * multiply
 
     def coordinates(self, default, multiply):
         """ Get X, Y and Z values as Coord object.
@@ -77,14 +110,7 @@ class GCode(object):
         """ Get value from gcode line.
         :return: String with command or None if no command specified.
         """
-        if 'G' in self.params:
-            code = self.params['G']
-            if code[0] == '0':
-                code = code[1:]
-            return 'G' + code
-        if 'M' in self.params:
-            return 'M' + self.params['M']
-        return None
+        return self._command
 
     @staticmethod
     def parse_line(line):
@@ -93,7 +119,10 @@ class GCode(object):
         :return: gcode objects.
         """
         line = line.upper()
-        line = re.sub(clean_pattern, '', line)
+        if '(' in line or ';' in line:
+            line = clean_pattern.sub('', line)
+        else:
+            line = ''.join(line.split())
         if len(line) == 0:
             return None
         if line[0] == '%':
@@ -101,7 +130,7 @@ class GCode(object):
         m = g_pattern.findall(line)
         if not m:
             raise GCodeException('gcode not found')
-        if len(''.join(["%s%s" % i for i in m])) != len(line):
+        if line_pattern.match(line) is None:
             raise GCodeException('extra characters in line')
         # noinspection PyTypeChecker
         params = dict(m)
@@ -2,6 +2,7 @@ from __future__ import division
 
 import cnc.logging_config as logging_config
 from cnc.path import *
+from cnc.planner import *
 from cnc.coordinates import *
 from cnc.enums import *
 from cnc.hal import *
@@ -19,8 +20,9 @@ class GMachine(object):
         spindle, extruder etc
     """
 
-    def __init__(self):
+    def __init__(self, hal=None):
         """ Initialization.
+        :param hal: hal object to run movements, HalFileExporter by default.
         """
         self._position = Coordinates(0.0, 0.0, 0.0, 0.0)
         # init variables
@@ -28,8 +30,22 @@ class GMachine(object):
         self._spindle_rpm = 0
         self._local = None
         self._convertCoordinates = 0
+        self._plane = None
+        # line number of the command being run, set by the caller, it is
+        # kept in the movements, which can run after the next commands
+        self.source_line = None
         self.reset()
-        self._hal = HalFileExporter()
+        self._planner = None
+        if LOOKAHEAD_SEGMENTS > 0:
+            self._planner = LookaheadPlanner(LOOKAHEAD_SEGMENTS)
+        if hal is None:
+            if SERVO_DIRECT:
+                hal = HalServoDirect(max(1, HAL_QUEUE_SIZE))
+            elif HAL_QUEUE_SIZE > 0:
+                hal = AsyncHalFileExporter(HAL_QUEUE_SIZE)
+            else:
+                hal = HalFileExporter()
+        self._hal = hal
 
     def release(self):
         """ Free all resources.
@@ -47,29 +63,127 @@ class GMachine(object):
         self._spindle_rpm = 1000
         self._local = Coordinates(0.0, 0.0, 0.0, 0.0)
         self._convertCoordinates = 1.0
+        self._plane = PLANE_XY
+
+    def _flush(self):
+        """ Run all the planned movements.
+        """
+        if self._planner is not None:
+            for segment in self._planner.flush():
+                self._hal.move(segment)
+
+    def _join(self):
+        """ Run all the planned movements and wait for motors.
+        """
+        self._flush()
+        self._hal.join()
 
     # noinspection PyMethodMayBeStatic
     def _spindle(self, spindle_speed):
-        self._hal.join()
+        self._join()
         self._hal.spindle_control(100.0 * spindle_speed / SPINDLE_MAX_RPM)
 
     # noinspection PyMethodMayBeStatic
     def __check_velocity(self, max_velocity):
+        # scaled velocities may exceed the limits by rounding errors
+        max_velocity = max_velocity.rounded()
         if max_velocity.x > MAX_VELOCITY_MM_PER_MIN_X \
                 or max_velocity.y > MAX_VELOCITY_MM_PER_MIN_Y \
                 or max_velocity.z > MAX_VELOCITY_MM_PER_MIN_Z \
                 or max_velocity.e > MAX_VELOCITY_MM_PER_MIN_E:
             raise GMachineException("out of maximum speed")
 
-    def _move_linear(self, new_pos, velocity):
+    def __limit_motor_speed(self, points, velocity):
+        """ Lower velocity so motors don't turn faster than
+            MOTOR_MAX_SPEED_RAD_PER_S.
+        :param points: (N, 4) array of path points.
+        :param velocity: velocity in mm per min.
+        :return: velocity in mm per min.
+        """
+        limit = self._hal.max_tip_speed(points, MOTOR_MAX_SPEED_RAD_PER_S) \
+            * SECONDS_IN_MINUTE
+        if velocity <= limit:
+            return velocity
+        if limit < MIN_VELOCITY_MM_PER_MIN:
+            raise GMachineException("out of motor speed")
+        logging.warning("Out of motor speed, velocity is limited to {}"
+                        .format(limit))
+        return limit
+
+    @staticmethod
+    def __path_fractions(length_mm):
+        # path is checked at least twice per workspace grid cell
+        count = int(math.ceil(length_mm / (WORKSPACE_GRID_MM / 2))) + 1
+        return np.linspace(0.0, 1.0, count)
+
+    def _move_linear(self, new_pos, velocity, profile=None):
+        """ Move linearly.
+        :param new_pos: end position.
+        :param velocity: velocity in mm per min.
+        :param profile: velocity profile, VELOCITY_PROFILE if None.
+        """
+        if profile is None:
+            profile = VELOCITY_PROFILE
+        if profile not in VELOCITY_PROFILES:
+            raise GMachineException("unknown velocity profile")
         delta = new_pos - self._position
         if delta.is_zero():
             return
-        if not self._hal.check_valid_position(new_pos.x, new_pos.y, new_pos.z):
+        if not self._hal.check_valid_segment(self._position, new_pos):
             raise GMachineException("out of effective area")
+        if MOTOR_MAX_SPEED_RAD_PER_S is not None:
+            u = self.__path_fractions(delta.length())
+            points = self._position.as_array() \
+                + u[:, np.newaxis] * delta.as_array()
+            velocity = self.__limit_motor_speed(points, velocity)
 
         logging.info("Moving linearly to{}".format(new_pos))
-        gen = PathGenerator(delta, new_pos, velocity)
+        if self._planner is not None:
+            jerk = None
+            if profile == 'scurve':
+                jerk = TIP_MAX_JERK_MM_PER_S3
+            segment = PlannedSegment(delta, new_pos, velocity, jerk)
+            segment.source_line = self.source_line
+            self.__check_velocity(segment.max_velocity())
+            for ready in self._planner.append(segment):
+                self._hal.move(ready)
+        else:
+            gen = path_generator(delta, new_pos, velocity, profile)
+            gen.source_line = self.source_line
+            self.__check_velocity(gen.max_velocity())
+            self._hal.move(gen)
+        # save position
+        self._position = new_pos
+
+    def _circular(self, new_pos, center_offset, velocity, direction):
+        """ Move by arc.
+        :param new_pos: end position.
+        :param center_offset: center of circle relative to current position.
+        :param velocity: velocity in mm per min.
+        :param direction: CW or CCW.
+        """
+        if not self._hal.check_valid_position(new_pos.x, new_pos.y, new_pos.z):
+            raise GMachineException("out of effective area")
+        gen = ArcPathGenerator(self._position, new_pos, center_offset,
+                               self._plane, direction, velocity)
+        if gen.radius == 0.0 or abs(gen.end_radius - gen.radius) \
+                > ARC_RADIUS_TOLERANCE_MM:
+            raise GMachineException("bad radius")
+        # the arc can leave the workspace between its ends
+        points = gen.points(self.__path_fractions(gen.length_mm))
+        if not self._hal.check_valid_path(points):
+            raise GMachineException("out of effective area")
+        if MOTOR_MAX_SPEED_RAD_PER_S is not None:
+            limited = self.__limit_motor_speed(points, velocity)
+            if limited != velocity:
+                velocity = limited
+                gen = ArcPathGenerator(self._position, new_pos, center_offset,
+                                       self._plane, direction, velocity)
+
+        logging.info("Moving circularly {} {} {} with radius {}"
+                     " to {}".format(self._plane, direction, center_offset,
+                                     gen.radius, new_pos))
+        gen.source_line = self.source_line
         self.__check_velocity(gen.max_velocity())
         self._hal.move(gen)
         # save position
@@ -124,9 +238,23 @@ class GMachine(object):
             This function for tests only.
             :return current position.
         """
-        self._hal.join()
+        self._join()
         return self._position
 
+    def planned_position(self):
+        """ Return machine position after the latest command without
+            waiting for motors, movements to it can be still planned or
+            running.
+            :return current position.
+        """
+        return self._position
+
+    def flush(self):
+        """ Run all the planned movements without waiting for motors, i.e.
+            when no more commands are expected soon.
+        """
+        self._flush()
+
     def do_command(self, gcode):
         """ Perform action.
         :param gcode: GCode object which represent one gcode line
@@ -135,7 +263,7 @@ class GMachine(object):
         if gcode is None:
             return None
         answer = None
-        logging.debug("got command " + str(gcode.params))
+        logging.debug("got command %s", gcode.params)
         # read command
         c = gcode.command()
         if c is None and gcode.has_coordinates():
@@ -144,15 +272,26 @@ class GMachine(object):
 
         coord = gcode.coordinates(self._position - self._local,
                                   self._convertCoordinates)
-        coord = coord + self._local
+        coord += self._local
 
         velocity = gcode.get('F', self._velocity)
         # check parameters
         if velocity < MIN_VELOCITY_MM_PER_MIN:
             raise GMachineException("feed speed too low")
+        # movements are planned together, anything else runs after them
+        if c not in ('G0', 'G1', None):
+            self._flush()
         # select command and run it
         if (c == 'G0') or (c == 'G1'):  # linear interpolation
             self._move_linear(coord, velocity)
+        elif c == 'G2' or c == 'G3':  # circular interpolation
+            if not gcode.has('I') and not gcode.has('J') \
+                    and not gcode.has('K'):
+                raise GMachineException("I, J or K is not specified")
+            center_offset = gcode.radius(Coordinates(0.0, 0.0, 0.0, 0.0),
+                                         self._convertCoordinates)
+            self._circular(coord, center_offset, velocity,
+                           CW if c == 'G2' else CCW)
         elif c == 'G4':  # delay in s
             if not gcode.has('P'):
                 raise GMachineException("P is not specified")
@@ -160,6 +299,12 @@ class GMachine(object):
             if pause < 0:
                 raise GMachineException("bad delay")
             time.sleep(pause)
+        elif c == 'G17':  # XY plane select
+            self._plane = PLANE_XY
+        elif c == 'G18':  # ZX plane select
+            self._plane = PLANE_ZX
+        elif c == 'G19':  # YZ plane select
+            self._plane = PLANE_YZ
         elif c == 'G20':  # switch to inches
             self._convertCoordinates = 25.4
         elif c == 'G21':  # switch to mm
@@ -169,7 +314,7 @@ class GMachine(object):
             if axises == (False, False, False):
                 axises = True, True, True
             self.safe_zero(*axises)
-            self._hal.join()
+            self._join()
         elif c == 'G53':  # switch to machine coords
             self._local = Coordinates(0.0, 0.0, 0.0, 0.0)
         elif c == 'G90':  # switch to absolute coords
@@ -201,8 +346,8 @@ class GMachine(object):
         elif c == 'M111':  # enable debug
             logging_config.debug_enable()
         elif c == 'M114':  # get current position
-            self._hal.join()
-            p = self.position()
+            self._join()
+            p = self.position().rounded()
             answer = "X:{} Y:{} Z:{} E:{}".format(p.x, p.y, p.z, p.e)
         elif c is None:  # command not specified(ie just F was passed)
             pass
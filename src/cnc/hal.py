@@ -1,5 +1,21 @@
+import os
+import sys
+import threading
+import time
+
+try:  # python3 compatibility
+    import queue
+except ImportError:
+    import Queue as queue
+
 from cnc.path import *
 from cnc.deltaRobot import *
+from cnc.rtstream import *
+from cnc.workspace import ReachabilityGrid
+from servo.servo import ServoKernel
+
+RT_STREAM_ENCODINGS = {'angle': ENCODING_ANGLE, 'duty': ENCODING_DUTY}
+TIP_LOG_LINE = 'tip: %f %f %f\n'
 
 
 class GHalException(Exception):
@@ -9,15 +25,89 @@ class GHalException(Exception):
 
 
 class HalFileExporter:
-    def __init__(self):
+    def __init__(self, open_stream=True):
         """ Initialize GPIO pins and machine itself.
+        :param open_stream: open RT_STREAM_PATH and TIP_LOG_PATH, text
+                            stream is printed to stdout and tips are not
+                            written otherwise.
         """
         self.robot = DeltaMechanics(L=DELTA_BIG_L, l=DELTA_SMALL_L, wb=DELTA_WB, up=DELTA_UP)
+        self.motor_offset = np.array([MOTOR0_OFFSET_RAD, MOTOR1_OFFSET_RAD, MOTOR2_OFFSET_RAD])
+        cache_dir = WORKSPACE_CACHE_DIR
+        if cache_dir is not None:
+            cache_dir = os.path.expanduser(cache_dir)
+        self.workspace = ReachabilityGrid(self.robot, WORKSPACE_GRID_MM / 1000, cache_dir)
+        self._rt_writer = RtTextWriter()
+        self._tip_writer = None
+        if open_stream and RT_STREAM_FORMAT != 'text':
+            if RT_STREAM_FORMAT not in RT_STREAM_ENCODINGS:
+                raise GHalException("unknown stream format " + RT_STREAM_FORMAT)
+            if RT_STREAM_PATH is None:
+                raise GHalException("binary stream requires RT_STREAM_PATH")
+            self._rt_writer = RtStreamWriter(open(RT_STREAM_PATH, 'wb'),
+                                             RT_STREAM_ENCODINGS[RT_STREAM_FORMAT])
+        elif open_stream and RT_STREAM_PATH is not None:
+            self._rt_writer = RtTextWriter(open(RT_STREAM_PATH, 'w'))
+        if open_stream and TIP_LOG_PATH is not None:
+            self._tip_writer = RtTextWriter(open(TIP_LOG_PATH, 'w'),
+                                            TIP_LOG_LINE)
         logging.info("initialize hal")
 
     def check_valid_position(self, x, y, z):
-        self.robot.update_from_new_tip_pos(np.array([x/1000, y/1000, z/1000+DELTA_Z_OFFSET]))
-        return self.robot.valid
+        return self.workspace.contains_point(x/1000, y/1000, z/1000+DELTA_Z_OFFSET)
+
+    def check_valid_segment(self, start, end):
+        """ Check if the whole straight movement is reachable.
+        :param start: start position, Coordinates object.
+        :param end: end position, Coordinates object.
+        :return: boolean value.
+        """
+        delta = end - start
+        # positions are checked at least twice per grid cell
+        count = int(math.ceil(delta.length() / (WORKSPACE_GRID_MM / 2))) + 1
+        u = np.linspace(0.0, 1.0, count)[:, np.newaxis]
+        return self.check_valid_path(np.array([start.x, start.y, start.z])
+                                     + u * np.array([delta.x, delta.y,
+                                                     delta.z]))
+
+    def check_valid_path(self, points):
+        """ Check if all the points of path are reachable.
+        :param points: (N, 3) or (N, 4) array of positions in mm, points
+                       should be closer than the workspace grid cell.
+        :return: boolean value.
+        """
+        tip_pos = np.array(points, dtype=np.float64)[:, 0:3] / 1000
+        tip_pos[:, 2] += DELTA_Z_OFFSET
+        return bool(self.workspace.contains(tip_pos).all())
+
+    def max_tip_speed(self, points, motor_speed_rad_per_s):
+        """ Get the maximum velocity of movement along the path at which no
+            motor turns faster than motor_speed_rad_per_s.
+        :param points: (N, 3) or (N, 4) array of path points, mm, E axis is
+                       ignored. Path is a polyline, so points should be dense
+                       enough for curves.
+        :param motor_speed_rad_per_s: maximum angular velocity of motors.
+        :return: velocity in mm per sec, inf if motors don't move, 0.0 if
+                 the path passes through a singular position.
+        """
+        tip_pos = np.array(points, dtype=np.float64)[:, 0:3] / 1000
+        tip_pos[:, 2] += DELTA_Z_OFFSET
+        chords = np.diff(tip_pos, axis=0)
+        length = np.linalg.norm(chords, axis=1)
+        moving = length > 0
+        direction = chords[moving] / length[moving, np.newaxis]
+        if len(direction) == 0:
+            return float('inf')
+        # direction of each chord at both of its ends
+        tip_pos = np.concatenate((tip_pos[:-1][moving], tip_pos[1:][moving]))
+        direction = np.concatenate((direction, direction))
+        speeds = np.abs(self.robot.motor_speeds(tip_pos, direction))
+        if np.isnan(speeds).any():
+            return 0.0
+        worst = speeds.max()
+        if worst == 0.0:
+            return float('inf')
+        return motor_speed_rad_per_s / worst * 1000
 
     # noinspection PyMethodMayBeStatic
     def spindle_control(self, percent):
@@ -42,35 +132,236 @@ class HalFileExporter:
         """
         logging.info("hal disable steppers")
 
-    # noinspection PyMethodMayBeStatic
     def move(self, generator):
         """ Move head to specified position.
-        :param generator: PulseGenerator object.
-        """
-        for tx, ty, tz, te in generator:
-            self.robot.update_from_new_tip_pos(np.array([tx/1000, ty/1000, tz/1000+DELTA_Z_OFFSET]))
-            theta = self.robot.motor_angles()
-            if self.robot.valid:
-                print("tip: {:f} {:f} {:f}".format(tx, ty, tz))
-                self.print_rt("POS {:f} {:f} {:f}".format(MOTOR0_OFFSET_RAD - theta[0],
-                                                          MOTOR1_OFFSET_RAD - theta[1],
-                                                          MOTOR2_OFFSET_RAD - theta[2]))
-            else:
-                raise GHalException("Impossible delta geometry, (tip: {:f} {:f} {:f}) angles: {:f} {:f} {:f}".format(
-                    tx, ty, tz, theta[0], theta[1], theta[2]))
+        :param generator: PathGenerator object.
+        """
+        self._emit(*self._solve(generator))
+
+    def _solve(self, generator):
+        """ Sample movement and solve inverse kinematics for it.
+        :param generator: PathGenerator object.
+        :return: Tuple of (N, 4) array of samples and (N, 3) array of servo
+                 angles.
+        """
+        samples = generator.sample_all()
+        tip_pos = samples[:, 0:3] / 1000
+        tip_pos[:, 2] += DELTA_Z_OFFSET
+        if IK_TOLERANCE_MM is None:
+            angles, valid = self.robot.solve_tip_positions(tip_pos)
+        else:
+            angles, valid = self.robot.solve_tip_path(tip_pos,
+                                                      IK_TOLERANCE_MM / 1000)
+        # nothing is emitted if any part of the movement is unreachable
+        invalid = np.flatnonzero(~valid)
+        if len(invalid):
+            tx, ty, tz, te = samples[invalid[0]]
+            theta = angles[invalid[0]]
+            raise GHalException("Impossible delta geometry, (tip: {:f} {:f} {:f}) angles: {:f} {:f} {:f}".format(
+                tx, ty, tz, theta[0], theta[1], theta[2]))
+        return samples, self.motor_offset - angles
+
+    def _emit(self, samples, servo_angles):
+        """ Write samples of movement to outputs.
+        """
+        if self._tip_writer is not None:
+            self._tip_writer.write(samples[:, 0:3])
+        self._rt_writer.write(servo_angles)
+        if INSTANT_RUN:
+            # let realTimePlayer -s play this move while the next is planned
+            self._rt_writer.flush()
 
-    # noinspection PyMethodMayBeStatic
     def join(self):
         """ Wait till motors work.
         """
+        self._rt_writer.flush()
         logging.info("hal join()")
 
-    # noinspection PyMethodMayBeStatic
     def deinit(self):
         """ De-initialise.
         """
+        if self._rt_writer is not None:
+            self._rt_writer.close()
+            self._rt_writer = None
+        if self._tip_writer is not None:
+            self._tip_writer.close()
+            self._tip_writer = None
         logging.info("hal deinit()")
 
-    @staticmethod
-    def print_rt(strin):
-        print("rt-cmd:{:s}".format(strin))
+
+class AsyncHalFileExporter(HalFileExporter):
+    """ HalFileExporter which writes movements in a separate thread, so the
+        next lines are parsed and planned while the current movement is
+        written. move() solves inverse kinematics and raises errors for the
+        caller like HalFileExporter does, then puts the movement into a
+        bounded queue and returns, it blocks only when the queue is full.
+        join() waits until all queued movements are written.
+    """
+
+    def __init__(self, queue_size=HAL_QUEUE_SIZE, open_stream=True):
+        """ Initialize hal and start writer thread.
+        :param queue_size: maximum number of movements in the queue.
+        :param open_stream: see HalFileExporter.
+        """
+        HalFileExporter.__init__(self, open_stream)
+        self._queue = queue.Queue(max(1, queue_size))
+        self._error = None
+        self._writer = threading.Thread(target=self._write_loop,
+                                        name="hal writer")
+        self._writer.daemon = True
+        self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                # drop movements after error, caller gets it on next call
+                if self._error is None:
+                    self._emit(*item)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _check_error(self):
+        if self._error is not None:
+            e = self._error
+            self._error = None
+            raise GHalException("writing failed: {}".format(e))
+
+    def move(self, generator):
+        """ Queue movement.
+        :param generator: PathGenerator object.
+        """
+        self._check_error()
+        self._queue.put(self._solve(generator))
+
+    def join(self):
+        """ Wait till all queued movements are written.
+        """
+        self._queue.join()
+        self._check_error()
+        HalFileExporter.join(self)
+
+    def deinit(self):
+        """ Write queued movements, stop writer thread and de-initialise.
+        """
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+        HalFileExporter.deinit(self)
+
+
+class HalServoDirect(AsyncHalFileExporter):
+    """ Hal which plays movements straight to the servos through the kernel
+        PWM sysfs interface, without realTimePlayer. move() converts servo
+        angles to formatted duty cycles, the playing thread only writes them
+        to the duty_cycle files, which are kept open, one frame per
+        REAL_TIME_DT. Frames are scheduled by absolute deadlines on the
+        monotonic clock, so the time of writing doesn't accumulate.
+        Statistics of the playback are in the stats dict:
+            frames      number of played frames
+            overruns    frames written later than half of REAL_TIME_DT after
+                        their deadlines
+            max_late_s  the latest frame, seconds after its deadline
+            underruns   movements which came after the previous movement was
+                        played out, while the head was still moving
+    """
+
+    def __init__(self, queue_size=HAL_QUEUE_SIZE,
+                 sysfs_root=SERVO_SYSFS_ROOT, channels=SERVO_CHANNELS,
+                 sched_priority=SERVO_SCHED_PRIORITY):
+        """ Initialize servos and start playing thread.
+        :param queue_size: maximum number of movements in the queue.
+        :param sysfs_root: path of the PWM chip in sysfs.
+        :param channels: PWM channels of motors 0, 1 and 2.
+        :param sched_priority: SCHED_FIFO priority of playing thread, None
+                               keeps the default policy.
+        """
+        self._servos = [ServoKernel(channel, sysfs_root)
+                        for channel in channels]
+        self._calibration = servo_calibration()
+        if self._calibration is not None:
+            # tables are numbered by motors, like in the stream
+            for motor, servo in enumerate(self._servos):
+                servo.set_calibration(self._calibration, motor)
+        self._sched_priority = sched_priority
+        # the time of the next frame, None when the head is at rest
+        self._deadline = None
+        self.stats = {'frames': 0, 'overruns': 0, 'max_late_s': 0.0,
+                      'underruns': 0}
+        AsyncHalFileExporter.__init__(self, queue_size, open_stream=False)
+
+    def _write_loop(self):
+        if self._sched_priority is not None:
+            try:
+                os.sched_setscheduler(
+                    0, os.SCHED_FIFO, os.sched_param(self._sched_priority))
+            except (AttributeError, OSError) as e:
+                logging.warning("can't set real time priority: {}".format(e))
+        AsyncHalFileExporter._write_loop(self)
+
+    def _solve(self, generator):
+        """ Sample movement and convert it to duty cycles.
+        :param generator: PathGenerator object.
+        :return: Tuple of list of frames, each one is a tuple of formatted
+                 duty cycles, and boolean which is True if the head stops at
+                 the end of movement.
+        """
+        _, servo_angles = HalFileExporter._solve(self, generator)
+        if self._calibration is not None:
+            duty = self._calibration.to_duty(servo_angles)
+        else:
+            duty = np.clip(SERVO_MODEL_SLOPE_NS_PER_RAD * servo_angles
+                           + SERVO_MODEL_INTERCEPT_NS, SERVO_PULSE_MIN_NS,
+                           SERVO_PULSE_MAX_NS).astype(np.int64)
+        frames = [tuple(b"%d\n" % value for value in row)
+                  for row in duty.tolist()]
+        at_rest = getattr(generator, 'exit_speed', 0.0) == 0.0
+        return frames, at_rest
+
+    def _emit(self, frames, at_rest):
+        """ Play frames to servos.
+        """
+        now = time.monotonic()
+        if self._deadline is None or self._deadline < now:
+            if self._deadline is not None:
+                self.stats['underruns'] += 1
+            self._deadline = now
+        deadline = self._deadline
+        stats = self.stats
+        servos = self._servos
+        for frame in frames:
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            for servo, data in zip(servos, frame):
+                servo.write_duty_cycle(data)
+            late = time.monotonic() - deadline
+            if late > REAL_TIME_DT / 2:
+                stats['overruns'] += 1
+            if late > stats['max_late_s']:
+                stats['max_late_s'] = late
+            deadline += REAL_TIME_DT
+        stats['frames'] += len(frames)
+        self._deadline = None if at_rest else deadline
+
+    def join(self):
+        """ Wait till all queued movements are played.
+        """
+        AsyncHalFileExporter.join(self)
+        logging.info("servo playback: {}".format(self.stats))
+
+    def deinit(self):
+        """ Play queued movements, stop playing thread and servos.
+        """
+        AsyncHalFileExporter.deinit(self)
+        for servo in self._servos:
+            servo.close()
+        if self.stats['overruns'] or self.stats['underruns']:
+            logging.warning("servo playback: {}".format(self.stats))
+        else:
+            logging.info("servo playback: {}".format(self.stats))
@@ -6,8 +6,12 @@ import readline
 import atexit
 
 import cnc.logging_config as logging_config
+from cnc.compiler import Compiler, CompilerException
+from cnc.config import *
 from cnc.gcode import GCode, GCodeException
 from cnc.gmachine import GMachine, GMachineException
+from cnc.hal import RT_STREAM_ENCODINGS
+from cnc.trajcache import TrajectoryCache, trajectory_key, stream_file
 
 try:  # python3 compatibility
     type(raw_input)
@@ -15,16 +19,19 @@ except NameError:
     # noinspection PyShadowingBuiltins
     raw_input = input
 
-# configure history file for interactive mode
-history_file = os.path.join(os.environ['HOME'], '.pycnc_history')
-try:
-    readline.read_history_file(history_file)
-except IOError:
-    pass
-readline.set_history_length(1000)
-atexit.register(readline.write_history_file, history_file)
+machine = None
 
-machine = GMachine()
+
+def init_history():
+    """ Configure history file for interactive mode.
+    """
+    history_file = os.path.join(os.environ['HOME'], '.pycnc_history')
+    try:
+        readline.read_history_file(history_file)
+    except IOError:
+        pass
+    readline.set_history_length(1000)
+    atexit.register(readline.write_history_file, history_file)
 
 
 def do_line(line):
@@ -41,8 +48,59 @@ def do_line(line):
     return True
 
 
+def interactive():
+    """ Main loop for interactive shell. Use stdin/stdout, additional
+        interfaces like UART, Socket or any other can be added.
+    """
+    print("*************** Welcome to PyCNC! ***************")
+    while True:
+        line = raw_input('> ')
+        if line == 'quit' or line == 'exit':
+            break
+        do_line(line)
+        # the next line may never come, don't keep movements planned
+        machine.flush()
+
+
+def run_cached(path):
+    """ Run program from file through the trajectory cache. Program is
+        compiled on the first run, the next runs stream the cached file
+        without planning.
+    :param path: path to the G-code file.
+    """
+    with open(path, 'rb') as f:
+        program = f.read()
+    encoding = RT_STREAM_ENCODINGS[RT_STREAM_FORMAT]
+    cache = TrajectoryCache(os.path.expanduser(TRAJECTORY_CACHE_DIR),
+                            TRAJECTORY_CACHE_MAX_MB * 1024 * 1024)
+    key = trajectory_key(program, encoding)
+    stream = cache.lookup(key)
+    if stream is None:
+        print('compiling ' + path)
+        lines = program.decode().splitlines()
+        try:
+            stream = cache.store(
+                key, lambda fh: Compiler(fh, encoding).compile(lines))
+        except CompilerException as e:
+            print('ERROR ' + str(e))
+            return
+    else:
+        print('cached ' + stream)
+    with open(RT_STREAM_PATH, 'wb') as fh:
+        size = stream_file(stream, fh)
+    print('OK {} bytes streamed'.format(size))
+
+
 def main():
+    global machine
     logging_config.debug_disable()
+    if len(sys.argv) > 1 and TRAJECTORY_CACHE_DIR is not None \
+            and not SERVO_DIRECT \
+            and RT_STREAM_FORMAT in RT_STREAM_ENCODINGS \
+            and RT_STREAM_PATH is not None:
+        run_cached(sys.argv[1])
+        return
+    machine = GMachine()
     try:
         if len(sys.argv) > 1:
             # Read file with gcode
@@ -53,15 +111,8 @@ def main():
                     if not do_line(line):
                         break
         else:
-            # Main loop for interactive shell
-            # Use stdin/stdout, additional interfaces like
-            # UART, Socket or any other can be added.
-            print("*************** Welcome to PyCNC! ***************")
-            while True:
-                line = raw_input('> ')
-                if line == 'quit' or line == 'exit':
-                    break
-                do_line(line)
+            init_history()
+            interactive()
     except KeyboardInterrupt:
         pass
     print("\r\nExiting...")
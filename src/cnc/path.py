@@ -1,13 +1,37 @@
 from __future__ import division
 import logging
+import numpy as np
 
 from cnc.config import *
 from cnc.coordinates import *
+from cnc.enums import *
 from math import floor
 
 SECONDS_IN_MINUTE = 60.0
 
 
+def velocity_limit_factor(velocity_mm_sec):
+    """ Find the factor which brings velocity of all axises in the limits of
+        maximum velocity for each axis.
+    :param velocity_mm_sec: absolute velocity of each axis.
+    :return: factor in range (0, 1], 1.0 if no axis is out of limits.
+    """
+    k = 1.0
+    if velocity_mm_sec.x * SECONDS_IN_MINUTE > MAX_VELOCITY_MM_PER_MIN_X:
+        k = min(k, MAX_VELOCITY_MM_PER_MIN_X
+                / velocity_mm_sec.x / SECONDS_IN_MINUTE)
+    if velocity_mm_sec.y * SECONDS_IN_MINUTE > MAX_VELOCITY_MM_PER_MIN_Y:
+        k = min(k, MAX_VELOCITY_MM_PER_MIN_Y
+                / velocity_mm_sec.y / SECONDS_IN_MINUTE)
+    if velocity_mm_sec.z * SECONDS_IN_MINUTE > MAX_VELOCITY_MM_PER_MIN_Z:
+        k = min(k, MAX_VELOCITY_MM_PER_MIN_Z
+                / velocity_mm_sec.z / SECONDS_IN_MINUTE)
+    if velocity_mm_sec.e * SECONDS_IN_MINUTE > MAX_VELOCITY_MM_PER_MIN_E:
+        k = min(k, MAX_VELOCITY_MM_PER_MIN_E
+                / velocity_mm_sec.e / SECONDS_IN_MINUTE)
+    return k
+
+
 class PathGenerator:
     """ Stepper motors pulses generator.
         It generates time for each pulses for specified path as accelerated
@@ -47,6 +71,7 @@ class PathGenerator:
         self._linear_time_s = 0.0
         self._2Vmax_per_a = 0.0
         self._delta = delta_mm
+        self._distance = abs(delta_mm)
         self._start_pos = new_pos - delta_mm
         self._end_pos = new_pos
         self._last_iteration = False
@@ -89,19 +114,7 @@ class PathGenerator:
         """
         if not self.AUTO_VELOCITY_ADJUSTMENT:
             return velocity_mm_sec
-        k = 1.0
-        if velocity_mm_sec.x * SECONDS_IN_MINUTE > MAX_VELOCITY_MM_PER_MIN_X:
-            k = min(k, MAX_VELOCITY_MM_PER_MIN_X
-                    / velocity_mm_sec.x / SECONDS_IN_MINUTE)
-        if velocity_mm_sec.y * SECONDS_IN_MINUTE > MAX_VELOCITY_MM_PER_MIN_Y:
-            k = min(k, MAX_VELOCITY_MM_PER_MIN_Y
-                    / velocity_mm_sec.y / SECONDS_IN_MINUTE)
-        if velocity_mm_sec.z * SECONDS_IN_MINUTE > MAX_VELOCITY_MM_PER_MIN_Z:
-            k = min(k, MAX_VELOCITY_MM_PER_MIN_Z
-                    / velocity_mm_sec.z / SECONDS_IN_MINUTE)
-        if velocity_mm_sec.e * SECONDS_IN_MINUTE > MAX_VELOCITY_MM_PER_MIN_E:
-            k = min(k, MAX_VELOCITY_MM_PER_MIN_E
-                    / velocity_mm_sec.e / SECONDS_IN_MINUTE)
+        k = velocity_limit_factor(velocity_mm_sec)
         if k != 1.0:
             logging.warning("Out of speed, multiply velocity by {}".format(k))
         return velocity_mm_sec * k
@@ -124,10 +137,12 @@ class PathGenerator:
                 self.linear_time_s,
                 self.max_velocity_mm_per_sec)
 
-    def __linear(self, i, velocity_mm_per_sec, end_position):
-        """ Helper function for linear movement.
+    def __linear_parameters(self, velocity_mm_per_sec, end_position):
+        """ Helper function which computes the per axis constants of the
+            linear movement profile.
+        :return: Tuple of acceleration, total acceleration distance, total
+                 linear distance and deceleration.
         """
-        t = i * REAL_TIME_DT
         if self.acceleration_steps == 0:
             acceleration = 0
         else:
@@ -143,8 +158,19 @@ class PathGenerator:
         else:
             deceleration = 0
 
+        return (acceleration, total_acceleration_distance,
+                total_linear_distance, deceleration)
+
+    def __linear(self, i, velocity_mm_per_sec, end_position):
+        """ Helper function for linear movement.
+        """
+        t = i * REAL_TIME_DT
+        (acceleration, total_acceleration_distance, total_linear_distance,
+         deceleration) = self.__linear_parameters(velocity_mm_per_sec,
+                                                  end_position)
+
         if i <= self.acceleration_steps:
-            pos = 1/2 * acceleration * t**2
+            pos = 1/2 * acceleration * (t * t)
         elif i <= self.acceleration_steps + self.linear_steps:
             pos = total_acceleration_distance\
                   + velocity_mm_per_sec * (t - self.acceleration_time_s)
@@ -152,12 +178,34 @@ class PathGenerator:
             t_dec = t - (self.acceleration_time_s + self.linear_time_s - REAL_TIME_DT)
             pos = total_acceleration_distance\
                   + total_linear_distance\
-                  + velocity_mm_per_sec * t_dec + 1 / 2 * -deceleration * t_dec ** 2
+                  + velocity_mm_per_sec * t_dec + 1 / 2 * -deceleration * (t_dec * t_dec)
         else:
             pos = end_position
 
         return pos
 
+    def __linear_array(self, i, velocity_mm_per_sec, end_position):
+        """ Vectorized counterpart of __linear() for an array of iterations.
+            Operations are kept in the same order so results are identical.
+        """
+        t = i * REAL_TIME_DT
+        (acceleration, total_acceleration_distance, total_linear_distance,
+         deceleration) = self.__linear_parameters(velocity_mm_per_sec,
+                                                  end_position)
+
+        t_dec = t - (self.acceleration_time_s + self.linear_time_s - REAL_TIME_DT)
+        return np.select(
+            [i <= self.acceleration_steps,
+             i <= self.acceleration_steps + self.linear_steps,
+             i <= self.acceleration_steps + self.linear_steps + self.acceleration_steps],
+            [1/2 * acceleration * (t * t),
+             total_acceleration_distance
+             + velocity_mm_per_sec * (t - self.acceleration_time_s),
+             total_acceleration_distance
+             + total_linear_distance
+             + velocity_mm_per_sec * t_dec + 1 / 2 * -deceleration * (t_dec * t_dec)],
+            end_position)
+
     def _interpolation_function(self, ix, iy, iz, ie):
         """ Get function for interpolation path. This function should returned
             values as it is uniform movement. There is only one trick, function
@@ -172,10 +220,10 @@ class PathGenerator:
                  tuple of times for each axis in us or None if movement for
                  axis is finished.
         """
-        dp_x = self.__linear(ix, self.max_velocity_mm_per_sec.x, self._delta.x)
-        dp_y = self.__linear(iy, self.max_velocity_mm_per_sec.y, self._delta.y)
-        dp_z = self.__linear(iz, self.max_velocity_mm_per_sec.z, self._delta.z)
-        dp_e = self.__linear(ie, self.max_velocity_mm_per_sec.e, self._delta.e)
+        dp_x = self.__linear(ix, self.max_velocity_mm_per_sec.x, self._distance.x)
+        dp_y = self.__linear(iy, self.max_velocity_mm_per_sec.y, self._distance.y)
+        dp_z = self.__linear(iz, self.max_velocity_mm_per_sec.z, self._distance.z)
+        dp_e = self.__linear(ie, self.max_velocity_mm_per_sec.e, self._distance.e)
         return dp_x, dp_y, dp_z, dp_e
 
     def __iter__(self):
@@ -214,7 +262,7 @@ class PathGenerator:
             raise StopIteration
 
         last_position = Coordinates(dp_x, dp_y, dp_z, dp_e)
-        if self._delta == last_position:
+        if self._distance == last_position:
             self._last_iteration = True
 
         if self._delta.x < 0:
@@ -238,6 +286,38 @@ class PathGenerator:
                 self._start_pos.z + dp_z,
                 self._start_pos.e + dp_e)
 
+    def sample_all(self):
+        """ Compute all the samples of the movement at once.
+        :return: contiguous (N, 4) float64 array with the same X, Y, Z and E
+                 positions the iterator yields, one row per REAL_TIME_DT.
+        """
+        distance = self._distance.as_array()
+        velocity = (self.max_velocity_mm_per_sec.x,
+                    self.max_velocity_mm_per_sec.y,
+                    self.max_velocity_mm_per_sec.z,
+                    self.max_velocity_mm_per_sec.e)
+        # after this iteration every axis is clamped to its end position
+        last = int(floor(2 * self.acceleration_steps + self.linear_steps)) + 1
+        i = np.arange(last + 1)
+        dp = np.empty((last + 1, 4))
+        for axis in range(4):
+            dp[:, axis] = self.__linear_array(i, velocity[axis],
+                                              distance[axis])
+
+        # the iterator stops right after the first sample which is equal to
+        # the distance, comparison is done on rounded Coordinates
+        candidates = np.flatnonzero(
+            np.all(np.abs(dp - distance) < 1e-9, axis=1))
+        for n in candidates:
+            if self._distance == Coordinates(*dp[n].tolist()):
+                dp = dp[:n + 1]
+                break
+
+        start = self._start_pos.as_array()
+        sign = (self._delta.x < 0, self._delta.y < 0, self._delta.z < 0,
+                self._delta.e < 0)
+        return np.ascontiguousarray(np.where(sign, -dp, dp) + start)
+
     def total_time_s(self):
         """ Get total time for movement.
         :return: time in seconds.
@@ -257,3 +337,399 @@ class PathGenerator:
         """
         _, _, v = self._get_movement_parameters()
         return v * SECONDS_IN_MINUTE
+
+
+VELOCITY_PROFILES = ('trapezoidal', 'scurve')
+
+
+def trapezoid_profile(v0, v1, max_velocity, distance_mm, acceleration):
+    """ Profile of movement from velocity v0 to velocity v1 with constant
+        acceleration. v1 has to be reachable from v0 on the distance.
+    :return: Tuple of cruise velocity, accelerating time, cruise time and
+             braking time.
+    """
+    vc = max_velocity
+    acceleration_distance = (vc * vc - v0 * v0) / (2.0 * acceleration)
+    braking_distance = (vc * vc - v1 * v1) / (2.0 * acceleration)
+    if acceleration_distance + braking_distance > distance_mm:
+        # not enough space to reach maximum velocity
+        vc = math.sqrt(acceleration * distance_mm + (v0 * v0 + v1 * v1) / 2.0)
+        vc = max(vc, v0, v1)
+        acceleration_distance = (vc * vc - v0 * v0) / (2.0 * acceleration)
+        braking_distance = (vc * vc - v1 * v1) / (2.0 * acceleration)
+    cruise_distance = max(0.0, distance_mm - acceleration_distance
+                          - braking_distance)
+    return (vc, (vc - v0) / acceleration, cruise_distance / vc,
+            (vc - v1) / acceleration)
+
+
+def trapezoid_profile_position(t, v0, v1, profile, distance_mm, acceleration):
+    """ Position along the path of trapezoid_profile().
+    :param t: array of times from the beginning of movement.
+    :param profile: value returned by trapezoid_profile().
+    :return: array of distances from the beginning of movement.
+    """
+    vc, acceleration_time_s, cruise_time_s, braking_time_s = profile
+    t_left = (acceleration_time_s + cruise_time_s + braking_time_s) - t
+    s = np.where(t < acceleration_time_s,
+                 v0 * t + acceleration / 2.0 * (t * t),
+                 np.where(t < acceleration_time_s + cruise_time_s,
+                          (v0 + vc) / 2.0 * acceleration_time_s
+                          + vc * (t - acceleration_time_s),
+                          distance_mm - (v1 * t_left + acceleration / 2.0
+                                         * (t_left * t_left))))
+    return np.clip(s, 0.0, distance_mm)
+
+
+def scurve_times(velocity_change, acceleration, jerk):
+    """ Timings of the jerk limited velocity change. Acceleration grows
+        linearly up to the maximum acceleration, stays constant and then
+        falls linearly to zero. If velocity change is too small to reach the
+        maximum acceleration, there is no constant part.
+    :param velocity_change: velocity change, mm per sec.
+    :param acceleration: maximum acceleration, mm per sec^2.
+    :param jerk: maximum jerk, mm per sec^3.
+    :return: Tuple of time of each of two jerk parts and time of constant
+             acceleration part.
+    """
+    dv = abs(velocity_change)
+    if dv * jerk >= acceleration * acceleration:
+        return acceleration / jerk, dv / acceleration - acceleration / jerk
+    return math.sqrt(dv / jerk), 0.0
+
+
+def scurve_distance(v0, v1, acceleration, jerk):
+    """ Distance of the jerk limited velocity change. The profile is
+        symmetric, so it is just the average velocity multiplied by time.
+    :return: distance in mm.
+    """
+    tj, ta = scurve_times(v1 - v0, acceleration, jerk)
+    return (v0 + v1) / 2.0 * (2.0 * tj + ta)
+
+
+def scurve_position(t, v0, v1, acceleration, jerk):
+    """ Position during the jerk limited velocity change.
+    :param t: array of times from the beginning of velocity change.
+    :return: array of distances from the beginning of velocity change.
+    """
+    tj, ta = scurve_times(v1 - v0, acceleration, jerk)
+    j = jerk if v1 >= v0 else -jerk
+    a = j * tj
+    total = 2.0 * tj + ta
+    v_tj = v0 + a * tj / 2.0
+    s_tj = v0 * tj + j * tj * tj * tj / 6.0
+    t_a = t - tj
+    t_left = total - t
+    return np.where(t < tj, v0 * t + j * (t * t * t) / 6.0,
+                    np.where(t < tj + ta,
+                             s_tj + v_tj * t_a + a / 2.0 * (t_a * t_a),
+                             (v0 + v1) / 2.0 * total - v1 * t_left
+                             + j * (t_left * t_left * t_left) / 6.0))
+
+
+def scurve_reachable_speed(velocity, distance_mm, acceleration, jerk):
+    """ Find the maximum velocity which can be reached from velocity (or the
+        maximum velocity which can be brought down to velocity) on distance.
+    :return: velocity in mm per sec.
+    """
+    low = velocity
+    high = math.sqrt(velocity * velocity + 2.0 * acceleration * distance_mm)
+    while high - low > 1e-9 * high:
+        middle = (low + high) / 2.0
+        if scurve_distance(velocity, middle, acceleration, jerk) <= distance_mm:
+            low = middle
+        else:
+            high = middle
+    return low
+
+
+def scurve_profile(v0, v1, max_velocity, distance_mm, acceleration, jerk):
+    """ Jerk limited profile of movement from velocity v0 to velocity v1.
+        v1 has to be reachable from v0 on the distance.
+    :return: Tuple of cruise velocity, accelerating time, cruise time and
+             braking time.
+    """
+    vc = max_velocity
+    if scurve_distance(v0, vc, acceleration, jerk) \
+            + scurve_distance(vc, v1, acceleration, jerk) > distance_mm:
+        # not enough space to reach maximum velocity
+        low = max(v0, v1)
+        high = vc
+        while high - low > 1e-9 * high:
+            middle = (low + high) / 2.0
+            if scurve_distance(v0, middle, acceleration, jerk) \
+                    + scurve_distance(middle, v1, acceleration, jerk) \
+                    <= distance_mm:
+                low = middle
+            else:
+                high = middle
+        vc = low
+    tj, ta = scurve_times(vc - v0, acceleration, jerk)
+    acceleration_time_s = 2.0 * tj + ta
+    tj, ta = scurve_times(vc - v1, acceleration, jerk)
+    braking_time_s = 2.0 * tj + ta
+    cruise_distance = distance_mm \
+        - scurve_distance(v0, vc, acceleration, jerk) \
+        - scurve_distance(vc, v1, acceleration, jerk)
+    if vc > 0:
+        cruise_time_s = max(0.0, cruise_distance) / vc
+    else:
+        cruise_time_s = 0.0
+    return vc, acceleration_time_s, cruise_time_s, braking_time_s
+
+
+def scurve_profile_position(t, v0, v1, profile, distance_mm, acceleration,
+                            jerk):
+    """ Position along the path of scurve_profile().
+    :param t: array of times from the beginning of movement.
+    :param profile: value returned by scurve_profile().
+    :return: array of distances from the beginning of movement.
+    """
+    vc, acceleration_time_s, cruise_time_s, braking_time_s = profile
+    braking_start_s = acceleration_time_s + cruise_time_s
+    braking_distance = scurve_distance(vc, v1, acceleration, jerk)
+    s = np.where(t < acceleration_time_s,
+                 scurve_position(t, v0, vc, acceleration, jerk),
+                 np.where(t < braking_start_s,
+                          scurve_distance(v0, vc, acceleration, jerk)
+                          + vc * (t - acceleration_time_s),
+                          distance_mm - braking_distance
+                          + scurve_position(t - braking_start_s, vc, v1,
+                                            acceleration, jerk)))
+    return np.clip(s, 0.0, distance_mm)
+
+
+class SCurvePathGenerator(object):
+    """ Jerk limited alternative of PathGenerator. Acceleration isn't
+        switched instantly, it changes with the maximum jerk, so velocity
+        curve looks like letter S. Movement starts and ends with zero
+        velocity like PathGenerator does and is sampled the same way, the
+        first sample is the start position, then samples go every
+        REAL_TIME_DT and the last sample is the end position.
+    """
+
+    def __init__(self, delta_mm, new_pos, velocity_mm_per_min,
+                 jerk_mm_per_s3=TIP_MAX_JERK_MM_PER_S3):
+        """ Create generator for linear interpolation.
+        :param delta_mm: movement distance of each axis.
+        :param new_pos: end position.
+        :param velocity_mm_per_min: desired velocity.
+        :param jerk_mm_per_s3: maximum jerk.
+        """
+        self._delta = delta_mm
+        self._start_pos = new_pos - delta_mm
+        self._end_pos = new_pos
+        self._jerk = jerk_mm_per_s3
+        self._distance_total_mm = delta_mm.length()
+
+        distance_mm = abs(delta_mm)  # type: Coordinates
+        velocity_mm_sec = distance_mm * (velocity_mm_per_min
+                                         / SECONDS_IN_MINUTE
+                                         / self._distance_total_mm)
+        if AUTO_VELOCITY_ADJUSTMENT:
+            k = velocity_limit_factor(velocity_mm_sec)
+            if k != 1.0:
+                logging.warning("Out of speed, multiply velocity by {}"
+                                .format(k))
+                velocity_mm_sec = velocity_mm_sec * k
+        self._profile = scurve_profile(0.0, 0.0, velocity_mm_sec.length(),
+                                       self._distance_total_mm,
+                                       TIP_MAX_ACCELERATION_MM_PER_S2,
+                                       self._jerk)
+        self.max_velocity_mm_per_sec = distance_mm * (
+            self._profile[0] / self._distance_total_mm)
+
+    def sample_all(self):
+        """ Compute all the samples of the movement at once.
+        :return: contiguous (N, 4) float64 array of X, Y, Z and E positions,
+                 one row per REAL_TIME_DT.
+        """
+        total = self.total_time_s()
+        t = REAL_TIME_DT * np.arange(int(math.ceil(total / REAL_TIME_DT)))
+        t = t[t < total]
+        s = scurve_profile_position(t, 0.0, 0.0, self._profile,
+                                    self._distance_total_mm,
+                                    TIP_MAX_ACCELERATION_MM_PER_S2,
+                                    self._jerk)
+        start = self._start_pos.as_array()
+        end = self._end_pos.as_array()
+        unit = (end - start) / self._distance_total_mm
+        return np.ascontiguousarray(np.vstack(
+            (start + s[:, np.newaxis] * unit, end)))
+
+    def __iter__(self):
+        return iter([tuple(row) for row in self.sample_all().tolist()])
+
+    def total_time_s(self):
+        """ Get total time for movement.
+        :return: time in seconds.
+        """
+        _, acceleration_time_s, cruise_time_s, braking_time_s = self._profile
+        return acceleration_time_s + cruise_time_s + braking_time_s
+
+    def delta(self):
+        """ Get overall movement distance.
+        :return: Movement distance for each axis in millimeters.
+        """
+        return self._delta
+
+    def max_velocity(self):
+        """ Get max velocity for each axis.
+        :return: Vector with max velocity(in mm per min) for each axis.
+        """
+        return self.max_velocity_mm_per_sec * SECONDS_IN_MINUTE
+
+
+class ArcPathGenerator(object):
+    """ Circular interpolation in one of the planes, axis which is
+        perpendicular to the plane and E axis move linearly at the same time,
+        so the path can be a helix. Velocity profile is applied to the length
+        of the path, samples are taken the same way as PathGenerator does.
+        If radius of start and end points differ a bit, radius changes
+        linearly along the path.
+    """
+
+    # indexes of the first and the second axis of plane and perpendicular one
+    PLANE_AXES = {PLANE_XY: (0, 1, 2), PLANE_ZX: (2, 0, 1),
+                  PLANE_YZ: (1, 2, 0)}
+
+    def __init__(self, start_pos, new_pos, center_offset, plane, direction,
+                 velocity_mm_per_min, profile=None):
+        """ Create generator for circular interpolation.
+        :param start_pos: start position.
+        :param new_pos: end position.
+        :param center_offset: center of the circle relative to start position
+                              (I, J and K values).
+        :param plane: PLANE_XY, PLANE_ZX or PLANE_YZ.
+        :param direction: CW or CCW.
+        :param velocity_mm_per_min: desired velocity along the path.
+        :param profile: one of VELOCITY_PROFILES, VELOCITY_PROFILE if None.
+        """
+        if profile is None:
+            profile = VELOCITY_PROFILE
+        if profile not in VELOCITY_PROFILES:
+            raise ValueError("Unknown velocity profile {}".format(profile))
+        self._jerk = TIP_MAX_JERK_MM_PER_S3 if profile == 'scurve' else None
+        self._delta = new_pos - start_pos
+        self._start = start_pos.as_array()
+        self._end = new_pos.as_array()
+        self._axes = self.PLANE_AXES[plane]
+        a, b, h = self._axes
+        offset = (center_offset.x, center_offset.y, center_offset.z)
+        self._center = (self._start[a] + offset[a], self._start[b] + offset[b])
+        self.radius = math.hypot(offset[a], offset[b])
+        self.end_radius = math.hypot(self._end[a] - self._center[0],
+                                     self._end[b] - self._center[1])
+        self._start_angle = math.atan2(-offset[b], -offset[a])
+        end_angle = math.atan2(self._end[b] - self._center[1],
+                               self._end[a] - self._center[0])
+        # full circle if start and end angles are equal
+        sweep = end_angle - self._start_angle
+        if direction == CCW:
+            if sweep <= 1e-12:
+                sweep += 2.0 * math.pi
+        else:
+            if sweep >= -1e-12:
+                sweep -= 2.0 * math.pi
+        self.sweep_angle = sweep
+
+        arc_mm = abs(sweep) * (self.radius + self.end_radius) / 2.0
+        linear_mm = self._end[[h, 3]] - self._start[[h, 3]]
+        self.length_mm = math.sqrt(arc_mm * arc_mm
+                                   + float(np.dot(linear_mm, linear_mm)))
+
+        # tangent velocity of plane axes is never more than arc velocity
+        velocity = velocity_mm_per_min / SECONDS_IN_MINUTE / self.length_mm
+        axis_velocity = [0.0, 0.0, 0.0, 0.0]
+        axis_velocity[a] = axis_velocity[b] = arc_mm * velocity
+        axis_velocity[h] = abs(linear_mm[0]) * velocity
+        axis_velocity[3] = abs(linear_mm[1]) * velocity
+        axis_velocity = Coordinates(*axis_velocity)
+        if AUTO_VELOCITY_ADJUSTMENT:
+            k = velocity_limit_factor(axis_velocity)
+            if k != 1.0:
+                logging.warning("Out of speed, multiply velocity by {}"
+                                .format(k))
+                axis_velocity = axis_velocity * k
+                velocity *= k
+        self.max_velocity_mm_per_sec = axis_velocity
+        if self._jerk is None:
+            self._profile = trapezoid_profile(
+                0.0, 0.0, velocity * self.length_mm, self.length_mm,
+                TIP_MAX_ACCELERATION_MM_PER_S2)
+        else:
+            self._profile = scurve_profile(
+                0.0, 0.0, velocity * self.length_mm, self.length_mm,
+                TIP_MAX_ACCELERATION_MM_PER_S2, self._jerk)
+
+    def sample_all(self):
+        """ Compute all the samples of the movement at once.
+        :return: contiguous (N, 4) float64 array of X, Y, Z and E positions,
+                 one row per REAL_TIME_DT.
+        """
+        total = self.total_time_s()
+        t = REAL_TIME_DT * np.arange(int(math.ceil(total / REAL_TIME_DT)))
+        t = t[t < total]
+        if self._jerk is None:
+            s = trapezoid_profile_position(t, 0.0, 0.0, self._profile,
+                                           self.length_mm,
+                                           TIP_MAX_ACCELERATION_MM_PER_S2)
+        else:
+            s = scurve_profile_position(t, 0.0, 0.0, self._profile,
+                                        self.length_mm,
+                                        TIP_MAX_ACCELERATION_MM_PER_S2,
+                                        self._jerk)
+        samples = np.empty((len(t) + 1, 4))
+        samples[:-1] = self.points(s / self.length_mm)
+        samples[-1] = self._end
+        return samples
+
+    def points(self, u):
+        """ Compute positions on the path.
+        :param u: np.array(N,) of fractions of the path, 0 is the start and
+                  1 is the end.
+        :return: (N, 4) float64 array of X, Y, Z and E positions.
+        """
+        angle = self._start_angle + self.sweep_angle * u
+        radius = self.radius + (self.end_radius - self.radius) * u
+        a, b, h = self._axes
+        points = self._start + u[:, np.newaxis] * (self._end - self._start)
+        points[:, a] = self._center[0] + radius * np.cos(angle)
+        points[:, b] = self._center[1] + radius * np.sin(angle)
+        return points
+
+    def __iter__(self):
+        return iter([tuple(row) for row in self.sample_all().tolist()])
+
+    def total_time_s(self):
+        """ Get total time for movement.
+        :return: time in seconds.
+        """
+        _, acceleration_time_s, cruise_time_s, braking_time_s = self._profile
+        return acceleration_time_s + cruise_time_s + braking_time_s
+
+    def delta(self):
+        """ Get overall movement distance.
+        :return: Movement distance for each axis in millimeters.
+        """
+        return self._delta
+
+    def max_velocity(self):
+        """ Get max velocity for each axis.
+        :return: Vector with max velocity(in mm per min) for each axis.
+        """
+        return self.max_velocity_mm_per_sec * SECONDS_IN_MINUTE
+
+
+def path_generator(delta_mm, new_pos, velocity_mm_per_min, profile=None):
+    """ Create generator for linear interpolation with velocity profile.
+    :param profile: one of VELOCITY_PROFILES, VELOCITY_PROFILE if None.
+    :return: PathGenerator or SCurvePathGenerator object.
+    """
+    if profile is None:
+        profile = VELOCITY_PROFILE
+    if profile == 'trapezoidal':
+        return PathGenerator(delta_mm, new_pos, velocity_mm_per_min)
+    if profile == 'scurve':
+        return SCurvePathGenerator(delta_mm, new_pos, velocity_mm_per_min)
+    raise ValueError("Unknown velocity profile {}".format(profile))
@@ -0,0 +1,255 @@
+from __future__ import division
+import logging
+import math
+from collections import deque
+
+import numpy as np
+
+from cnc.config import *
+from cnc.coordinates import *
+from cnc.path import *
+
+
+class PlannedSegment(object):
+    """ Linear movement which is a part of a chain of movements.
+        Unlike PathGenerator, movement doesn't have to start and end with
+        zero velocity, entry and exit velocities are set by LookaheadPlanner.
+        Velocity profile is trapezoidal along the path:
+            v(t) = v_entry + a * t          while accelerating
+            v(t) = v_cruise                 while cruising
+            v(t) = v_exit + a * (T - t)     while braking
+        Samples are taken every REAL_TIME_DT over the whole chain, so the
+        first sample of a segment is shifted by the time which was left
+        from the previous segment (phase_s).
+        With jerk_mm_per_s3 set, velocity changes are jerk limited, see
+        SCurvePathGenerator.
+    """
+
+    def __init__(self, delta_mm, new_pos, velocity_mm_per_min,
+                 jerk_mm_per_s3=None):
+        """ Create linear movement.
+        :param delta_mm: movement distance of each axis.
+        :param new_pos: end position.
+        :param velocity_mm_per_min: desired velocity.
+        :param jerk_mm_per_s3: maximum jerk, None for trapezoidal profile.
+        """
+        self._jerk = jerk_mm_per_s3
+        self._delta = delta_mm
+        self._start_pos = new_pos - delta_mm
+        self._end_pos = new_pos
+        self.length_mm = delta_mm.length()
+        self.unit = delta_mm.as_array() / self.length_mm
+
+        distance_mm = abs(delta_mm)  # type: Coordinates
+        axis_velocity = distance_mm * (velocity_mm_per_min / SECONDS_IN_MINUTE
+                                       / self.length_mm)
+        if AUTO_VELOCITY_ADJUSTMENT:
+            k = velocity_limit_factor(axis_velocity)
+            if k != 1.0:
+                logging.warning("Out of speed, multiply velocity by {}"
+                                .format(k))
+                axis_velocity = axis_velocity * k
+        self._axis_velocity_mm_per_sec = axis_velocity
+        self.nominal_speed = axis_velocity.length()
+
+        # set by the planner
+        self.max_entry_speed = 0.0
+        self.entry_speed = 0.0
+        self.exit_speed = 0.0
+        self.phase_s = 0.0
+        self.last = True
+        # line of the program, set by GMachine
+        self.source_line = None
+
+    def _profile(self):
+        """ Compute velocity profile for current entry and exit velocities.
+        :return: Tuple of cruise velocity, acceleration time, cruise time and
+                 braking time.
+        """
+        a = TIP_MAX_ACCELERATION_MM_PER_S2
+        v0 = self.entry_speed
+        v1 = self.exit_speed
+        vc = self.nominal_speed
+        if self._jerk is not None:
+            return scurve_profile(v0, v1, vc, self.length_mm, a, self._jerk)
+        return trapezoid_profile(v0, v1, vc, self.length_mm, a)
+
+    def reachable_speed(self, speed):
+        """ Get the maximum velocity at one end of the movement which can be
+            reached from or brought down to velocity at the other end.
+        :param speed: velocity at the other end, mm per sec.
+        :return: velocity in mm per sec.
+        """
+        if self._jerk is not None:
+            return scurve_reachable_speed(speed, self.length_mm,
+                                          TIP_MAX_ACCELERATION_MM_PER_S2,
+                                          self._jerk)
+        return math.sqrt(speed * speed + 2.0 * TIP_MAX_ACCELERATION_MM_PER_S2
+                         * self.length_mm)
+
+    def _sample_times(self):
+        """ Times of samples from the beginning of movement. The last movement
+            of a chain also gets a sample at the very end.
+        """
+        total = self.total_time_s()
+        n = max(0, int(math.ceil((total - self.phase_s) / REAL_TIME_DT)))
+        t = self.phase_s + REAL_TIME_DT * np.arange(n)
+        t = t[t < total]
+        if self.last:
+            t = np.append(t, total)
+        return t
+
+    def next_phase_s(self):
+        """ Get the time of the first sample of the next movement.
+        :return: time in seconds from the beginning of the next movement.
+        """
+        if self.last:
+            return 0.0
+        n = len(self._sample_times())
+        return max(0.0, self.phase_s + n * REAL_TIME_DT - self.total_time_s())
+
+    def sample_all(self):
+        """ Compute all the samples of the movement at once.
+        :return: contiguous (N, 4) float64 array of X, Y, Z and E positions,
+                 one row per REAL_TIME_DT.
+        """
+        a = TIP_MAX_ACCELERATION_MM_PER_S2
+        v0 = self.entry_speed
+        v1 = self.exit_speed
+        profile = self._profile()
+        t = self._sample_times()
+        if self._jerk is not None:
+            s = scurve_profile_position(t, v0, v1, profile, self.length_mm,
+                                        a, self._jerk)
+        else:
+            s = trapezoid_profile_position(t, v0, v1, profile,
+                                           self.length_mm, a)
+        start = self._start_pos.as_array()
+        samples = start + s[:, np.newaxis] * self.unit
+        if self.last and len(samples):
+            samples[-1] = self._end_pos.as_array()
+        return np.ascontiguousarray(samples)
+
+    def __iter__(self):
+        return iter([tuple(row) for row in self.sample_all().tolist()])
+
+    def total_time_s(self):
+        """ Get total time for movement.
+        :return: time in seconds.
+        """
+        _, t_acc, t_cruise, t_brake = self._profile()
+        return t_acc + t_cruise + t_brake
+
+    def delta(self):
+        """ Get overall movement distance.
+        :return: Movement distance for each axis in millimeters.
+        """
+        return self._delta
+
+    def max_velocity(self):
+        """ Get max velocity for each axis.
+        :return: Vector with max velocity(in mm per min) for each axis.
+        """
+        return self._axis_velocity_mm_per_sec * SECONDS_IN_MINUTE
+
+
+class LookaheadPlanner(object):
+    """ Queue of linear movements which plans velocity at the junctions of
+        movements, so the chain of movements doesn't stop at each vertex.
+        Junction velocity is the velocity of movement through the circle
+        which is tangent to both movements and deviates from the corner by
+        junction_deviation_mm with centripetal acceleration of
+        TIP_MAX_ACCELERATION_MM_PER_S2:
+            v = sqrt(a * d * sin(theta/2) / (1 - sin(theta/2)))
+        where theta is the angle between movements. Velocities are limited
+        with the backward pass, so the chain always can stop at the end of the
+        last queued movement, and with the forward pass, so each movement
+        can reach its exit velocity with maximum acceleration.
+        Movements are returned to the caller when they can't be changed
+        anymore, i.e. queue is longer than depth, or on flush().
+    """
+
+    def __init__(self, depth=LOOKAHEAD_SEGMENTS,
+                 junction_deviation_mm=JUNCTION_DEVIATION_MM):
+        """ Create planner.
+        :param depth: number of movements to look ahead.
+        :param junction_deviation_mm: maximum deviation from a corner.
+        """
+        self._depth = max(1, depth)
+        self._junction_deviation_mm = junction_deviation_mm
+        self._queue = deque()
+        # velocity and sample phase at the end of the last returned movement
+        self._speed = 0.0
+        self._phase_s = 0.0
+
+    def _junction_speed(self, previous, segment):
+        limit = min(previous.nominal_speed, segment.nominal_speed)
+        cos_theta = -float(np.dot(previous.unit, segment.unit))
+        if cos_theta > 0.999999:  # movement reverses
+            return 0.0
+        if cos_theta < -0.999999:  # straight line
+            return limit
+        sin_theta_d2 = math.sqrt(0.5 * (1.0 - cos_theta))
+        speed = math.sqrt(TIP_MAX_ACCELERATION_MM_PER_S2
+                          * self._junction_deviation_mm * sin_theta_d2
+                          / (1.0 - sin_theta_d2))
+        return min(speed, limit)
+
+    def _recalculate(self):
+        # backward pass, stop at the end of the last movement
+        exit_speed = 0.0
+        for segment in reversed(self._queue):
+            segment.exit_speed = exit_speed
+            segment.entry_speed = min(segment.max_entry_speed,
+                                      segment.reachable_speed(exit_speed))
+            exit_speed = segment.entry_speed
+        # forward pass, start with the velocity already committed
+        speed = self._speed
+        for segment in self._queue:
+            segment.entry_speed = min(segment.entry_speed, speed)
+            segment.exit_speed = min(segment.exit_speed,
+                                     segment.reachable_speed(
+                                         segment.entry_speed))
+            speed = segment.exit_speed
+
+    def _pop(self):
+        segment = self._queue.popleft()
+        segment.phase_s = self._phase_s
+        segment.last = len(self._queue) == 0
+        self._speed = segment.exit_speed
+        self._phase_s = segment.next_phase_s()
+        return segment
+
+    def append(self, segment):
+        """ Add movement to the queue.
+        :param segment: PlannedSegment object.
+        :return: list of movements which are ready to run.
+        """
+        if self._queue:
+            segment.max_entry_speed = self._junction_speed(self._queue[-1],
+                                                           segment)
+        else:
+            segment.max_entry_speed = 0.0
+        self._queue.append(segment)
+        self._recalculate()
+        ready = []
+        while len(self._queue) > self._depth:
+            ready.append(self._pop())
+        return ready
+
+    def flush(self):
+        """ Plan the stop at the end of the last queued movement.
+        :return: list of all queued movements.
+        """
+        ready = []
+        while self._queue:
+            ready.append(self._pop())
+        self._speed = 0.0
+        self._phase_s = 0.0
+        return ready
+
+    def empty(self):
+        """ Check if there are no queued movements.
+        :return: boolean value.
+        """
+        return len(self._queue) == 0
@@ -0,0 +1,262 @@
+""" Binary angle stream between the planner and realTimePlayer.
+
+The stream is a fixed size little endian header followed by one frame per
+REAL_TIME_DT. Each frame holds three values, one per motor:
+
+    offset  size  field
+    0       4     magic, b'RPDS'
+    4       2     version
+    6       2     header size in bytes
+    8       2     frame encoding, ENCODING_ANGLE or ENCODING_DUTY
+    10      2     number of channels, always 3
+    12      4     sample period in nanoseconds
+    16      12    motor offsets in radians, 3 x float32
+    28      4     duty model slope in nanoseconds per radian, float32
+    32      4     duty model intercept in nanoseconds, float32
+    36      4     minimum pulse width in nanoseconds
+    40      4     maximum pulse width in nanoseconds
+    44      4     flags, FLAG_CALIBRATED
+
+With ENCODING_ANGLE frames are 3 x float32 servo angles (motor offset
+already applied, the same values as the text 'rt-cmd:POS' lines). With
+ENCODING_DUTY frames are 3 x uint32 duty cycles in nanoseconds, computed
+with the duty model of the header and clamped to its pulse widths, so the
+player only copies integers. The player clamps duty cycles of angle frames
+the same way.
+FLAG_CALIBRATED means that servos have calibration tables (see
+SERVO_CALIBRATION_PATH) instead of the duty model of the header. Duty
+cycles are computed with the tables then, angle streams need the player
+to load the same tables.
+Frames are written until the end of the stream, there is no frame count
+so the stream can be piped.
+"""
+
+import struct
+import sys
+import numpy as np
+
+from cnc.config import *
+from servo.calibration import ServoCalibration
+
+STREAM_MAGIC = b'RPDS'
+STREAM_VERSION = 1
+
+ENCODING_ANGLE = 0
+ENCODING_DUTY = 1
+
+FLAG_CALIBRATED = 1
+
+HEADER_FORMAT = '<4sHHHHI3fffIII'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+CHANNELS = 3
+
+FRAME_DTYPES = {ENCODING_ANGLE: np.dtype('<f4'),
+                ENCODING_DUTY: np.dtype('<u4')}
+FRAME_SIZE = CHANNELS * 4
+
+
+class RtStreamException(Exception):
+    """ Exceptions while reading or writing the angle stream.
+    """
+    pass
+
+
+# calibration tables by path, files are read once
+_calibrations = {}
+
+
+def servo_calibration():
+    """ Get calibration tables of servos.
+    :return: ServoCalibration object loaded from SERVO_CALIBRATION_PATH, None
+             if it isn't set.
+    """
+    if SERVO_CALIBRATION_PATH is None:
+        return None
+    calibration = _calibrations.get(SERVO_CALIBRATION_PATH)
+    if calibration is None:
+        calibration = ServoCalibration.load(SERVO_CALIBRATION_PATH)
+        _calibrations[SERVO_CALIBRATION_PATH] = calibration
+    return calibration
+
+
+def encode_header(encoding):
+    """ Build the stream header from the machine configuration.
+    :param encoding: ENCODING_ANGLE or ENCODING_DUTY.
+    :return: bytes of the header.
+    """
+    if encoding not in FRAME_DTYPES:
+        raise RtStreamException("unknown encoding {}".format(encoding))
+    return struct.pack(HEADER_FORMAT, STREAM_MAGIC, STREAM_VERSION,
+                       HEADER_SIZE, encoding, CHANNELS,
+                       int(round(REAL_TIME_DT * 1e9)),
+                       MOTOR0_OFFSET_RAD, MOTOR1_OFFSET_RAD, MOTOR2_OFFSET_RAD,
+                       SERVO_MODEL_SLOPE_NS_PER_RAD,
+                       SERVO_MODEL_INTERCEPT_NS,
+                       int(SERVO_PULSE_MIN_NS), int(SERVO_PULSE_MAX_NS),
+                       0 if SERVO_CALIBRATION_PATH is None
+                       else FLAG_CALIBRATED)
+
+
+def decode_header(data):
+    """ Parse the stream header.
+    :param data: bytes starting with the header.
+    :return: dict with header fields.
+    """
+    if len(data) < HEADER_SIZE:
+        raise RtStreamException("stream header is truncated")
+    (magic, version, header_size, encoding, channels, dt_ns,
+     offset0, offset1, offset2, slope, intercept, pulse_min, pulse_max,
+     flags) = struct.unpack_from(HEADER_FORMAT, data)
+    if magic != STREAM_MAGIC:
+        raise RtStreamException("not an angle stream")
+    if version != STREAM_VERSION or channels != CHANNELS \
+            or encoding not in FRAME_DTYPES or pulse_min > pulse_max:
+        raise RtStreamException("unsupported angle stream")
+    return {'header_size': header_size,
+            'encoding': encoding,
+            'dt_s': dt_ns / 1e9,
+            'motor_offset_rad': (offset0, offset1, offset2),
+            'model_slope': slope,
+            'model_intercept': intercept,
+            'pulse_min': pulse_min,
+            'pulse_max': pulse_max,
+            'flags': flags}
+
+
+def angles_to_duty(angles, slope=None, intercept=None, calibration=None,
+                   pulse_min=None, pulse_max=None):
+    """ Convert servo angles to duty cycles the same way realTimePlayer does
+        for the text stream: float32 angle, linear model clamped to the
+        pulse limits or calibration table, truncation.
+    :param angles: (N, 3) array of servo angles in radians.
+    :param slope: duty model slope, header value by default.
+    :param intercept: duty model intercept, header value by default.
+    :param calibration: ServoCalibration object which is used instead of
+                        the model if not None.
+    :param pulse_min: minimum pulse width in nanoseconds, header value by
+                      default.
+    :param pulse_max: maximum pulse width in nanoseconds, header value by
+                      default.
+    :return: (N, 3) uint32 array of duty cycles in nanoseconds.
+    """
+    if calibration is not None:
+        return calibration.to_duty(angles)
+    if slope is None:
+        slope = float(np.float32(SERVO_MODEL_SLOPE_NS_PER_RAD))
+    if intercept is None:
+        intercept = float(np.float32(SERVO_MODEL_INTERCEPT_NS))
+    if pulse_min is None:
+        pulse_min = int(SERVO_PULSE_MIN_NS)
+    if pulse_max is None:
+        pulse_max = int(SERVO_PULSE_MAX_NS)
+    angles = np.asarray(angles, dtype=np.float32).astype(np.float64)
+    return np.clip(slope * angles + intercept, pulse_min,
+                   pulse_max).astype(np.uint32)
+
+
+def encode_frames(angles, encoding):
+    """ Pack servo angles into stream frames.
+    :param angles: (N, 3) array of servo angles in radians.
+    :param encoding: ENCODING_ANGLE or ENCODING_DUTY.
+    :return: bytes of the frames.
+    """
+    if encoding == ENCODING_DUTY:
+        frames = angles_to_duty(angles, calibration=servo_calibration())
+    else:
+        frames = np.asarray(angles)
+    return np.ascontiguousarray(frames,
+                                dtype=FRAME_DTYPES[encoding]).tobytes()
+
+
+def decode_frames(data, header):
+    """ Unpack stream frames.
+    :param data: bytes of the frames, header excluded.
+    :param header: dict returned by decode_header().
+    :return: (N, 3) array, float32 angles or uint32 duty cycles.
+    """
+    if len(data) % FRAME_SIZE != 0:
+        raise RtStreamException("stream is truncated")
+    return np.frombuffer(data, dtype=FRAME_DTYPES[header['encoding']]) \
+        .reshape(-1, CHANNELS)
+
+
+def read_stream(data):
+    """ Parse a whole binary stream.
+    :param data: bytes or memory map of the stream.
+    :return: tuple of header dict and (N, 3) frames array.
+    """
+    header = decode_header(data)
+    return header, decode_frames(data[header['header_size']:], header)
+
+
+class RtStreamWriter(object):
+    """ Write the binary angle stream to a file object in bulk.
+    """
+    def __init__(self, fh, encoding):
+        """ Create writer, the header is written immediately.
+        :param fh: binary file object.
+        :param encoding: ENCODING_ANGLE or ENCODING_DUTY.
+        """
+        self._fh = fh
+        self._encoding = encoding
+        self._fh.write(encode_header(encoding))
+
+    def write(self, angles):
+        """ Write frames.
+        :param angles: (N, 3) array of servo angles in radians.
+        """
+        self._fh.write(encode_frames(angles, self._encoding))
+
+    def flush(self):
+        self._fh.flush()
+
+    def close(self):
+        self._fh.close()
+
+
+# line of the text stream, realTimePlayer skips lines of other formats
+TEXT_LINE = 'rt-cmd:POS %f %f %f\n'
+
+
+def format_text_frames(values, line=TEXT_LINE):
+    """ Format frames of the text stream at once.
+    :param values: (N, 3) array of values, servo angles for the stream.
+    :param line: printf-style format of one line with three values.
+    :return: string with N lines.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    return (line * len(values)) % tuple(values.ravel().tolist())
+
+
+class RtTextWriter(object):
+    """ Write the text stream to a file object, one write per movement.
+    """
+    def __init__(self, fh=None, line=TEXT_LINE):
+        """ Create writer.
+        :param fh: text file object, sys.stdout at the moment of each write
+                   if None.
+        :param line: printf-style format of one line with three values.
+        """
+        self._fh = fh
+        self._line = line
+
+    def _file(self):
+        return sys.stdout if self._fh is None else self._fh
+
+    def write(self, values):
+        """ Write frames.
+        :param values: (N, 3) array of values, servo angles for the stream.
+        """
+        if len(values):
+            self._file().write(format_text_frames(values, self._line))
+
+    def flush(self):
+        self._file().flush()
+
+    def close(self):
+        """ Close file, sys.stdout is only flushed.
+        """
+        if self._fh is None:
+            sys.stdout.flush()
+        else:
+            self._fh.close()
@@ -1,5 +1,6 @@
 import os
 import fcntl
+import stat
 import struct
 import time
 import atexit
@@ -7,80 +8,198 @@ import threading
 
 ADS111x_ADDRESS = 0x48
 I2C_SLAVE = 0x0703
+I2C_DEVICE = "/dev/i2c-1"
 
+# registers
+CONVERSION_REGISTER = 0x00
+CONFIG_REGISTER = 0x01
 
-class __I2CDev(object):
-    def __init__(self):
-        self._os_close = os.close
-        # Initialize i2c interface and register it for closing on exit.
-        self._dev = os.open("/dev/i2c-1", os.O_SYNC | os.O_RDWR)
-        if self._dev < 0:
-            raise ImportError("i2c device not found")
-        else:
-            if fcntl.ioctl(self._dev, I2C_SLAVE, ADS111x_ADDRESS) < 0:
-                self._close()
-                raise ImportError("Failed to set up i2c address")
-            else:
-                atexit.register(self._close)
+# config register fields, +-4.096V range, AINN = GND, comparator disabled
+CONFIG_START = 0x8000
+CONFIG_SINGLE_SHOT = 0x0100
+CONFIG_BASE = 0x0203
 
-    def _close(self):
-        self._os_close(self._dev)
+# data rate in samples per second and its config bits
+DATA_RATES = {8: 0x0000, 16: 0x0020, 32: 0x0040, 64: 0x0060, 128: 0x0080,
+              250: 0x00A0, 475: 0x00C0, 860: 0x00E0}
+DEFAULT_DATA_RATE = 128
+# conversion takes up to 10% longer than its nominal period
+CONVERSION_MARGIN = 1.1
+
+
+def _config(channel, single_shot, data_rate):
+    if channel < 0 or channel > 3:
+        raise ValueError("Wrong channel")
+    if data_rate not in DATA_RATES:
+        raise ValueError("Wrong data rate")
+    config = CONFIG_BASE | ((0b100 | channel) << 12) | DATA_RATES[data_rate]
+    if single_shot:
+        config |= CONFIG_START | CONFIG_SINGLE_SHOT
+    return struct.pack(">BH", CONFIG_REGISTER, config)
+
+
+def _to_volts(data):
+    # / 32768.0 * 4.096 according to specified range
+    return struct.unpack(">h", data)[0] / 8000.0
+
+
+class I2CDev(object):
+    """ i2c device file. It is opened on the first use, so the module can be
+        imported without the chip. Any file which supports read and write,
+        like a fake device file or pipe, can replace the device, the slave
+        address is set only for character devices.
+    """
+    def __init__(self, path=I2C_DEVICE, address=ADS111x_ADDRESS):
+        self._path = path
+        self._address = address
+        self._dev = None
+        # mutex for multi threading requests, held for whole transactions
+        self.lock = threading.RLock()
+
+    def _open(self):
+        dev = os.open(self._path, os.O_SYNC | os.O_RDWR)
+        try:
+            if stat.S_ISCHR(os.fstat(dev).st_mode):
+                fcntl.ioctl(dev, I2C_SLAVE, self._address)
+        except (IOError, OSError):
+            os.close(dev)
+            raise
+        self._dev = dev
+        atexit.register(self.close)
+
+    def close(self):
+        if self._dev is not None:
+            os.close(self._dev)
+            self._dev = None
 
     def write(self, data):
+        if self._dev is None:
+            self._open()
         os.write(self._dev, data)
 
     def read(self, n):
+        if self._dev is None:
+            self._open()
         return os.read(self._dev, n)
 
-i2c = __I2CDev()
 
-# mutex for multi threading requests
-lock = threading.Lock()
+i2c = I2CDev()
 
 
-def measure(channel):
+def measure(channel, device=None):
     """
-    Measure voltage on chip input.
+    Measure voltage on chip input with single shot conversion.
     Raises OSError(Errno 121) "Remote I/O error" on reading error.
     Thread safe.
     :param channel: chip channel to use.
+    :param device: I2CDev object, default i2c device if None.
     :return: Voltage in Volts.
     """
-    global i2c
-    if channel < 0 or channel > 3:
-        raise ValueError("Wrong channel")
-    lock.acquire()
-    # configure
-    data = struct.pack(">BH",
-                       0x01,  # config register
-                       # single shot mode, +-4.096V, AINN = GND
-                       ((0b100 | channel) << 12) | 0x8380
-                       )
-    i2c.write(data)
-    # wait for conversion
-    while True:
-        i2c.write(struct.pack("B", 0x01))
-        if struct.unpack(">H", i2c.read(2))[0] & 0x8000 != 0:
-            break
-        time.sleep(0.0001)
-    # read result
-    i2c.write(struct.pack("B", 0x00))  # conversion register
-    v = struct.unpack(">h", i2c.read(2))[0]
-    lock.release()
-    return v / 8000.0  # / 32768.0 * 4.096 according to specified range
+    dev = i2c if device is None else device
+    with dev.lock:
+        dev.write(_config(channel, True, DEFAULT_DATA_RATE))
+        time.sleep(CONVERSION_MARGIN / DEFAULT_DATA_RATE)
+        # wait for conversion
+        while True:
+            dev.write(struct.pack("B", CONFIG_REGISTER))
+            if struct.unpack(">H", dev.read(2))[0] & CONFIG_START != 0:
+                break
+            time.sleep(0.0001)
+        # read result
+        dev.write(struct.pack("B", CONVERSION_REGISTER))
+        return _to_volts(dev.read(2))
+
+
+class Sampler(object):
+    """ Background thread which measures channels in turn with continuous
+        conversion mode. Switching channel restarts conversion, so each
+        measurement is one config write, waiting for the conversion time of
+        the data rate, which is when the chip would assert ALERT/RDY, and one
+        conversion register read, without polling.
+        The latest value of each channel is published with its timestamp,
+        readers don't take any locks.
+    """
+    def __init__(self, channels=(0, 1, 2, 3), device=None,
+                 data_rate=DEFAULT_DATA_RATE):
+        """ Create sampler, it doesn't start until start() is called.
+        :param channels: chip channels to measure.
+        :param device: I2CDev object or path of i2c device file, default i2c
+                       device if None.
+        :param data_rate: conversion rate, one of DATA_RATES keys.
+        """
+        if device is None:
+            device = i2c
+        elif isinstance(device, str):
+            device = I2CDev(device)
+        self._dev = device
+        self._configs = [(channel, _config(channel, False, data_rate))
+                         for channel in channels]
+        self._conversion_s = CONVERSION_MARGIN / data_rate
+        # (voltage, monotonic time) per channel, replaced as a whole
+        self._values = [None] * 4
+        self._stop = threading.Event()
+        self._thread = None
+        self.error = None
 
+    def start(self):
+        """ Start sampling in background thread.
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop,
+                                        name="ads111x sampler")
+        self._thread.daemon = True
+        self._thread.start()
 
-# check if ads111x is connected
-try:
-    measure(0)
-except OSError:
-    raise ImportError("ads111x is not connected")
+    def stop(self):
+        """ Stop sampling and wait for the thread.
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _convert(self, config):
+        dev = self._dev
+        with dev.lock:
+            dev.write(config)
+            time.sleep(self._conversion_s)
+            dev.write(struct.pack("B", CONVERSION_REGISTER))
+            return _to_volts(dev.read(2))
+
+    def _loop(self):
+        while not self._stop.is_set():
+            for channel, config in self._configs:
+                try:
+                    v = self._convert(config)
+                except (IOError, OSError) as e:
+                    self.error = e
+                    # don't spin on the broken bus
+                    self._stop.wait(self._conversion_s)
+                    continue
+                self._values[channel] = (v, time.monotonic())
+                if self._stop.is_set():
+                    break
+
+    def latest(self, channel):
+        """ Get the latest measurement of channel.
+        :param channel: chip channel.
+        :return: Tuple of voltage in Volts and time.monotonic() of the
+                 measurement, None if channel wasn't measured yet.
+        """
+        return self._values[channel]
 
 
 # for test purpose
 if __name__ == "__main__":
+    sampler = Sampler()
+    sampler.start()
     while True:
+        time.sleep(0.5)
         for i in range(0, 4):
-            print(str(i), measure(i))
+            print(str(i), sampler.latest(i))
+        if sampler.error is not None:
+            print(sampler.error)
         print("-----------------------------")
-        time.sleep(0.5)
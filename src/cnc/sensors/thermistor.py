@@ -30,8 +30,10 @@ from __future__ import division
 import math
 import time
 
+import numpy as np
+
 try:
-    import ads111x as adc
+    from cnc.sensors import ads111x as adc
 except ImportError:
     print("---- ads111x is not detected ----")
     adc = None
@@ -49,23 +51,138 @@ R1 = 4700
 
 Rinf = R0 * math.exp(-BETA / (T0 + CELSIUS_TO_KELVIN))
 
+# Voltage to temperature table covers this range of temperatures, voltages
+# out of it are converted with the Beta equation.
+TABLE_MIN_T = -40
+TABLE_MAX_T = 400
+TABLE_SIZE = 1024
+
+# Readings of each channel are filtered with moving 'median' or 'mean' of
+# FILTER_SIZE latest readings, glitches are skipped.
+FILTER_KIND = 'median'
+FILTER_SIZE = 5
+
+
+def _beta_temperature(v):
+    """ Convert voltages to temperatures with the Beta equation.
+    :param v: np.array of voltages in range (0, Vcc).
+    :return: np.array of temperatures in Celsius.
+    """
+    r = v * R1 / (Vcc - v)
+    return (BETA / np.log(r / Rinf)) - CELSIUS_TO_KELVIN
+
+
+def _temperature_voltage(t):
+    r = Rinf * math.exp(BETA / (t + CELSIUS_TO_KELVIN))
+    return Vcc * r / (r + R1)
+
+
+def build_table(size=TABLE_SIZE, min_t=TABLE_MIN_T, max_t=TABLE_MAX_T):
+    """ Compute voltage to temperature table with uniform temperature steps,
+        so the steep ends of the curve get as many points as the middle.
+    :param size: number of points.
+    :param min_t: the lowest temperature in the table.
+    :param max_t: the highest temperature in the table.
+    :return: Tuple of np.array of increasing voltages and np.array of
+             temperatures.
+    """
+    temperatures = np.linspace(max_t, min_t, size)
+    voltages = np.array([_temperature_voltage(t) for t in temperatures])
+    return voltages, temperatures
+
+
+_table_v, _table_t = build_table()
+
+
+def voltage_to_temperature(v):
+    """ Convert thermistor voltages to temperatures with the table and linear
+        interpolation.
+    :param v: voltage or np.array of voltages, e.g. a buffer of samples.
+    :return: temperature in Celsius or np.array of them, nan where thermistor
+             is not connected or shorted.
+    """
+    voltages = np.asarray(v, dtype=np.float64)
+    t = np.interp(voltages, _table_v, _table_t)
+    outside = (voltages < _table_v[0]) | (voltages > _table_v[-1])
+    if outside.any():
+        valid = outside & (voltages > 0) & (voltages < Vcc)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t = np.where(valid, _beta_temperature(voltages), t)
+        t = np.where(outside & ~valid, np.nan, t)
+    if np.ndim(v) == 0:
+        return float(t)
+    return t
+
+
+class TemperatureFilter(object):
+    """ Moving median or mean of the latest readings of one channel. Readings
+        of not connected or shorted thermistor are kept in the window, but
+        don't take part in the value, so single glitches are skipped.
+    """
+    def __init__(self, size=FILTER_SIZE, kind=FILTER_KIND):
+        """ Create filter.
+        :param size: number of readings in the window.
+        :param kind: 'median' or 'mean'.
+        """
+        if kind not in ('median', 'mean'):
+            raise ValueError("Unknown filter " + kind)
+        self._window = np.full(max(1, size), np.nan)
+        self._index = 0
+        self._function = np.median if kind == 'median' else np.mean
+
+    def add(self, temperature):
+        """ Add reading.
+        :param temperature: temperature in Celsius, nan for bad reading.
+        :return: filtered temperature, None if there are only bad readings in
+                 the window.
+        """
+        self._window[self._index] = temperature
+        self._index = (self._index + 1) % len(self._window)
+        return self.value()
+
+    def value(self):
+        """ Get filtered temperature.
+        :return: temperature in Celsius, None if there are no good readings
+                 in the window.
+        """
+        valid = self._window[~np.isnan(self._window)]
+        if len(valid) == 0:
+            return None
+        return float(self._function(valid))
+
+
+_filters = {}
+
+
+def set_filter(channel, size=FILTER_SIZE, kind=FILTER_KIND):
+    """ Change filter of channel, readings of the old filter are dropped.
+    :param channel: ads111x channel.
+    :param size: number of readings in the window.
+    :param kind: 'median' or 'mean'.
+    """
+    _filters[channel] = TemperatureFilter(size, kind)
+
 
 def get_temperature(channel):
     """
-    Measure temperature on specified channel.
-    Can raise OSError or IOError on any issue with sensor.
+    Measure temperature on specified channel, filtered with the latest
+    readings, see set_filter().
+    Can raise OSError or IOError on any issue with sensor, bad readings raise
+    only if there are no good ones in the filter window.
     :param channel: ads111x channel.
     :return: temperature in Celsius
     """
     if adc is None:
         raise IOError("ads111x is not connected")
     v = adc.measure(channel)
-    if v >= Vcc:
-        raise IOError("Thermistor not connected")
-    if v <= 0:
+    if channel not in _filters:
+        set_filter(channel)
+    t = _filters[channel].add(voltage_to_temperature(v))
+    if t is None:
+        if v >= Vcc:
+            raise IOError("Thermistor not connected")
         raise IOError("Short circuit")
-    r = v * R1 / (Vcc - v)
-    return (BETA / math.log(r / Rinf)) - CELSIUS_TO_KELVIN
+    return t
 
 
 # for test purpose
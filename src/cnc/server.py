@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+""" G-code server. Hosts stream programs over TCP or Unix socket instead of
+    typing them in cnc/main.py, each connection is one stream of lines:
+
+    - on connect the server sends 'PyCNC queue N' line
+    - each line is answered with one line, 'OK', 'OK <answer>' or
+      'ERROR <message>' like cnc/main.py does, when it has run
+    - lines run in order, up to N lines are queued while one is running, so
+      a host keeps N + 1 lines without answer in flight and sends the next
+      line on each answer, the server stops reading the socket when the
+      queue is full
+    - planned movements run when the queue gets empty, so the host should
+      keep the queue filled to have movements joined without stops
+    - status queries (STATUS_COMMANDS) are answered when received, ahead of
+      the queued lines, they don't take queue slots and report the position
+      after the latest run command without waiting for motors
+    - 'quit' or 'exit' line or closing the socket ends the stream, queued
+      lines still run, stopping the server ends all streams the same way
+
+    Commands of one stream run at a time, a stream waits with its first
+    line which is not a status query until the previous stream ends.
+    Usage: python -m cnc.server [--host 127.0.0.1] [--port 8888]
+                                [--unix /tmp/pycnc.sock] [--queue 16]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import stat
+from concurrent.futures import ThreadPoolExecutor
+
+import cnc.logging_config as logging_config
+from cnc.config import *
+from cnc.gcode import GCode, GCodeException
+from cnc.gmachine import GMachine, GMachineException
+
+# commands which are answered without queueing
+STATUS_COMMANDS = ('M114',)
+
+# queued after the last line of stream
+_END = object()
+
+
+class GCodeServer(object):
+    """ Serves G-code streams to GMachine.
+    """
+
+    def __init__(self, machine, queue_size=SERVER_QUEUE_SIZE):
+        """ Create server, it doesn't listen until start_tcp() or
+            start_unix() is called.
+        :param machine: GMachine object.
+        :param queue_size: maximum number of queued lines of each stream.
+        """
+        self._machine = machine
+        self._queue_size = queue_size
+        # GMachine isn't thread safe, all commands run in this thread
+        self._executor = ThreadPoolExecutor(1)
+        # held by the stream which runs commands
+        self._lock = asyncio.Lock()
+        self._servers = []
+        # writers and handler tasks of connected streams
+        self._streams = {}
+
+    async def start_tcp(self, host=SERVER_HOST, port=SERVER_PORT):
+        """ Listen on TCP socket.
+        :param host: address to bind.
+        :param port: port, any free port if 0.
+        :return: asyncio server object.
+        """
+        server = await asyncio.start_server(self._handle, host, port)
+        self._servers.append(server)
+        return server
+
+    async def start_unix(self, path):
+        """ Listen on Unix socket, socket file left by the previous run is
+            replaced.
+        :param path: path of the socket file.
+        :return: asyncio server object.
+        """
+        try:
+            if stat.S_ISSOCK(os.stat(path).st_mode):
+                os.remove(path)
+        except OSError:
+            pass
+        server = await asyncio.start_unix_server(self._handle, path)
+        self._servers.append(server)
+        return server
+
+    async def serve_forever(self):
+        await asyncio.gather(*[server.serve_forever()
+                               for server in self._servers])
+
+    async def close(self):
+        """ Stop listening, end connected streams and wait till their
+            queued lines run and movements are flushed.
+        """
+        for server in self._servers:
+            server.close()
+        self._servers = []
+        streams = list(self._streams.items())
+        for writer, _ in streams:
+            writer.close()
+        if streams:
+            await asyncio.gather(*[task for _, task in streams],
+                                 return_exceptions=True)
+        await asyncio.get_running_loop().run_in_executor(self._executor,
+                                                         lambda: None)
+
+    def _status(self):
+        p = self._machine.planned_position().rounded()
+        return "OK X:{} Y:{} Z:{} E:{}".format(p.x, p.y, p.z, p.e)
+
+    def _execute(self, gcode):
+        """ Run command.
+        :param gcode: GCode object, None for empty line, or GCodeException
+                      of the line.
+        :return: answer line.
+        """
+        if isinstance(gcode, GCodeException):
+            return 'ERROR ' + str(gcode)
+        try:
+            answer = self._machine.do_command(gcode)
+        except GMachineException as e:
+            return 'ERROR ' + str(e)
+        except Exception as e:
+            # hal failures, the server keeps running
+            logging.exception("command {} failed".format(gcode.params))
+            return 'ERROR ' + str(e)
+        if answer is not None:
+            return 'OK ' + answer
+        return 'OK'
+
+    async def _run(self, queue, writer):
+        """ Run commands of stream from queue till _END.
+        """
+        loop = asyncio.get_running_loop()
+        locked = False
+        # commands ran since the last flush
+        planned = False
+        try:
+            while True:
+                gcode = await queue.get()
+                if gcode is _END:
+                    break
+                if not locked:
+                    await self._lock.acquire()
+                    locked = True
+                answer = await loop.run_in_executor(self._executor,
+                                                    self._execute, gcode)
+                planned = True
+                writer.write((answer + '\n').encode())
+                try:
+                    await writer.drain()
+                except ConnectionError:
+                    # the rest of the stream still runs
+                    pass
+                if queue.empty():
+                    # the next line may never come
+                    await loop.run_in_executor(self._executor,
+                                               self._machine.flush)
+                    planned = False
+        finally:
+            if locked:
+                if planned:
+                    await loop.run_in_executor(self._executor,
+                                               self._machine.flush)
+                self._lock.release()
+
+    async def _handle(self, reader, writer):
+        self._streams[writer] = asyncio.current_task()
+        queue = asyncio.Queue(self._queue_size)
+        runner = asyncio.ensure_future(self._run(queue, writer))
+        writer.write('PyCNC queue {}\n'.format(self._queue_size).encode())
+        try:
+            while True:
+                data = await reader.readline()
+                if not data:
+                    break
+                line = data.decode('ascii', 'replace').strip()
+                if line == 'quit' or line == 'exit':
+                    break
+                try:
+                    gcode = GCode.parse_line(line)
+                except GCodeException as e:
+                    # answered in order with the other lines
+                    gcode = e
+                if isinstance(gcode, GCode) \
+                        and gcode.command() in STATUS_COMMANDS:
+                    writer.write((self._status() + '\n').encode())
+                    continue
+                await queue.put(gcode)
+        except ConnectionError:
+            pass
+        finally:
+            await queue.put(_END)
+            await runner
+            writer.close()
+            del self._streams[writer]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="G-code server.")
+    parser.add_argument('--host', default=SERVER_HOST,
+                        help="address to listen on")
+    parser.add_argument('--port', type=int, default=SERVER_PORT,
+                        help="TCP port, 0 disables TCP socket")
+    parser.add_argument('--unix', help="also listen on Unix socket")
+    parser.add_argument('--queue', type=int, default=SERVER_QUEUE_SIZE,
+                        help="number of queued lines of each stream")
+    args = parser.parse_args()
+    logging_config.debug_disable()
+    machine = GMachine()
+
+    async def serve():
+        server = GCodeServer(machine, args.queue)
+        if args.port:
+            await server.start_tcp(args.host, args.port)
+            print("listening on {}:{}".format(args.host, args.port))
+        if args.unix:
+            await server.start_unix(args.unix)
+            print("listening on " + args.unix)
+        try:
+            await server.serve_forever()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    print("\r\nExiting...")
+    machine.release()
+
+
+if __name__ == "__main__":
+    main()
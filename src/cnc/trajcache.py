@@ -0,0 +1,151 @@
+""" Disk cache of compiled programs. Streams are stored in files named after
+    the hash of the program, of the machine config and of the stream
+    encoding, so any change of them leads to a new entry. Least recently
+    used files are removed when the cache grows over its size limit.
+"""
+
+import hashlib
+import logging
+import mmap
+import os
+
+import cnc.config
+from cnc.rtstream import STREAM_VERSION
+
+# increment when planning changes the stream of the same program and config
+CACHE_VERSION = 1
+
+# config values which don't change the stream
+NOT_HASHED_CONFIG = ('RT_STREAM_PATH', 'INSTANT_RUN', 'HAL_QUEUE_SIZE',
+                     'TIP_LOG_PATH', 'WORKSPACE_CACHE_DIR', 'SERVO_DIRECT',
+                     'SERVO_SYSFS_ROOT', 'SERVO_CHANNELS',
+                     'SERVO_SCHED_PRIORITY',
+                     'TRAJECTORY_CACHE_DIR', 'TRAJECTORY_CACHE_MAX_MB',
+                     'SPINDLE_PWM_PIN', 'FAN_PIN', 'SERVER_HOST',
+                     'SERVER_PORT', 'SERVER_QUEUE_SIZE')
+
+STREAM_SUFFIX = '.rpds'
+# size of writes when stream is sent to realTimePlayer
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def trajectory_key(program, encoding):
+    """ Get the key of compiled program.
+    :param program: bytes of program.
+    :param encoding: ENCODING_ANGLE or ENCODING_DUTY.
+    :return: string with hex digest.
+    """
+    config = sorted((name, getattr(cnc.config, name))
+                    for name in dir(cnc.config)
+                    if name.isupper() and name not in NOT_HASHED_CONFIG)
+    h = hashlib.sha256()
+    h.update(repr((CACHE_VERSION, STREAM_VERSION, encoding,
+                   config)).encode())
+    # tables change duty cycles, but not the path to them
+    if cnc.config.SERVO_CALIBRATION_PATH is not None:
+        with open(cnc.config.SERVO_CALIBRATION_PATH, 'rb') as f:
+            h.update(f.read())
+    h.update(program)
+    return h.hexdigest()
+
+
+def stream_file(path, fh):
+    """ Write file to file object straight from the memory mapped file.
+    :param path: path to the file.
+    :param fh: binary file object.
+    :return: number of written bytes.
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return 0
+        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            view = memoryview(m)
+            for offset in range(0, size, STREAM_CHUNK_SIZE):
+                fh.write(view[offset:offset + STREAM_CHUNK_SIZE])
+            view.release()
+        finally:
+            m.close()
+    fh.flush()
+    return size
+
+
+class TrajectoryCache(object):
+    """ Directory with compiled streams.
+    """
+
+    def __init__(self, directory, max_bytes):
+        """ Create cache.
+        :param directory: directory for the stream files, created if needed.
+        :param max_bytes: maximum size of all the files.
+        """
+        self._directory = directory
+        self._max_bytes = max_bytes
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path(self, key):
+        """ Get path of the stream file.
+        :param key: value returned by trajectory_key().
+        :return: path, the file may not exist.
+        """
+        return os.path.join(self._directory, key + STREAM_SUFFIX)
+
+    def lookup(self, key):
+        """ Find stream and mark it as the most recently used.
+        :param key: value returned by trajectory_key().
+        :return: path of the stream file or None if there is no such stream.
+        """
+        path = self.path(key)
+        try:
+            os.utime(path, None)
+        except OSError:
+            return None
+        return path
+
+    def store(self, key, write):
+        """ Add stream to the cache. Nothing is added if write fails.
+        :param key: value returned by trajectory_key().
+        :param write: function which writes stream to binary file object.
+        :return: path of the stream file.
+        """
+        path = self.path(key)
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            with open(tmp, 'wb') as fh:
+                write(fh)
+            os.rename(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep=None):
+        """ Remove least recently used streams until the cache fits in its
+            size limit.
+        :param keep: path of the stream which is never removed.
+        """
+        entries = []
+        for name in os.listdir(self._directory):
+            if not name.endswith(STREAM_SUFFIX):
+                continue
+            path = os.path.join(self._directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self._max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            logging.info("trajectory cache: removed " + path)
+            total -= size
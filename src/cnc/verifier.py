@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+""" Verify the stream for realTimePlayer against the G-code program. Motor
+    angles of each frame are converted back to the tip position with the
+    forward kinematics and compared with the sample which the planner
+    produces for the same frame, so the check covers inverse kinematics,
+    motor offsets, duty encoding and everything the stream went through.
+    Text 'rt-cmd:POS' streams and binary streams of any encoding are read.
+    Usage: python -m cnc.verifier program.gcode stream [-t 0.001]
+           python -m cnc.main program.gcode | python -m cnc.verifier \
+               program.gcode -
+"""
+
+from __future__ import division
+import argparse
+import sys
+
+import cnc.logging_config as logging_config
+from cnc.compiler import _CompilerHal
+from cnc.gcode import GCode, GCodeException
+from cnc.gmachine import GMachine, GMachineException
+from cnc.hal import *
+
+# allowed error without IK_TOLERANCE_MM, covers float32 and text rounding
+VERIFY_TOLERANCE_MM = 0.001
+
+
+class VerifierException(Exception):
+    """ Exceptions while verifying stream.
+    """
+    pass
+
+
+def plan_samples(lines):
+    """ Plan program like cnc/main.py does, but keep the samples.
+    :param lines: iterable of gcode lines.
+    :return: (N, 3) array of X, Y and Z positions in mm, one per frame.
+    """
+    samples = []
+    hal = _CompilerHal(lambda s, _: samples.append(s[:, 0:3]))
+    machine = GMachine(hal)
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if line == 'quit' or line == 'exit':
+            break
+        try:
+            machine.do_command(GCode.parse_line(line))
+        except (GCodeException, GMachineException) as e:
+            raise VerifierException("line {}: {}".format(line_number, e))
+    machine.release()
+    if not samples:
+        return np.empty((0, 3))
+    return np.concatenate(samples)
+
+
+def stream_motor_angles(data, motor_offset):
+    """ Motor angles of stream frames.
+    :param data: bytes of binary stream or of text stream, text lines other
+                 than 'rt-cmd:POS' are skipped.
+    :param motor_offset: motor offsets of text stream, binary stream has
+                         them in header.
+    :return: (N, 3) array of motor angles in radians.
+    """
+    if data[:len(STREAM_MAGIC)] == STREAM_MAGIC:
+        try:
+            header, frames = read_stream(data)
+        except RtStreamException as e:
+            raise VerifierException(str(e))
+        if header['encoding'] == ENCODING_DUTY \
+                and header['flags'] & FLAG_CALIBRATED:
+            calibration = servo_calibration()
+            if calibration is None:
+                raise VerifierException("stream is calibrated, set "
+                                        "SERVO_CALIBRATION_PATH")
+            servo = calibration.to_angle(frames)
+        elif header['encoding'] == ENCODING_DUTY:
+            # frames were truncated, so error is less than 1 ns of pulse
+            servo = (frames - header['model_intercept']) \
+                / header['model_slope']
+        else:
+            servo = frames.astype(np.float64)
+        motor_offset = np.array(header['motor_offset_rad'])
+    else:
+        prefix = TEXT_LINE.split()[0] + ' '
+        try:
+            values = [line.split()[1:4]
+                      for line in data.decode('ascii').splitlines()
+                      if line.startswith(prefix)]
+            servo = np.array(values, dtype=np.float64).reshape(-1, 3)
+        except (UnicodeDecodeError, ValueError):
+            raise VerifierException("stream is neither binary nor text")
+    return motor_offset - servo
+
+
+def verify(lines, data):
+    """ Compare stream with program.
+    :param lines: iterable of gcode lines.
+    :param data: bytes of the stream.
+    :return: dict with number of frames, maximum and RMS errors in mm and
+             index of frame with maximum error.
+    """
+    hal = HalFileExporter(open_stream=False)
+    expected = plan_samples(lines)
+    angles = stream_motor_angles(data, hal.motor_offset)
+    if len(angles) != len(expected):
+        raise VerifierException("stream has {} frames, program has {}"
+                                .format(len(angles), len(expected)))
+    tip_pos, valid = hal.robot.solve_motor_angles(angles)
+    if not valid.all():
+        raise VerifierException("frame {}: no tip position for angles"
+                                .format(int(np.flatnonzero(~valid)[0])))
+    tip_pos[:, 2] -= DELTA_Z_OFFSET
+    error = np.linalg.norm(tip_pos * 1000 - expected, axis=1)
+    if not len(error):
+        return {'frames': 0, 'max_error_mm': 0.0, 'rms_error_mm': 0.0,
+                'worst_frame': None}
+    return {'frames': len(error),
+            'max_error_mm': float(error.max()),
+            'rms_error_mm': float(np.sqrt(np.mean(error ** 2))),
+            'worst_frame': int(error.argmax())}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Verify realTimePlayer stream against G-code program.")
+    parser.add_argument('program', help="G-code file")
+    parser.add_argument('stream', help="stream file, '-' for stdin")
+    parser.add_argument('-t', '--tolerance', type=float, default=None,
+                        help="allowed error in mm, {} plus IK_TOLERANCE_MM"
+                             " by default".format(VERIFY_TOLERANCE_MM))
+    args = parser.parse_args()
+    tolerance = args.tolerance
+    if tolerance is None:
+        tolerance = VERIFY_TOLERANCE_MM + (IK_TOLERANCE_MM or 0.0)
+    logging_config.debug_disable()
+    try:
+        if args.stream == '-':
+            data = sys.stdin.buffer.read()
+        else:
+            with open(args.stream, 'rb') as f:
+                data = f.read()
+        with open(args.program, 'r') as program:
+            result = verify(program, data)
+    except VerifierException as e:
+        print('ERROR ' + str(e))
+        sys.exit(1)
+    print("{} frames, max error {:.6f} mm at frame {}, rms error {:.6f} mm"
+          .format(result['frames'], result['max_error_mm'],
+                  result['worst_frame'], result['rms_error_mm']))
+    if result['max_error_mm'] > tolerance:
+        print("ERROR error is more than {} mm".format(tolerance))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
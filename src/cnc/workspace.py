@@ -0,0 +1,152 @@
+import hashlib
+import logging
+import math
+import os
+
+import numpy as np
+
+# cell classes
+OUTSIDE = 0
+INSIDE = 1
+BOUNDARY = 2
+
+# increment when the way grid is built changes, it invalidates old caches
+GRID_VERSION = 2
+
+
+class ReachabilityGrid(object):
+    """ Precomputed voxel grid of the tip positions reachable by the robot.
+        Inverse kinematics is solved once for each node of the grid. Cell
+        whose 8 corners are all reachable is INSIDE, cell whose 8 corners are
+        all unreachable is OUTSIDE, cells which have both kinds of corners and
+        their neighbours are BOUNDARY, so features of the workspace smaller
+        than a cell are less likely to be hidden.
+        Positions in INSIDE cells are accepted in constant time, the others
+        are checked with the exact inverse kinematics, so reachable position
+        is never rejected, and rejecting is rare.
+        Grid covers the sphere of arms reach, everything out of it is
+        unreachable. Positions are in the robot frame, meters, like
+        DeltaMechanics.solve_tip_positions() takes.
+    """
+
+    def __init__(self, robot, cell_size, cache_dir=None):
+        """ Build grid or load it from cache.
+        :param robot: DeltaMechanics object.
+        :param cell_size: size of cell edge, meters.
+        :param cache_dir: directory to keep grids between runs, None to always
+                          build.
+        """
+        self._robot = robot
+        self.cell_size = cell_size
+        reach = robot.L + robot.l + robot.wb + robot.up
+        self.origin = np.array([-reach, -reach, -(robot.L + robot.l)])
+        size = -2.0 * self.origin
+        self.nodes = tuple(int(math.ceil(s / cell_size)) + 1 for s in size)
+        self.cells = None
+        path = None
+        if cache_dir is not None:
+            path = os.path.join(cache_dir,
+                                'workspace-{}.npy'.format(self.key()))
+            self.cells = self._load(path)
+        if self.cells is None:
+            self.cells = self._build()
+            if path is not None:
+                self._save(path)
+
+    def key(self):
+        """ Hash of everything the grid depends on.
+        :return: string with hex digest.
+        """
+        robot = self._robot
+        params = (GRID_VERSION, robot.L, robot.l, robot.wb, robot.up,
+                  [mot.angle_min for mot in robot.motors],
+                  [mot.angle_max for mot in robot.motors], self.cell_size)
+        return hashlib.sha1(repr(params).encode()).hexdigest()[:16]
+
+    def _load(self, path):
+        try:
+            cells = np.load(path)
+        except (IOError, OSError, ValueError):
+            return None
+        if cells.shape != tuple(n - 1 for n in self.nodes):
+            return None
+        logging.info("workspace grid is loaded from " + path)
+        return cells
+
+    def _save(self, path):
+        tmp = path + '.{}.tmp'.format(os.getpid())
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(tmp, 'wb') as fh:
+                np.save(fh, self.cells)
+            os.rename(tmp, path)
+        except (IOError, OSError) as e:
+            logging.warning("can't cache workspace grid: {}".format(e))
+
+    def _build(self):
+        logging.info("building workspace grid of {} nodes"
+                     .format(self.nodes))
+        nx, ny, nz = self.nodes
+        x = self.origin[0] + self.cell_size * np.arange(nx)
+        y = self.origin[1] + self.cell_size * np.arange(ny)
+        z = self.origin[2] + self.cell_size * np.arange(nz)
+        xy = np.column_stack([c.ravel() for c in np.meshgrid(x, y,
+                                                             indexing='ij')])
+        tip_pos = np.empty((len(xy), 3))
+        tip_pos[:, 0:2] = xy
+        valid = np.empty(self.nodes, dtype=bool)
+        # one layer at time keeps memory low
+        for k in range(nz):
+            tip_pos[:, 2] = z[k]
+            _, layer = self._robot.solve_tip_positions(tip_pos)
+            valid[:, :, k] = layer.reshape(nx, ny)
+        corners = [valid[i:nx - 1 + i, j:ny - 1 + j, k:nz - 1 + k]
+                   for i in (0, 1) for j in (0, 1) for k in (0, 1)]
+        inside = np.logical_and.reduce(corners)
+        outside = ~np.logical_or.reduce(corners)
+        mixed = np.pad(~(inside | outside), 1)
+        # neighbours of mixed cells, including diagonal ones
+        sx, sy, sz = inside.shape
+        boundary = np.logical_or.reduce(
+            [mixed[i:sx + i, j:sy + j, k:sz + k]
+             for i in (0, 1, 2) for j in (0, 1, 2) for k in (0, 1, 2)])
+        cells = np.full(inside.shape, BOUNDARY, dtype=np.uint8)
+        cells[inside & ~boundary] = INSIDE
+        cells[outside & ~boundary] = OUTSIDE
+        return cells
+
+    def contains(self, tip_pos):
+        """ Check if positions are reachable.
+        :param tip_pos: np.array(N,3) of tip positions.
+        :return: np.array(N,) of bool.
+        """
+        tip_pos = np.asarray(tip_pos, dtype=np.float64)
+        index = np.floor((tip_pos - self.origin)
+                         / self.cell_size).astype(np.intp)
+        shape = np.array(self.cells.shape)
+        in_grid = np.all((index >= 0) & (index < shape), axis=1)
+        cls = np.full(len(tip_pos), OUTSIDE, dtype=np.uint8)
+        i = index[in_grid]
+        cls[in_grid] = self.cells[i[:, 0], i[:, 1], i[:, 2]]
+        valid = cls == INSIDE
+        # the grid is exact for rejected positions which are out of it
+        exact = np.flatnonzero(~valid & in_grid)
+        if len(exact):
+            _, valid[exact] = self._robot.solve_tip_positions(tip_pos[exact])
+        return valid
+
+    def contains_point(self, x, y, z):
+        """ Check if position is reachable.
+        :return: boolean value.
+        """
+        i = int(math.floor((x - self.origin[0]) / self.cell_size))
+        j = int(math.floor((y - self.origin[1]) / self.cell_size))
+        k = int(math.floor((z - self.origin[2]) / self.cell_size))
+        nx, ny, nz = self.cells.shape
+        if not (0 <= i < nx and 0 <= j < ny and 0 <= k < nz):
+            return False
+        if self.cells[i, j, k] == INSIDE:
+            return True
+        _, valid = self._robot.solve_tip_positions(np.array([[x, y, z]]))
+        return bool(valid[0])
@@ -0,0 +1,164 @@
+""" Per channel servo calibration tables. Each channel has its own piecewise
+linear function of the servo angle to the pulse width, which replaces the
+single linear model. The table is a text file which realTimePlayer reads
+too (-k option), one point per line:
+
+    # channel  angle, rad  pulse width, ns
+    0          -1.5        760000
+    0          0.0         1550000
+    0          1.5         2340000
+    1          ...
+
+Everything after '#' is a comment. The table has channels 0, 1 and 2, each
+one has 2 to MAX_POINTS points with strictly increasing angles in the order
+of lines and strictly increasing or decreasing pulse widths. realTimePlayer
+accepts exactly the same tables. Angles outside of the table are clamped to
+its ends, so the first and the last points are the pulse limits of the
+channel.
+"""
+
+import numpy as np
+
+# the same limits as in realTimePlayer/rtstream.h
+CHANNELS = 3
+MAX_POINTS = 64
+
+
+class CalibrationException(Exception):
+    """ Exceptions while loading calibration table.
+    """
+    pass
+
+
+class ServoCalibration(object):
+    """ Calibration tables of all channels.
+    """
+
+    def __init__(self, tables):
+        """ Create calibration.
+        :param tables: list of tuples of angles and pulse widths, one per
+                       channel.
+        """
+        if len(tables) != CHANNELS:
+            raise CalibrationException("calibration table should have {} "
+                                       "channels".format(CHANNELS))
+        self._tables = []
+        for channel, (angles, pulses) in enumerate(tables):
+            angles = np.asarray(angles, dtype=np.float64)
+            pulses = np.asarray(pulses, dtype=np.float64)
+            if angles.shape != pulses.shape or angles.ndim != 1 \
+                    or not 2 <= len(angles) <= MAX_POINTS:
+                raise CalibrationException(
+                    "channel {} should have 2 to {} points"
+                    .format(channel, MAX_POINTS))
+            if not (np.isfinite(angles).all() and np.isfinite(pulses).all()):
+                raise CalibrationException(
+                    "values of channel {} are not finite".format(channel))
+            if not (np.diff(angles) > 0).all():
+                raise CalibrationException(
+                    "angles of channel {} are not increasing".format(channel))
+            steps = np.diff(pulses)
+            if not ((steps > 0).all() or (steps < 0).all()):
+                raise CalibrationException(
+                    "pulse widths of channel {} are not monotonic"
+                    .format(channel))
+            self._tables.append((angles, pulses))
+
+    @classmethod
+    def parse(cls, text):
+        """ Parse calibration table.
+        :param text: string with content of the file.
+        :return: ServoCalibration object.
+        """
+        points = {}
+        for number, line in enumerate(text.splitlines(), 1):
+            fields = line.split('#', 1)[0].split()
+            if not fields:
+                continue
+            try:
+                channel, angle, pulse = fields
+                channel = int(channel)
+                if not 0 <= channel < CHANNELS:
+                    raise ValueError
+                points.setdefault(channel, []).append((float(angle),
+                                                       float(pulse)))
+            except ValueError:
+                raise CalibrationException("line {}: should be channel, "
+                                           "angle and pulse width"
+                                           .format(number))
+        # missing channels have no points
+        return cls([tuple(zip(*points.get(channel, []))) or ((), ())
+                    for channel in range(CHANNELS)])
+
+    @classmethod
+    def load(cls, path):
+        """ Load calibration table from file.
+        :param path: path to the file.
+        :return: ServoCalibration object.
+        """
+        try:
+            with open(path) as f:
+                text = f.read()
+        except (IOError, OSError) as e:
+            raise CalibrationException("can't read calibration table: {}"
+                                       .format(e))
+        return cls.parse(text)
+
+    @property
+    def channels(self):
+        return len(self._tables)
+
+    def _table(self, channel):
+        if not 0 <= channel < len(self._tables):
+            raise CalibrationException("no calibration for channel {}"
+                                       .format(channel))
+        return self._tables[channel]
+
+    def pulse_limits(self, channel):
+        """ Pulse widths of channel at the ends of its table.
+        :param channel: channel.
+        :return: Tuple of minimum and maximum pulse width in nanoseconds.
+        """
+        _, pulses = self._table(channel)
+        return min(pulses[0], pulses[-1]), max(pulses[0], pulses[-1])
+
+    def channel_duty(self, channel, angle):
+        """ Pulse width of one servo.
+        :param channel: channel.
+        :param angle: servo angle in radians.
+        :return: pulse width in nanoseconds, float.
+        """
+        angles, pulses = self._table(channel)
+        return float(np.interp(angle, angles, pulses))
+
+    def to_duty(self, angles):
+        """ Convert servo angles to duty cycles the same way realTimePlayer
+            does: float32 angle, interpolation, truncation.
+        :param angles: (N, channels) array of servo angles in radians.
+        :return: (N, channels) uint32 array of duty cycles in nanoseconds.
+        """
+        angles = np.asarray(angles, dtype=np.float32).astype(np.float64)
+        if angles.ndim != 2 or angles.shape[1] > len(self._tables):
+            raise CalibrationException("no calibration for {} channels"
+                                       .format(angles.shape[-1]))
+        duty = np.empty(angles.shape)
+        for channel in range(angles.shape[1]):
+            table_angles, pulses = self._tables[channel]
+            duty[:, channel] = np.interp(angles[:, channel], table_angles,
+                                         pulses)
+        return duty.astype(np.uint32)
+
+    def to_angle(self, duty):
+        """ Convert duty cycles back to servo angles.
+        :param duty: (N, channels) array of duty cycles in nanoseconds.
+        :return: (N, channels) array of servo angles in radians.
+        """
+        duty = np.asarray(duty, dtype=np.float64)
+        angles = np.empty(duty.shape)
+        for channel in range(duty.shape[1]):
+            table_angles, pulses = self._table(channel)
+            if pulses[0] > pulses[-1]:
+                table_angles, pulses = table_angles[::-1], pulses[::-1]
+            angles[:, channel] = np.interp(duty[:, channel], pulses,
+                                           table_angles)
+        return angles
@@ -1,14 +1,16 @@
 #!/usr/bin/python3
 import time
-import os.path
+import os
 
 
 class Servo:
     init = False
     channel = 0
 
-    def __init__(self, channel):
+    def __init__(self, channel, sysfs_root=None):
         self.channel = channel
+        if sysfs_root is not None:
+            self.servoClassPath = sysfs_root
         if not self.init:
             self.init_controller()
 
@@ -31,6 +33,10 @@ class ServoKernel(Servo):
     PULSE_MAX = 2500000.0
     duty_cycle_path = ''
     enable_path = ''
+    duty_cycle_fd = None
+    # ServoCalibration object and its channel, replace the linear model
+    calibration = None
+    calibration_channel = 0
 
     def init_controller(self):
         export_path = "{:s}/export".format(self.servoClassPath)
@@ -53,23 +59,47 @@ class ServoKernel(Servo):
             fh.writelines("{:s}".format('1'))
         
         self.duty_cycle_path = "{:s}/duty_cycle".format(pwm_path)
+        # kept open, written with a single pwrite() per move
+        self.duty_cycle_fd = os.open(self.duty_cycle_path, os.O_WRONLY)
         self.init = True
 
     def move_to_angle(self, radian):
         if not self.init:
             exit(0)
-        duty_cycle = self.model_slope*radian + self.model_intercept
-        if duty_cycle < self.PULSE_MIN:
-            duty_cycle = self.PULSE_MIN
-        elif duty_cycle > self.PULSE_MAX:
-            duty_cycle = self.PULSE_MAX
-        with open(self.duty_cycle_path, 'w') as fh:
-            fh.writelines("{:d}".format(int(duty_cycle)))
+        if self.calibration is not None:
+            # the table is clamped to the pulse limits of the channel
+            duty_cycle = self.calibration.channel_duty(
+                self.calibration_channel, radian)
+        else:
+            duty_cycle = self.model_slope*radian + self.model_intercept
+            if duty_cycle < self.PULSE_MIN:
+                duty_cycle = self.PULSE_MIN
+            elif duty_cycle > self.PULSE_MAX:
+                duty_cycle = self.PULSE_MAX
+        self.write_duty_cycle(b"%d\n" % int(duty_cycle))
+
+    def set_calibration(self, calibration, channel=None):
+        """ Use calibration table instead of the linear model.
+        :param calibration: ServoCalibration object, None for linear model.
+        :param channel: channel of the table, servo channel if None.
+        """
+        self.calibration = calibration
+        self.calibration_channel = self.channel if channel is None \
+            else channel
+
+    def write_duty_cycle(self, data):
+        """ Set duty cycle which is already formatted for sysfs.
+        :param data: bytes, e.g. b"1550000\n".
+        """
+        os.pwrite(self.duty_cycle_fd, data, 0)
 
     def close(self):
         if self.init:
+            os.close(self.duty_cycle_fd)
+            self.duty_cycle_fd = None
             with open(self.enable_path, 'w') as fh:
                 fh.writelines("{:s}".format('0'))
+            self.init = False
         
 
 if __name__ == '__main__':
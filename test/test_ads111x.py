@@ -0,0 +1,103 @@
+from unittest import TestCase
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+from cnc.sensors import ads111x
+
+
+class FakeAds111x(object):
+    """ Register model of the chip, inputs have fixed voltages.
+    """
+    def __init__(self, volts):
+        self.lock = threading.RLock()
+        self.volts = volts
+        self.pointer = 0
+        self.config = 0
+        self.configs = []
+
+    def write(self, data):
+        self.pointer = data[0]
+        if len(data) == 3:
+            self.config = struct.unpack(">H", data[1:])[0]
+            self.configs.append(self.config)
+
+    def read(self, n):
+        if self.pointer == ads111x.CONFIG_REGISTER:
+            return struct.pack(">H", self.config | 0x8000)
+        channel = (self.config >> 12) & 0b11
+        return struct.pack(">h", int(self.volts[channel] * 8000))
+
+
+class BrokenDevice(object):
+    def __init__(self):
+        self.lock = threading.RLock()
+
+    def write(self, data):
+        raise OSError(121, "Remote I/O error")
+
+    def read(self, n):
+        raise OSError(121, "Remote I/O error")
+
+
+class TestAds111x(TestCase):
+    def setUp(self):
+        self.dev = FakeAds111x([0.5, 1.0, 1.5, 2.0])
+
+    def _wait(self, sampler, channels):
+        deadline = time.monotonic() + 5.0
+        while time.monotonic() < deadline:
+            if all(sampler.latest(c) is not None for c in channels):
+                return
+            time.sleep(0.01)
+        self.fail("no measurements")
+
+    def test_measure(self):
+        self.assertEqual(ads111x.measure(2, self.dev), 1.5)
+        self.assertTrue(self.dev.configs[-1] & ads111x.CONFIG_SINGLE_SHOT)
+        self.assertRaises(ValueError, ads111x.measure, 4, self.dev)
+
+    def test_sampler(self):
+        sampler = ads111x.Sampler((0, 1, 3), self.dev, data_rate=860)
+        self.assertIsNone(sampler.latest(0))
+        start = time.monotonic()
+        sampler.start()
+        self._wait(sampler, (0, 1, 3))
+        sampler.stop()
+        for channel in (0, 1, 3):
+            v, t = sampler.latest(channel)
+            self.assertEqual(v, self.dev.volts[channel])
+            self.assertGreaterEqual(t, start)
+        self.assertIsNone(sampler.latest(2))
+        self.assertIsNone(sampler.error)
+        # continuous mode, channels in turn
+        self.assertFalse(any(c & ads111x.CONFIG_SINGLE_SHOT
+                             for c in self.dev.configs))
+        channels = [(c >> 12) & 0b11 for c in self.dev.configs]
+        self.assertEqual(channels[0:3], [0, 1, 3])
+
+    def test_sampler_error(self):
+        sampler = ads111x.Sampler((0,), BrokenDevice(), data_rate=860)
+        sampler.start()
+        deadline = time.monotonic() + 5.0
+        while sampler.error is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        sampler.stop()
+        self.assertIsInstance(sampler.error, OSError)
+        self.assertIsNone(sampler.latest(0))
+
+    def test_device_file(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'i2c')
+            # device is opened on the first use only
+            dev = ads111x.I2CDev(path)
+            open(path, 'w').close()
+            dev.write(b'\x01\x02')
+            dev.close()
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), b'\x01\x02')
+        finally:
+            shutil.rmtree(tmp)
@@ -0,0 +1,104 @@
+from unittest import TestCase
+import contextlib
+import io
+import os
+import cnc.compiler
+import cnc.hal
+from cnc.compiler import *
+from cnc.gmachine import GMachine
+from cnc.hal import HalFileExporter
+from cnc.rtstream import *
+
+PROGRAM = os.path.join(os.path.dirname(__file__), '..', 'gcode',
+                       'test2.gcode')
+
+
+class KeptBytesIO(io.BytesIO):
+    """ hal closes stream on release, keep it readable.
+    """
+    def close(self):
+        pass
+
+
+class TestCompiler(TestCase):
+    def _sequential(self, lines, encoding):
+        stream = KeptBytesIO()
+        hal = HalFileExporter(open_stream=False)
+        hal._rt_writer = RtStreamWriter(stream, encoding)
+        machine = GMachine(hal)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for line in lines:
+                try:
+                    machine.do_command(GCode.parse_line(line.strip()))
+                except GCodeException:
+                    break
+            machine.release()
+        return stream.getvalue()
+
+    def _compile(self, lines, encoding, jobs, chunk_samples):
+        stream = io.BytesIO()
+        compiler = Compiler(stream, encoding, jobs, chunk_samples)
+        try:
+            compiler.compile(lines)
+        except CompilerException:
+            pass
+        return stream.getvalue()
+
+    def test_byte_identical(self):
+        with open(PROGRAM) as f:
+            lines = f.readlines()
+        for encoding in (ENCODING_ANGLE, ENCODING_DUTY):
+            expected = self._sequential(lines, encoding)
+            for jobs, chunk_samples in ((1, CHUNK_SAMPLES), (1, 7), (2, 100)):
+                self.assertEqual(self._compile(lines, encoding, jobs,
+                                               chunk_samples), expected)
+
+    def test_adaptive_byte_identical(self):
+        with open(PROGRAM) as f:
+            lines = f.readlines()
+        cnc.hal.IK_TOLERANCE_MM = cnc.compiler.IK_TOLERANCE_MM = 0.01
+        try:
+            expected = self._sequential(lines, ENCODING_ANGLE)
+            # workers of the pool may not see patched config, solve in place
+            self.assertEqual(self._compile(lines, ENCODING_ANGLE, 1, 7),
+                             expected)
+        finally:
+            cnc.hal.IK_TOLERANCE_MM = cnc.compiler.IK_TOLERANCE_MM = None
+
+    def test_unreachable_line(self):
+        """ with look-ahead, movements are solved after the next lines, the
+            error still points to the line of the movement """
+        lines = ["G1 X1 F600", "G1 X2", "G1 X200", "G1 X3", "G1 X4", "G4 P0",
+                 "G1 X5"]
+
+        def reachable(*args):
+            return True
+
+        stream = KeptBytesIO()
+        hal = HalFileExporter(open_stream=False)
+        hal._rt_writer = RtStreamWriter(stream, ENCODING_ANGLE)
+        hal.check_valid_segment = reachable
+        machine = GMachine(hal)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertRaises(GHalException, lambda: [
+                machine.do_command(GCode.parse_line(line)) for line in lines])
+        expected = stream.getvalue()
+        for jobs, chunk_samples in ((1, CHUNK_SAMPLES), (1, 7), (2, 100)):
+            stream = io.BytesIO()
+            compiler = Compiler(stream, ENCODING_ANGLE, jobs, chunk_samples)
+            compiler._hal.check_valid_segment = reachable
+            self.assertRaisesRegex(CompilerException, "^line 3:",
+                                   compiler.compile, lines)
+            # movements before the unreachable one are written
+            self.assertEqual(stream.getvalue(), expected)
+            self.assertGreater(compiler.frames, 0)
+
+    def test_error_line(self):
+        lines = ["G1 X1 F600", "G1 X2", "G1 X3 Q", "G1 X4"]
+        stream = io.BytesIO()
+        compiler = Compiler(stream, ENCODING_ANGLE, 1)
+        self.assertRaisesRegex(CompilerException, "line 3",
+                               compiler.compile, lines)
+        header, frames = read_stream(stream.getvalue())
+        self.assertEqual(len(frames), compiler.frames)
+        self.assertGreater(compiler.frames, 0)
@@ -0,0 +1,34 @@
+from unittest import TestCase
+import numpy as np
+from cnc.coordinates import Coordinates
+
+
+class TestCoordinates(TestCase):
+
+    def test_rounding_on_compare(self):
+        c = Coordinates(0.1, 0.2, 0.0, 0.0) + Coordinates(0.2, 0.0, 0.0, 0.0)
+        self.assertEqual(c.x, 0.1 + 0.2)
+        self.assertEqual(c, Coordinates(0.3, 0.2, 0.0, 0.0))
+        self.assertNotEqual(c, Coordinates(0.3, 0.2, 1e-9, 0.0))
+        self.assertTrue((c - Coordinates(0.3, 0.2, 0.0, 0.0)).is_zero())
+        self.assertEqual(str(c), '(0.3, 0.2, 0.0, 0.0)')
+
+    def test_in_place(self):
+        c = Coordinates(1.0, 2.0, 3.0, 4.0)
+        same = c
+        c += Coordinates(1.0, 1.0, 1.0, 1.0)
+        c -= Coordinates(0.0, 0.0, 0.0, 2.0)
+        c *= 2.0
+        c /= 4.0
+        self.assertIs(c, same)
+        self.assertEqual(c, Coordinates(1.0, 1.5, 2.0, 1.5))
+
+    def test_as_array(self):
+        a = Coordinates(1, 2, 3, 4).as_array()
+        self.assertEqual(a.dtype, np.float64)
+        np.testing.assert_array_equal(a, [1, 2, 3, 4])
+
+    def test_slots(self):
+        c = Coordinates(1, 2, 3, 4)
+        self.assertFalse(hasattr(c, '__dict__'))
+        self.assertRaises(AttributeError, setattr, c, 'w', 0)
@@ -67,6 +67,123 @@ class TestDeltaMechanics(unittest.TestCase):
         self.assertAlmostEqual(dut.theta_prime[1, 0], angular_speed[1], 3)
         self.assertAlmostEqual(dut.theta_prime[2, 0], angular_speed[2], 3)
 
+    def test_batch_matches_single_point(self):
+        dut = deltaRobot.DeltaMechanics(L=0.524, l=1.244, wb=0.164, up=0.044)
+        positions = np.array([[0, 0, -0.9],
+                              [0.3, 0.5, -1.1],
+                              [0, 0, 10],
+                              [-0.2, 0.1, -1.3]])
+        angles, valid = dut.solve_tip_positions(positions)
+        self.assertEqual(angles.shape, (4, 3))
+        self.assertEqual(list(valid), [True, True, False, True])
+        for pos, theta, ok in zip(positions, angles, valid):
+            dut.update_from_new_tip_pos(pos)
+            self.assertEqual(dut.valid, ok)
+            if ok:
+                np.testing.assert_array_equal(dut.motor_angles(), theta)
+
+    def test_adaptive_path(self):
+        dut = deltaRobot.DeltaMechanics(L=0.524, l=1.244, wb=0.164, up=0.044)
+        u = np.linspace(0.0, 1.0, 1001)[:, np.newaxis]
+        path = np.array([-0.2, -0.1, -1.0]) + u * np.array([0.3, 0.2, -0.1])
+        solved = []
+        inverse_kinematics = dut._inverse_kinematics
+
+        def counting(tip_pos):
+            solved.append(len(tip_pos))
+            return inverse_kinematics(tip_pos)
+        dut._inverse_kinematics = counting
+        tolerance = 1e-4
+        angles, valid = dut.solve_tip_path(path, tolerance)
+        dut._inverse_kinematics = inverse_kinematics
+        self.assertLess(sum(solved), len(path) / 4)
+        self.assertTrue(valid.all())
+        exact, _ = dut.solve_tip_positions(path)
+        # tip deviation estimated with the Jacobian
+        deviation = np.linalg.solve(dut.jacobian(path, exact),
+                                    (angles - exact)[:, :, np.newaxis])
+        self.assertLess(np.linalg.norm(deviation[:, :, 0], axis=1).max(),
+                        tolerance)
+        # unreachable positions are solved exactly
+        path[500] = [0, 0, 10]
+        angles, valid = dut.solve_tip_path(path, tolerance)
+        self.assertFalse(valid[500])
+        self.assertTrue(np.isnan(angles[500]).all())
+        self.assertEqual(dut.solve_tip_path(np.empty((0, 3)),
+                                            tolerance)[0].shape, (0, 3))
+
+    def test_adaptive_path_deviation(self):
+        dut = deltaRobot.DeltaMechanics(L=0.524, l=1.244, wb=0.164, up=0.044)
+        tolerance = 1e-4
+        u = np.linspace(0.0, 1.0, 1025)[:, np.newaxis]
+        t = 3.9 * u
+        paths = [
+            # wave crosses the straight line at all the checked points
+            np.array([-0.2, -0.1, -1.0]) + u * np.array([0.3, 0.2, -0.1])
+            + 0.001 * np.sin(64 * np.pi * u) * np.array([0.0, 0.0, 1.0]),
+            # curved path near the workspace edge
+            np.array([0.35, 0.2, -1.0]) + 0.23 * np.column_stack(
+                (np.cos(t), np.sin(t), 0.2 * np.sin(3 * t)))]
+        for path in paths:
+            angles, valid = dut.solve_tip_path(path, tolerance)
+            self.assertTrue(valid.all())
+            # every sample, not only the checked ones
+            tip_pos, tip_valid = dut.solve_motor_angles(angles)
+            self.assertTrue(tip_valid.all())
+            self.assertLessEqual(
+                np.linalg.norm(tip_pos - path, axis=1).max(), tolerance)
+
+    def test_forward_kinematics(self):
+        dut = deltaRobot.DeltaMechanics(L=0.524, l=1.244, wb=0.164, up=0.044)
+        positions = np.array([[0, 0, -0.9],
+                              [0.3, 0.5, -1.1],
+                              [-0.2, 0.1, -1.3],
+                              [0.1, -0.3, -1.2]])
+        angles, valid = dut.solve_tip_positions(positions)
+        self.assertTrue(valid.all())
+        tip_pos, valid = dut.solve_motor_angles(angles)
+        self.assertTrue(valid.all())
+        np.testing.assert_allclose(tip_pos, positions, atol=1e-12)
+        # forearms are too short to reach each other
+        dut = deltaRobot.DeltaMechanics(L=0.04, l=0.02, wb=0.02, up=0.00922)
+        tip_pos, valid = dut.solve_motor_angles(np.array([[1.5, 1.5, 1.5],
+                                                          [0.0, 0.0, 0.0]]))
+        self.assertEqual(list(valid), [True, False])
+        self.assertTrue(np.isnan(tip_pos[1]).all())
+        self.assertRaises(ValueError, dut.solve_motor_angles, np.zeros(3))
+
+    def test_batch_wrong_shape(self):
+        dut = deltaRobot.DeltaMechanics(L=0.524, l=1.244, wb=0.164, up=0.044)
+        self.assertRaises(ValueError, dut.solve_tip_positions, np.zeros(3))
+
+    def test_batch_motor_speeds(self):
+        """motor speeds are compared with the finite differences of motor
+        angles"""
+        dut = deltaRobot.DeltaMechanics(L=0.524, l=1.244, wb=0.164, up=0.044)
+        positions = np.array([[0, 0, -0.9],
+                              [0.3, 0.5, -1.1],
+                              [-0.2, 0.1, -1.3]])
+        speeds = np.array([[0.1, 0.0, 0.0],
+                           [-0.3, 0.2, 0.5],
+                           [0.0, 0.0, -1.0]])
+        delta_t = 1e-7
+        angles, _ = dut.solve_tip_positions(positions)
+        next_angles, _ = dut.solve_tip_positions(positions + speeds * delta_t)
+        theta_prime = dut.motor_speeds(positions, speeds)
+        self.assertEqual(theta_prime.shape, (3, 3))
+        np.testing.assert_allclose(theta_prime,
+                                   (next_angles - angles) / delta_t,
+                                   rtol=1e-4, atol=1e-6)
+        jacobian = dut.jacobian(positions, angles)
+        np.testing.assert_allclose(np.einsum('nij,nj->ni', jacobian, speeds),
+                                   theta_prime)
+        for pos, speed, expected in zip(positions, speeds, theta_prime):
+            dut.update_from_new_tip_pos(pos)
+            dut.update_motor_speed_from_tip_speed(speed.reshape(3, 1))
+            np.testing.assert_allclose(dut.theta_prime[:, 0], expected)
+        self.assertRaises(ValueError, dut.motor_speeds, positions,
+                          speeds[0:2])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,46 @@
+from unittest import TestCase
+from cnc.gcode import *
+
+
+class TestGCode(TestCase):
+
+    def test_values(self):
+        g = GCode.parse_line("G1 X-1.5 Y+2 Z.5 E3. F60")
+        self.assertEqual(g.command(), 'G1')
+        self.assertEqual(g.coordinates(Coordinates(0, 0, 0, 0), 1.0),
+                         Coordinates(-1.5, 2, 0.5, 3))
+        self.assertEqual(g.get('F'), 60.0)
+        self.assertEqual(g.get('X', multiply=2.0), -3.0)
+        self.assertEqual(g.get('S', 7), 7)
+        self.assertTrue(g.has('X'))
+        self.assertFalse(g.has('S'))
+
+    def test_commands(self):
+        self.assertEqual(GCode.parse_line("G01").command(), 'G1')
+        self.assertEqual(GCode.parse_line("M114").command(), 'M114')
+        self.assertIsNone(GCode.parse_line("X1 Y2").command())
+        self.assertEqual(GCode.parse_line("g1x1y2").command(), 'G1')
+
+    def test_comments(self):
+        self.assertIsNone(GCode.parse_line(""))
+        self.assertIsNone(GCode.parse_line("   "))
+        self.assertIsNone(GCode.parse_line("(comment)"))
+        self.assertIsNone(GCode.parse_line("; comment"))
+        self.assertIsNone(GCode.parse_line("%"))
+        g = GCode.parse_line("G1 (move) X1 ; comment X2")
+        self.assertEqual(g.get('X'), 1.0)
+
+    def test_errors(self):
+        self.assertRaisesRegex(GCodeException, "gcode not found",
+                               GCode.parse_line, "exit")
+        self.assertRaisesRegex(GCodeException, "extra characters",
+                               GCode.parse_line, "G1 X")
+        self.assertRaisesRegex(GCodeException, "extra characters",
+                               GCode.parse_line, "G1 X1 (unclosed")
+        self.assertRaisesRegex(GCodeException, "duplicated",
+                               GCode.parse_line, "G1 X1 X2")
+        self.assertRaisesRegex(GCodeException, "g and m",
+                               GCode.parse_line, "G1 M3")
+        # malformed numbers fail when they are read
+        g = GCode.parse_line("G1 X1..2")
+        self.assertRaises(ValueError, g.get, 'X')
@@ -0,0 +1,130 @@
+from unittest import TestCase
+import numpy as np
+import cnc.gmachine
+from cnc.config import REAL_TIME_DT, DELTA_Z_OFFSET
+from cnc.gcode import GCode
+from cnc.hal import HalFileExporter
+from cnc.gmachine import GMachine, GMachineException
+from cnc.coordinates import Coordinates
+
+
+class RecordingHal(object):
+    """ Keeps samples of all movements instead of running them.
+    """
+    def __init__(self):
+        self.samples = []
+
+    def check_valid_position(self, x, y, z):
+        return True
+
+    def check_valid_segment(self, start, end):
+        return True
+
+    def check_valid_path(self, points):
+        return True
+
+    def move(self, generator):
+        self.samples.append(generator.sample_all())
+
+    def spindle_control(self, percent):
+        pass
+
+    def join(self):
+        pass
+
+    def deinit(self):
+        pass
+
+
+class LimitedHal(HalFileExporter):
+    """ Real hal which keeps samples of all movements instead of running
+        them.
+    """
+    def __init__(self):
+        HalFileExporter.__init__(self, open_stream=False)
+        self.samples = []
+
+    def move(self, generator):
+        self.samples.append(generator.sample_all())
+
+    def motor_speeds(self):
+        tip_pos = np.vstack(self.samples)[:, 0:3] / 1000
+        tip_pos[:, 2] += DELTA_Z_OFFSET
+        angles, _ = self.robot.solve_tip_positions(tip_pos)
+        return np.abs(np.diff(angles, axis=0)) / REAL_TIME_DT
+
+
+class TestGMachine(TestCase):
+    def setUp(self):
+        self.hal = RecordingHal()
+        self.m = GMachine(self.hal)
+
+    def _run(self, *lines):
+        for line in lines:
+            self.m.do_command(GCode.parse_line(line))
+
+    def test_linear(self):
+        self._run("G1 X10 Y10 F600", "G1 X20 Y0", "G1 Z-5")
+        self.assertEqual(self.m.position(), Coordinates(20, 0, -5, 0))
+        samples = np.vstack(self.hal.samples)
+        np.testing.assert_array_equal(samples[-1], (20, 0, -5, 0))
+
+    def test_arc(self):
+        self._run("G1 X10 F600", "G3 X0 Y10 I-10")
+        self.assertEqual(self.m.position(), Coordinates(0, 10, 0, 0))
+        arc = self.hal.samples[-1]
+        np.testing.assert_array_almost_equal(np.hypot(arc[:, 0], arc[:, 1]),
+                                             np.full(len(arc), 10.0))
+        self.assertTrue(np.all(arc[:, 0] >= -1e-9))
+        self._run("G2 X10 Y0 J-10")
+        self.assertEqual(self.m.position(), Coordinates(10, 0, 0, 0))
+        self.assertTrue(np.all(self.hal.samples[-1][:, 1] >= -1e-9))
+
+    def test_arc_planes(self):
+        self._run("G1 Z10 F600", "G18", "G3 X10 Z0 K-10")
+        arc = self.hal.samples[-1]
+        np.testing.assert_array_almost_equal(np.hypot(arc[:, 0], arc[:, 2]),
+                                             np.full(len(arc), 10.0))
+        self._run("G19", "G2 Y10 Z10 J10")
+        self.assertEqual(self.m.position(), Coordinates(10, 10, 10, 0))
+        arc = self.hal.samples[-1]
+        np.testing.assert_array_almost_equal(
+            np.hypot(arc[:, 1] - 10, arc[:, 2]), np.full(len(arc), 10.0))
+        self._run("G17", "G2 X0 Y0 I-10")
+        self.assertEqual(self.m.position(), Coordinates(0, 0, 10, 0))
+
+    def test_arc_errors(self):
+        self.assertRaises(GMachineException, self._run, "G2 X10 Y10")
+        self.assertRaises(GMachineException, self._run, "G2 X10 Y10 I20")
+
+    def test_arc_out_of_area(self):
+        """ both ends are reachable, but the long way round is not """
+        hal = LimitedHal()
+        self.m = GMachine(hal)
+        self._run("G1 X5 F600")
+        self.assertTrue(hal.check_valid_position(-5, 0, 0))
+        self.assertRaisesRegex(GMachineException, "out of effective area",
+                               self._run, "G2 X-5 Y0 I-5 J-15")
+        self._run("G3 X-5 Y0 I-5 J-15")
+        self.m.release()
+
+    def test_motor_speed_limit(self):
+        lines = ("G1 X10 Y0 Z-5 F6000", "G1 X-10 Y5", "G2 X10 Y5 I10 J0",
+                 "G1 X0 Y0 Z0")
+        hal = LimitedHal()
+        self.m = GMachine(hal)
+        limit = 2.0
+        cnc.gmachine.MOTOR_MAX_SPEED_RAD_PER_S = limit
+        try:
+            self._run(*lines)
+        finally:
+            cnc.gmachine.MOTOR_MAX_SPEED_RAD_PER_S = None
+        self.m.release()
+        speeds = hal.motor_speeds()
+        self.assertLess(speeds.max(), limit * 1.01)
+        # unlimited movements are faster
+        hal = LimitedHal()
+        self.m = GMachine(hal)
+        self._run(*lines)
+        self.m.release()
+        self.assertGreater(hal.motor_speeds().max(), limit * 1.5)
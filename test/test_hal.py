@@ -0,0 +1,172 @@
+from unittest import TestCase
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import cnc.hal
+from cnc.config import *
+from cnc.coordinates import Coordinates
+from cnc.gcode import GCode
+from cnc.gmachine import GMachine
+from cnc.hal import *
+from cnc.path import PathGenerator
+from cnc.rtstream import *
+
+LINES = ("G1 X10 Y0 Z-5 F3000", "G1 X-10 Y5", "G2 X10 Y5 I10 J0",
+         "G1 X0 Y0 Z0", "M114")
+
+
+class KeptBytesIO(io.BytesIO):
+    """ hal closes stream on release, keep it readable.
+    """
+    def close(self):
+        pass
+
+
+class SlowBytesIO(KeptBytesIO):
+    """ Stream which blocks writes until it is released.
+    """
+    def __init__(self):
+        KeptBytesIO.__init__(self)
+        self.release = threading.Event()
+
+    def write(self, data):
+        self.release.wait()
+        return KeptBytesIO.write(self, data)
+
+
+class BrokenBytesIO(KeptBytesIO):
+    def write(self, data):
+        raise IOError("device is gone")
+
+
+class TestHal(TestCase):
+    def test_outputs(self):
+        tmp = tempfile.mkdtemp()
+        stream_path = os.path.join(tmp, 'stream')
+        tip_path = os.path.join(tmp, 'tips')
+        cnc.hal.RT_STREAM_PATH = stream_path
+        cnc.hal.TIP_LOG_PATH = tip_path
+        try:
+            hal = HalFileExporter()
+        finally:
+            cnc.hal.RT_STREAM_PATH = None
+            cnc.hal.TIP_LOG_PATH = None
+        delta = Coordinates(5.0, -2.0, 1.0, 0.0)
+        generator = PathGenerator(delta, delta, 600)
+        samples = generator.sample_all()
+        text = io.StringIO()
+        with contextlib.redirect_stdout(text):
+            hal.move(generator)
+            hal.deinit()
+        self.assertEqual(text.getvalue(), "")
+        with open(stream_path) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(len(lines), len(samples))
+        self.assertTrue(all(line.startswith("rt-cmd:POS ") for line in lines))
+        with open(tip_path) as f:
+            tips = f.read().splitlines()
+        self.assertEqual(tips[-1], "tip: {:f} {:f} {:f}".format(5, -2, 1))
+        self.assertEqual(len(tips), len(samples))
+        shutil.rmtree(tmp)
+
+
+class TestAsyncHal(TestCase):
+    def _run(self, hal):
+        stream = KeptBytesIO()
+        hal._rt_writer = RtStreamWriter(stream, ENCODING_ANGLE)
+        machine = GMachine(hal)
+        text = io.StringIO()
+        with contextlib.redirect_stdout(text):
+            answers = [machine.do_command(GCode.parse_line(line))
+                       for line in LINES]
+            machine.release()
+        return stream.getvalue(), text.getvalue(), answers[-1]
+
+    def test_same_output(self):
+        expected = self._run(HalFileExporter(open_stream=False))
+        for size in (1, 4):
+            hal = AsyncHalFileExporter(size, open_stream=False)
+            self.assertEqual(self._run(hal), expected)
+
+    def test_join(self):
+        hal = AsyncHalFileExporter(2, open_stream=False)
+        stream = SlowBytesIO()
+        stream.release.set()
+        hal._rt_writer = RtStreamWriter(stream, ENCODING_ANGLE)
+        stream.release.clear()
+        delta = Coordinates(5.0, 0.0, 0.0, 0.0)
+        with contextlib.redirect_stdout(io.StringIO()):
+            hal.move(PathGenerator(delta, delta, 600))
+            hal.move(PathGenerator(delta, delta * 2, 600))
+            joined = threading.Event()
+            thread = threading.Thread(
+                target=lambda: (hal.join(), joined.set()))
+            thread.start()
+            # nothing is written yet, so join waits
+            self.assertFalse(joined.wait(0.2))
+            stream.release.set()
+            thread.join()
+            self.assertTrue(joined.is_set())
+            hal.deinit()
+        _, frames = read_stream(stream.getvalue())
+        self.assertGreater(len(frames), 0)
+
+    def test_error(self):
+        hal = AsyncHalFileExporter(2, open_stream=False)
+        hal._rt_writer = RtStreamWriter(KeptBytesIO(), ENCODING_ANGLE)
+        hal._rt_writer._fh = BrokenBytesIO()
+        delta = Coordinates(5.0, 0.0, 0.0, 0.0)
+        with contextlib.redirect_stdout(io.StringIO()):
+            hal.move(PathGenerator(delta, delta, 600))
+            self.assertRaises(GHalException, hal.join)
+            # error is reported once
+            hal.join()
+            hal._rt_writer = None
+            hal.deinit()
+
+    def test_invalid_move(self):
+        hal = AsyncHalFileExporter(2, open_stream=False)
+        delta = Coordinates(500.0, 0.0, 0.0, 0.0)
+        self.assertRaises(GHalException, hal.move,
+                          PathGenerator(delta, delta, 600))
+        hal.deinit()
+
+
+class TestHalServoDirect(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        for channel in range(3):
+            os.mkdir(os.path.join(self.root, 'pwm{}'.format(channel)))
+            open(self._path(channel), 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _path(self, channel):
+        return os.path.join(self.root, 'pwm{}'.format(channel), 'duty_cycle')
+
+    def test_play(self):
+        hal = HalServoDirect(2, self.root, (0, 1, 2))
+        delta = Coordinates(2.0, -1.0, 1.0, 0.0)
+        generator = PathGenerator(delta, delta, 600)
+        _, angles = HalFileExporter._solve(hal, generator)
+        start = time.monotonic()
+        hal.move(generator)
+        hal.join()
+        elapsed = time.monotonic() - start
+        hal.deinit()
+        self.assertEqual(hal.stats['frames'], len(angles))
+        self.assertEqual(hal.stats['underruns'], 0)
+        self.assertGreaterEqual(elapsed, (len(angles) - 1) * REAL_TIME_DT)
+        duty = SERVO_MODEL_SLOPE_NS_PER_RAD * angles[-1] \
+            + SERVO_MODEL_INTERCEPT_NS
+        for channel in range(3):
+            with open(self._path(channel)) as f:
+                self.assertEqual(int(f.read()), int(duty[channel]))
+            with open(os.path.join(self.root, 'pwm{}'.format(channel),
+                                   'enable')) as f:
+                self.assertEqual(f.read(), '0')
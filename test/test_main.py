@@ -0,0 +1,29 @@
+from unittest import TestCase
+import cnc.main
+from cnc.compiler import _CompilerHal
+from cnc.gmachine import GMachine
+
+
+class TestMain(TestCase):
+    def test_interactive_moves(self):
+        samples = []
+        lines = iter(["G1 X1 F600", "exit"])
+        seen = []
+
+        def raw_input(prompt):
+            # movements of the previous line ran before the next prompt
+            seen.append(len(samples))
+            return next(lines)
+
+        cnc.main.machine = GMachine(_CompilerHal(
+            lambda s, _: samples.append(s)))
+        cnc.main.raw_input, original = raw_input, cnc.main.raw_input
+        try:
+            cnc.main.interactive()
+        finally:
+            cnc.main.raw_input = original
+            cnc.main.machine.release()
+            cnc.main.machine = None
+        self.assertEqual(seen[0], 0)
+        self.assertGreater(seen[1], 0)
+        self.assertEqual(samples[-1][-1, 0], 1.0)
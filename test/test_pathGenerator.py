@@ -88,3 +88,60 @@ class TestPathGenerator(TestCase):
                             .format(velocity_mm_per_min))
         self.assertAlmostEqual(max_speed, velocity_mm_per_min / SECONDS_IN_MINUTE, 1,
                                "Effective max speed not correct when trying {:f} mm/min".format(velocity_mm_per_min))
+
+    def test_sample_all_matches_iterator(self):
+        start = Coordinates(1, -2, 3, 0)
+        deltas = [Coordinates(60, 0, 0, 0), Coordinates(-10, 5, 0, 0),
+                  Coordinates(3, -7, -2, 1), Coordinates(0, 0, -0.3, 0)]
+        for delta_mm in deltas:
+            for velocity_mm_per_min in (60, 1200, MAX_VELOCITY_MM_PER_MIN_X):
+                dut = PathGenerator(delta_mm, start + delta_mm, velocity_mm_per_min)
+                samples = dut.sample_all()
+                self.assertEqual(samples.dtype, np.float64)
+                self.assertTrue(samples.flags['C_CONTIGUOUS'])
+                np.testing.assert_array_equal(samples, np.array(list(dut)))
+
+    def test_end_position_negative_direction(self):
+        start = Coordinates(0, 0, 0, 0)
+        target_pos = Coordinates(-10, 5, -2, 0)
+        dut = PathGenerator(target_pos - start, target_pos, 600)
+        last_pos = dut.sample_all()[-1]
+        np.testing.assert_array_almost_equal(last_pos, [-10, 5, -2, 0])
+
+
+class TestSCurvePathGenerator(TestCase):
+
+    def test_end_position(self):
+        start = Coordinates(1, -2, 3, 0)
+        for delta_mm in (Coordinates(60, 0, 0, 0), Coordinates(-10, 5, 0, 0),
+                         Coordinates(0.01, 0, 0, 0)):
+            for velocity_mm_per_min in (60, 1200, MAX_VELOCITY_MM_PER_MIN_X):
+                dut = SCurvePathGenerator(delta_mm, start + delta_mm,
+                                          velocity_mm_per_min)
+                samples = dut.sample_all()
+                np.testing.assert_array_equal(samples[0], [1, -2, 3, 0])
+                end = start + delta_mm
+                np.testing.assert_array_almost_equal(
+                    samples[-1], [end.x, end.y, end.z, end.e])
+                np.testing.assert_array_equal(samples, np.array(list(dut)))
+
+    def test_jerk_limit(self):
+        delta_mm = Coordinates(100, 50, 0, 0)
+        dut = SCurvePathGenerator(delta_mm, delta_mm, 12000)
+        samples = dut.sample_all()
+        v = np.linalg.norm(np.diff(samples, axis=0), axis=1) / REAL_TIME_DT
+        a = np.diff(v) / REAL_TIME_DT
+        j = np.diff(a) / REAL_TIME_DT
+        self.assertLessEqual(v.max(), 12000 / SECONDS_IN_MINUTE + 1e-9)
+        self.assertLessEqual(np.abs(a).max(),
+                             TIP_MAX_ACCELERATION_MM_PER_S2 * 1.01)
+        self.assertLessEqual(np.abs(j).max(), TIP_MAX_JERK_MM_PER_S3 * 1.01)
+
+    def test_profile_selection(self):
+        delta_mm = Coordinates(10, 0, 0, 0)
+        self.assertIsInstance(path_generator(delta_mm, delta_mm, 600,
+                                             'trapezoidal'), PathGenerator)
+        self.assertIsInstance(path_generator(delta_mm, delta_mm, 600,
+                                             'scurve'), SCurvePathGenerator)
+        self.assertRaises(ValueError, path_generator, delta_mm, delta_mm,
+                          600, 'sine')
@@ -0,0 +1,74 @@
+from unittest import TestCase
+import math
+import numpy as np
+from cnc.planner import *
+from cnc.path import PathGenerator
+from cnc.coordinates import Coordinates
+from cnc.config import *
+
+
+class TestLookaheadPlanner(TestCase):
+    def _run(self, points, velocity, depth=16):
+        planner = LookaheadPlanner(depth)
+        segments = []
+        for a, b in zip(points, points[1:]):
+            segments += planner.append(PlannedSegment(b - a, b, velocity))
+        segments += planner.flush()
+        self.assertTrue(planner.empty())
+        return segments
+
+    def test_straight_line_does_not_stop(self):
+        points = [Coordinates(x, 0, 0, 0) for x in range(0, 50, 5)]
+        segments = self._run(points, 3000)
+        for segment in segments[1:]:
+            self.assertAlmostEqual(segment.max_entry_speed, 50.0)
+        self.assertEqual(segments[0].entry_speed, 0.0)
+        self.assertEqual(segments[-1].exit_speed, 0.0)
+
+    def test_reverse_stops(self):
+        points = [Coordinates(0, 0, 0, 0), Coordinates(10, 0, 0, 0),
+                  Coordinates(0, 0, 0, 0)]
+        segments = self._run(points, 3000)
+        self.assertEqual(segments[1].entry_speed, 0.0)
+
+    def test_corner(self):
+        points = [Coordinates(0, 0, 0, 0), Coordinates(10, 0, 0, 0),
+                  Coordinates(10, 10, 0, 0)]
+        segments = self._run(points, 3000)
+        self.assertGreater(segments[1].entry_speed, 0.0)
+        self.assertLess(segments[1].entry_speed, 50.0)
+        self.assertEqual(segments[0].exit_speed, segments[1].entry_speed)
+
+    def test_samples(self):
+        points = [Coordinates(10 * math.cos(a), 10 * math.sin(a), 0, 0)
+                  for a in np.linspace(0, 2 * math.pi, 91)]
+        for depth in (1, 4, 16):
+            segments = self._run(points, 3000, depth)
+            samples = np.vstack([s.sample_all() for s in segments])
+            np.testing.assert_array_equal(samples[0], (10, 0, 0, 0))
+            np.testing.assert_array_equal(samples[-1], (points[-1].x,
+                                                        points[-1].y, 0, 0))
+            velocity = np.linalg.norm(np.diff(samples, axis=0), axis=1) \
+                / REAL_TIME_DT
+            self.assertLessEqual(velocity.max(), 50.0 + 1e-9)
+            # each movement of PathGenerator stops at the vertex
+            single = sum(len(PathGenerator(b - a, b, 3000).sample_all())
+                         for a, b in zip(points, points[1:]))
+            self.assertLess(len(samples), single / 2)
+
+    def test_jerk_limited_samples(self):
+        points = [Coordinates(0, 0, 0, 0), Coordinates(20, 0, 0, 0),
+                  Coordinates(20, 20, 0, 0), Coordinates(40, 20, 0, 0)]
+        planner = LookaheadPlanner(16)
+        segments = []
+        for a, b in zip(points, points[1:]):
+            segments += planner.append(PlannedSegment(
+                b - a, b, 3000, TIP_MAX_JERK_MM_PER_S3))
+        segments += planner.flush()
+        for segment in segments:
+            self.assertLessEqual(scurve_distance(
+                segment.entry_speed, segment.exit_speed,
+                TIP_MAX_ACCELERATION_MM_PER_S2, TIP_MAX_JERK_MM_PER_S3),
+                segment.length_mm * (1 + 1e-9))
+        samples = np.vstack([s.sample_all() for s in segments])
+        np.testing.assert_array_equal(samples[-1], (40, 20, 0, 0))
@@ -0,0 +1,151 @@
+from unittest import TestCase
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+import cnc.rtstream
+from cnc.rtstream import *
+from cnc.config import *
+import numpy as np
+
+PLAYER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                          'realTimePlayer')
+
+# reads stream with realTimePlayer code and prints angles of frames
+PLAYER_READ = r"""
+#include <stdio.h>
+#include "rtstream.h"
+
+static int print_frame(void *ctx, const rt_frame_t *frame)
+{
+	printf("%f %f %f\n", frame->ang[0], frame->ang[1], frame->ang[2]);
+	return 0;
+}
+
+int main(int argc, char *argv[])
+{
+	rt_stream_params_t params;
+
+	return rt_stream_read(argv[1], &params, print_frame, NULL) ? 1 : 0;
+}
+"""
+
+
+class TestRtStream(TestCase):
+    def setUp(self):
+        self.angles = np.array([[-0.74, -0.73, -0.72],
+                                [0.1, 0.2, 0.3],
+                                [-1.5, 0.0, 1.25]])
+
+    def test_header(self):
+        data = encode_header(ENCODING_ANGLE)
+        self.assertEqual(len(data), HEADER_SIZE)
+        header = decode_header(data)
+        self.assertEqual(header['encoding'], ENCODING_ANGLE)
+        self.assertAlmostEqual(header['dt_s'], REAL_TIME_DT)
+        self.assertAlmostEqual(header['motor_offset_rad'][0], MOTOR0_OFFSET_RAD, 6)
+        self.assertRaises(RtStreamException, decode_header, b'RPDX' + data[4:])
+
+    def test_angle_round_trip(self):
+        data = encode_header(ENCODING_ANGLE) + encode_frames(self.angles, ENCODING_ANGLE)
+        self.assertEqual(len(data), HEADER_SIZE + 3 * FRAME_SIZE)
+        header, frames = read_stream(data)
+        np.testing.assert_array_equal(frames, self.angles.astype(np.float32))
+
+    def test_duty(self):
+        data = encode_header(ENCODING_DUTY) + encode_frames(self.angles, ENCODING_DUTY)
+        header, frames = read_stream(data)
+        self.assertEqual(frames.dtype, np.uint32)
+        # same truncation as ang_to_duty() in realTimePlayer
+        self.assertEqual(frames[2, 1], int(SERVO_MODEL_INTERCEPT_NS))
+        self.assertEqual(frames[1, 0], int(SERVO_MODEL_SLOPE_NS_PER_RAD * float(np.float32(0.1))
+                                           + SERVO_MODEL_INTERCEPT_NS))
+        # model is clamped to the pulse widths of the header
+        frames = angles_to_duty(np.array([[-10.0, 10.0, 0.0]]))
+        self.assertEqual(frames[0].tolist(), [SERVO_PULSE_MIN_NS, SERVO_PULSE_MAX_NS,
+                                              int(SERVO_MODEL_INTERCEPT_NS)])
+        self.assertEqual(angles_to_duty(np.array([[10.0, 0.0, 0.0]]), pulse_max=2000000)[0, 0],
+                         2000000)
+
+    def test_calibrated_duty(self):
+        fd, path = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f:
+            for channel in range(3):
+                f.write("{0} -1.0 1000000\n{0} 0.0 {1}\n{0} 1.0 2000000\n"
+                        .format(channel, 1400000 + channel * 100000))
+        cnc.rtstream.SERVO_CALIBRATION_PATH = path
+        try:
+            data = encode_header(ENCODING_DUTY) \
+                + encode_frames(self.angles, ENCODING_DUTY)
+        finally:
+            cnc.rtstream.SERVO_CALIBRATION_PATH = None
+            os.remove(path)
+        header, frames = read_stream(data)
+        self.assertEqual(header['flags'], FLAG_CALIBRATED)
+        # clamped to the ends of the tables
+        self.assertEqual(frames[2].tolist(), [1000000, 1500000, 2000000])
+        self.assertEqual(frames[1, 2], int(1600000 + 400000
+                                           * float(np.float32(0.3))))
+        self.assertEqual(decode_header(encode_header(ENCODING_DUTY))['flags'],
+                         0)
+
+    def test_truncated(self):
+        data = encode_header(ENCODING_ANGLE) + encode_frames(self.angles, ENCODING_ANGLE)
+        self.assertRaises(RtStreamException, read_stream, data[:-1])
+
+    def test_text(self):
+        expected = "".join("rt-cmd:POS {:f} {:f} {:f}\n".format(*row)
+                           for row in self.angles)
+        self.assertEqual(format_text_frames(self.angles), expected)
+        self.assertEqual(format_text_frames(np.empty((0, 3))), "")
+        fh = io.StringIO()
+        writer = RtTextWriter(fh)
+        writer.write(self.angles)
+        writer.write(self.angles[0:1])
+        self.assertEqual(fh.getvalue(),
+                         expected + expected.splitlines(True)[0])
+
+
+class TestPlayerStream(TestCase):
+    """ realTimePlayer reads the streams of the planner.
+    """
+    @classmethod
+    def setUpClass(cls):
+        if shutil.which('gcc') is None:
+            raise unittest.SkipTest("no C compiler")
+        cls.dir = tempfile.mkdtemp()
+        source = os.path.join(cls.dir, 'read.c')
+        with open(source, 'w') as f:
+            f.write(PLAYER_READ)
+        cls.player = os.path.join(cls.dir, 'read')
+        subprocess.check_call(['gcc', '-I', PLAYER_DIR, source,
+                               os.path.join(PLAYER_DIR, 'rtstream.c'),
+                               '-o', cls.player])
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dir)
+
+    def _player(self, data, pipe=False):
+        if pipe:
+            result = subprocess.run([self.player, '-'], input=data,
+                                    stdout=subprocess.PIPE)
+        else:
+            path = os.path.join(self.dir, 'stream')
+            with open(path, 'wb') as f:
+                f.write(data)
+            result = subprocess.run([self.player, path],
+                                    stdout=subprocess.PIPE)
+        self.assertEqual(result.returncode, 0)
+        return result.stdout.decode()
+
+    def test_text(self):
+        angles = np.array([[0.1, 0.2, 0.3], [-0.5, 0.25, 1.5]])
+        text = format_text_frames(angles)
+        # the first bytes detect the format, they can hold whole lines
+        for prefix in ("", "\n", "\r\n", "\n\n\n\n\n", "ok\n", "ok ok\n"):
+            for pipe in (False, True):
+                self.assertEqual(self._player((prefix + text).encode(), pipe),
+                                 text.replace('rt-cmd:POS ', ''), repr(prefix))
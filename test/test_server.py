@@ -0,0 +1,224 @@
+from unittest import TestCase
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+from cnc.compiler import _CompilerHal
+from cnc.coordinates import Coordinates
+from cnc.gmachine import GMachine, GMachineException
+from cnc.server import *
+
+
+class SlowMachine(object):
+    """ Machine which runs commands when the test lets it.
+    """
+    def __init__(self):
+        self.commands = []
+        self.go = threading.Event()
+        self.flushed = 0
+        # number of commands before the last flush
+        self.flushed_after = None
+
+    def do_command(self, gcode):
+        self.go.wait()
+        self.commands.append(gcode)
+        if gcode is not None and gcode.command() == 'M999':
+            raise GMachineException("bad command")
+        return None
+
+    def planned_position(self):
+        return Coordinates(float(len(self.commands)), 0.0, 0.0, 0.0)
+
+    def flush(self):
+        self.flushed += 1
+        self.flushed_after = len(self.commands)
+
+
+class TestServer(TestCase):
+    def _run(self, machine, client, queue_size=SERVER_QUEUE_SIZE):
+        async def run():
+            server = GCodeServer(machine, queue_size)
+            tcp = await server.start_tcp('127.0.0.1', 0)
+            port = tcp.sockets[0].getsockname()[1]
+            try:
+                return await asyncio.wait_for(client(port), 10)
+            finally:
+                await server.close()
+        return asyncio.run(run())
+
+    def test_program(self):
+        samples = []
+        machine = GMachine(_CompilerHal(lambda s, _: samples.append(s)))
+
+        async def client(port):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            greeting = await reader.readline()
+            writer.write(b"G1 X1 Y2 F600\n; comment\nG1 X2\nG99\nM114\n"
+                         b"G1 X2 Y3\nM114\nG1 X0 Y0\nexit\n")
+            answers = [await reader.readline() for _ in range(8)]
+            self.assertEqual(await reader.read(), b'')
+            writer.close()
+            return greeting, answers
+
+        greeting, answers = self._run(machine, client)
+        self.assertEqual(greeting, "PyCNC queue {}\n"
+                         .format(SERVER_QUEUE_SIZE).encode())
+        answers = [answer.decode().strip() for answer in answers]
+        # queries are answered ahead of the queued lines
+        queued = [answer for answer in answers if ' X:' not in answer]
+        self.assertEqual(queued, ['OK', 'OK', 'OK', 'ERROR unknown command',
+                                  'OK', 'OK'])
+        self.assertEqual(len(answers) - len(queued), 2)
+        self.assertTrue(samples)
+        # movements are flushed when the stream ends
+        self.assertEqual(machine.planned_position(),
+                         Coordinates(0.0, 0.0, 0.0, 0.0))
+        self.assertTrue((samples[-1][-1, 0:2] == 0.0).all())
+        machine.release()
+
+    def test_flow_control(self):
+        machine = SlowMachine()
+        lines = 200
+
+        async def client(port):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            window = int((await reader.readline()).split()[-1]) + 1
+            # host fills the queue, queries are answered while it is busy
+            writer.write(b"G1 X1\n" * window + b"M114\n")
+            status = await reader.readline()
+            self.assertEqual(machine.commands, [])
+            machine.go.set()
+            answers = []
+            for _ in range(lines - window):
+                answers.append(await reader.readline())
+                writer.write(b"G1 X1\n")
+            writer.write(b"M999\n")
+            while len(answers) < lines + 1:
+                answers.append(await reader.readline())
+            writer.close()
+            return status, answers
+
+        status, answers = self._run(machine, client, 4)
+        self.assertEqual(status, b"OK X:0.0 Y:0.0 Z:0.0 E:0.0\n")
+        self.assertEqual(answers, [b"OK\n"] * lines + [b"ERROR bad command\n"])
+        # flushed whenever the queue got empty, the last time at the end
+        self.assertEqual(machine.flushed_after, lines + 1)
+
+    def test_idle_stream_moves(self):
+        samples = []
+        machine = GMachine(_CompilerHal(lambda s, _: samples.append(s)))
+
+        async def client(port):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            await reader.readline()
+            writer.write(b"G1 X1 F600\n")
+            self.assertEqual(await reader.readline(), b"OK\n")
+            # the connection stays open, but no more lines come
+            for _ in range(100):
+                if samples:
+                    break
+                await asyncio.sleep(0.05)
+            moved = bool(samples)
+            writer.close()
+            return moved
+
+        self.assertTrue(self._run(machine, client))
+        self.assertEqual(samples[-1][-1, 0], 1.0)
+        machine.release()
+
+    def test_queue_is_bounded(self):
+        machine = SlowMachine()
+        server = GCodeServer(machine, 4)
+
+        async def run():
+            tcp = await server.start_tcp('127.0.0.1', 0)
+            port = tcp.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            await reader.readline()
+            writer.write(b"G1 X1\n" * 20 + b"M114\n")
+            # the server doesn't read lines over the queue, so the query
+            # waits behind them
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(reader.readline(), 0.3)
+            machine.go.set()
+            answers = [await reader.readline() for _ in range(21)]
+            writer.close()
+            await server.close()
+            return answers
+
+        answers = asyncio.run(run())
+        self.assertEqual(answers.count(b"OK\n"), 20)
+        self.assertTrue(any(answer.startswith(b"OK X:")
+                            for answer in answers))
+
+    def test_close_ends_streams(self):
+        machine = SlowMachine()
+        machine.go.set()
+        server = GCodeServer(machine)
+
+        async def run():
+            tcp = await server.start_tcp('127.0.0.1', 0)
+            port = tcp.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            await reader.readline()
+            writer.write(b"G1 X1\n")
+            self.assertEqual(await reader.readline(), b"OK\n")
+            # the client stays connected when the server closes
+            await server.close()
+            flushed = machine.flushed
+            writer.close()
+            return flushed, await reader.read()
+
+        flushed, rest = asyncio.run(run())
+        self.assertEqual(flushed, 1)
+        self.assertEqual(rest, b'')
+
+    def test_streams_take_turns(self):
+        machine = SlowMachine()
+        machine.go.set()
+
+        async def client(port):
+            first = await asyncio.open_connection('127.0.0.1', port)
+            second = await asyncio.open_connection('127.0.0.1', port)
+            for reader, _ in (first, second):
+                await reader.readline()
+            first[1].write(b"G1 X1\n")
+            self.assertEqual(await first[0].readline(), b"OK\n")
+            second[1].write(b"G1 X2\nM114\n")
+            # the second stream waits, but queries are answered
+            self.assertEqual(await second[0].readline(),
+                             b"OK X:1.0 Y:0.0 Z:0.0 E:0.0\n")
+            first[1].write(b"G1 X3\n")
+            self.assertEqual(await first[0].readline(), b"OK\n")
+            first[1].close()
+            self.assertEqual(await second[0].readline(), b"OK\n")
+            second[1].close()
+
+        self._run(machine, client)
+        self.assertEqual([g.get('X') for g in machine.commands],
+                         [1.0, 3.0, 2.0])
+
+    def test_unix_socket(self):
+        machine = SlowMachine()
+        machine.go.set()
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'pycnc.sock')
+
+        async def run():
+            server = GCodeServer(machine)
+            for _ in range(2):
+                # socket file of the previous run is replaced
+                await server.start_unix(path)
+                reader, writer = await asyncio.open_unix_connection(path)
+                await reader.readline()
+                writer.write(b"G1 X1\n")
+                answer = await reader.readline()
+                writer.close()
+                await server.close()
+            return answer
+
+        try:
+            self.assertEqual(asyncio.run(run()), b"OK\n")
+        finally:
+            shutil.rmtree(directory)
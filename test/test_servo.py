@@ -0,0 +1,210 @@
+from unittest import TestCase
+import unittest
+import os
+import shutil
+import subprocess
+import tempfile
+import numpy as np
+from servo import servo
+from servo.calibration import ServoCalibration, CalibrationException
+
+TABLE = """# channel, angle, pulse width
+0 -1.5 760000
+0 0.0  1550000
+0 1.5  2340000
+1 -1.0 2000000  # reversed servo
+1 1.0  1000000
+2 0.0  1000000
+2 1.0  2000000
+"""
+
+PLAYER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                          'realTimePlayer')
+
+# loads calibration with realTimePlayer code and prints duty cycles of all
+# channels for the angles of arguments
+PLAYER_CALIBRATION = r"""
+#include <stdio.h>
+#include <stdlib.h>
+#include "rtstream.h"
+
+int main(int argc, char *argv[])
+{
+	static rt_calibration_t cal;
+	rt_stream_params_t params = { .period_ns = DEFAULT_PERIOD_NS };
+	int i, channel;
+
+	if (rt_calibration_load(&cal, argv[1]))
+		return 1;
+	rt_stream_set_calibration(&cal);
+	for (i = 2; i < argc; i++)
+		for (channel = 0; channel < RT_CHANNELS; channel++)
+			printf("%u\n", rt_ang_to_duty(&params, channel,
+						     strtof(argv[i], NULL)));
+	return 0;
+}
+"""
+
+
+class TestServoKernel(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.root, 'pwm0'))
+        open(self._path('duty_cycle'), 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _path(self, name):
+        return os.path.join(self.root, 'pwm0', name)
+
+    def _read(self, name):
+        with open(self._path(name)) as fh:
+            return fh.readline().strip()
+
+    def test_init(self):
+        dut = servo.ServoKernel(0, sysfs_root=self.root)
+        self.assertEqual(self._read('period'), '20000000')
+        self.assertEqual(self._read('enable'), '1')
+        dut.close()
+        self.assertEqual(self._read('enable'), '0')
+
+    def test_move_to_angle(self):
+        dut = servo.ServoKernel(0, sysfs_root=self.root)
+        dut.move_to_angle(0.0)
+        self.assertEqual(self._read('duty_cycle'), '1550000')
+        dut.move_to_angle(-10.0)
+        self.assertEqual(self._read('duty_cycle'), '600000')
+        dut.move_to_angle(10.0)
+        self.assertEqual(self._read('duty_cycle'), '2500000')
+        dut.close()
+
+    def test_calibration(self):
+        dut = servo.ServoKernel(0, sysfs_root=self.root)
+        dut.set_calibration(ServoCalibration.parse(TABLE), 1)
+        dut.move_to_angle(0.5)
+        self.assertEqual(self._read('duty_cycle'), '1250000')
+        dut.move_to_angle(-10.0)
+        self.assertEqual(self._read('duty_cycle'), '2000000')
+        dut.close()
+
+    def test_export(self):
+        root = tempfile.mkdtemp()
+        try:
+            # the kernel would create pwm1 after the export, it does not here
+            self.assertRaises(OSError, servo.ServoKernel, 1, root)
+            with open(os.path.join(root, 'export')) as fh:
+                self.assertEqual(fh.read(), '1')
+        finally:
+            shutil.rmtree(root)
+
+
+class TestServoCalibration(TestCase):
+    def test_to_duty(self):
+        dut = ServoCalibration.parse(TABLE)
+        self.assertEqual(dut.channels, 3)
+        self.assertEqual(dut.pulse_limits(1), (1000000, 2000000))
+        angles = np.array([[0.75, 0.0], [-3.0, 3.0], [1.5, -1.0]])
+        duty = dut.to_duty(angles)
+        self.assertEqual(duty.dtype, np.uint32)
+        self.assertEqual(duty.tolist(), [[1945000, 1500000],
+                                         [760000, 1000000],
+                                         [2340000, 2000000]])
+        self.assertEqual(dut.channel_duty(0, 0.75), 1945000.0)
+        np.testing.assert_allclose(dut.to_angle(duty),
+                                   [[0.75, 0.0], [-1.5, 1.0], [1.5, -1.0]])
+        self.assertRaises(CalibrationException, dut.to_duty,
+                          np.zeros((1, 4)))
+
+    def test_wrong_table(self):
+        for table in ("0 0.0 1000\n",
+                      "0 0.0 1000\n0 0.0 2000\n",
+                      "0 0.0 1000\n0 1.0 2000\n0 2.0 1500\n",
+                      "1 0.0 1000\n1 1.0 2000\n",
+                      "0 0.0\n0 1.0 2000\n",
+                      "0 0.0 1000\n0 1.0 2000\n1 0.0 1000\n1 1.0 2000\n",
+                      TABLE + "3 0.0 1000\n3 1.0 2000\n",
+                      ""):
+            self.assertRaises(CalibrationException, ServoCalibration.parse,
+                              table)
+        self.assertRaises(CalibrationException, ServoCalibration.load,
+                          '/nonexistent/calibration')
+
+
+class TestCalibrationPlayer(TestCase):
+    """ realTimePlayer loads the same tables as the planner.
+    """
+    @classmethod
+    def setUpClass(cls):
+        if shutil.which('gcc') is None:
+            raise unittest.SkipTest("no C compiler")
+        cls.dir = tempfile.mkdtemp()
+        source = os.path.join(cls.dir, 'calibration.c')
+        with open(source, 'w') as f:
+            f.write(PLAYER_CALIBRATION)
+        cls.player = os.path.join(cls.dir, 'calibration')
+        subprocess.check_call(['gcc', '-I', PLAYER_DIR, source,
+                               os.path.join(PLAYER_DIR, 'rtstream.c'),
+                               '-o', cls.player])
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dir)
+
+    def _player(self, table, angles):
+        path = os.path.join(self.dir, 'table')
+        with open(path, 'w') as f:
+            f.write(table)
+        result = subprocess.run([self.player, path]
+                                + [repr(angle) for angle in angles],
+                                stdout=subprocess.PIPE,
+                                universal_newlines=True)
+        if result.returncode:
+            return None
+        return [int(line) for line in result.stdout.split()
+                if line.isdigit()]
+
+    def test_same_tables(self):
+        valid = "".join("{0} -1.0 1000000\n{0} 0.0 {1}\n{0} 1.0 2000000\n"
+                        .format(channel, 1400000 + channel * 100000)
+                        for channel in range(3))
+        tables = [TABLE,
+                  valid,
+                  # lines of channels can be mixed
+                  "\n".join(sorted(valid.splitlines(), key=lambda l: l[2:])),
+                  "# comment\n\n" + TABLE.replace("0 0.0 ", "0 0.0 #"),
+                  valid + "2 2.0 3000000 extra\n",
+                  valid + "3 2.0 3000000\n",
+                  valid + "-1 2.0 3000000\n",
+                  valid.replace("0 0.0", "0 1.0"),
+                  valid.replace("0 0.0", "0 -2.0"),
+                  valid.replace("1 0.0 1500000", "1 0.0 1000000"),
+                  valid.replace("1 0.0 1500000", "1 0.0 2500000"),
+                  valid.replace("2 1.0", "2 nan"),
+                  valid.replace("2 1.0 2000000", "2 1.0 inf"),
+                  valid.replace("2 1.0 2000000\n", ""),
+                  valid.replace("1 ", "3 "),
+                  TABLE + "".join("0 {} {}\n".format(2 + i, 2400000 + i)
+                                  for i in range(62)),
+                  TABLE + "".join("0 {} {}\n".format(2 + i, 2400000 + i)
+                                  for i in range(61)),
+                  "",
+                  "0 0.0 1000\n"]
+        angles = [-2.0, -0.3, 0.0, 0.75, 1.5, 100.0]
+        for table in tables:
+            try:
+                calibration = ServoCalibration.parse(table)
+            except CalibrationException:
+                calibration = None
+            player = self._player(table, angles)
+            if calibration is None:
+                self.assertIsNone(player, table)
+            else:
+                duty = calibration.to_duty(np.repeat(
+                    np.array(angles)[:, np.newaxis], 3, axis=1))
+                self.assertEqual(player, duty.flatten().tolist(), table)
+        # both valid and wrong tables are tested
+        self.assertTrue(any(self._player(table, []) is None
+                            for table in tables))
+        self.assertTrue(any(self._player(table, []) is not None
+                            for table in tables))
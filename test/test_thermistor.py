@@ -0,0 +1,76 @@
+from unittest import TestCase
+import math
+import numpy as np
+from cnc.sensors import thermistor
+
+
+def beta_temperature(v):
+    r = v * thermistor.R1 / (thermistor.Vcc - v)
+    return thermistor.BETA / math.log(r / thermistor.Rinf) \
+        - thermistor.CELSIUS_TO_KELVIN
+
+
+class FakeAdc(object):
+    def __init__(self):
+        self.voltages = []
+
+    def measure(self, channel):
+        return self.voltages.pop(0)
+
+
+class TestThermistor(TestCase):
+    def setUp(self):
+        self.adc = thermistor.adc
+        thermistor.adc = FakeAdc()
+
+    def tearDown(self):
+        thermistor.adc = self.adc
+        thermistor._filters.clear()
+
+    def test_table(self):
+        voltages = np.linspace(0.001, thermistor.Vcc - 0.001, 1000)
+        expected = np.array([beta_temperature(v) for v in voltages])
+        np.testing.assert_allclose(
+            thermistor.voltage_to_temperature(voltages), expected, atol=0.01)
+        self.assertAlmostEqual(thermistor.voltage_to_temperature(1.0),
+                               beta_temperature(1.0), 2)
+        self.assertIsInstance(thermistor.voltage_to_temperature(1.0), float)
+        # the nominal point of thermistor
+        r0 = thermistor.R0
+        v0 = thermistor.Vcc * r0 / (r0 + thermistor.R1)
+        self.assertAlmostEqual(thermistor.voltage_to_temperature(v0),
+                               thermistor.T0, 2)
+
+    def test_bad_voltage(self):
+        t = thermistor.voltage_to_temperature(
+            np.array([0.0, -1.0, thermistor.Vcc, 5.0, 1.0]))
+        self.assertTrue(np.all(np.isnan(t[0:4])))
+        self.assertFalse(np.isnan(t[4]))
+
+    def test_filter(self):
+        f = thermistor.TemperatureFilter(3, 'median')
+        self.assertIsNone(f.value())
+        self.assertEqual(f.add(10.0), 10.0)
+        self.assertEqual(f.add(float('nan')), 10.0)
+        self.assertEqual(f.add(30.0), 20.0)
+        self.assertEqual(f.add(20.0), 25.0)
+        self.assertEqual(f.add(100.0), 30.0)
+        f = thermistor.TemperatureFilter(2, 'mean')
+        f.add(10.0)
+        self.assertEqual(f.add(20.0), 15.0)
+        self.assertRaises(ValueError, thermistor.TemperatureFilter, 3, 'max')
+
+    def test_get_temperature(self):
+        thermistor.set_filter(0, 3, 'median')
+        thermistor.adc.voltages = [1.0, thermistor.Vcc, 1.0,
+                                   thermistor.Vcc, thermistor.Vcc,
+                                   thermistor.Vcc]
+        t = thermistor.voltage_to_temperature(1.0)
+        self.assertEqual(thermistor.get_temperature(0), t)
+        # glitch is skipped
+        self.assertEqual(thermistor.get_temperature(0), t)
+        self.assertEqual(thermistor.get_temperature(0), t)
+        self.assertEqual(thermistor.get_temperature(0), t)
+        self.assertEqual(thermistor.get_temperature(0), t)
+        # thermistor is disconnected for the whole window
+        self.assertRaises(IOError, thermistor.get_temperature, 0)
@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from io import BytesIO
+
+import cnc.config
+from cnc.rtstream import ENCODING_ANGLE, ENCODING_DUTY
+from cnc.trajcache import *
+
+
+class TestTrajectoryCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_key(self):
+        key = trajectory_key(b'G1X1\n', ENCODING_ANGLE)
+        self.assertEqual(key, trajectory_key(b'G1X1\n', ENCODING_ANGLE))
+        self.assertNotEqual(key, trajectory_key(b'G1X2\n', ENCODING_ANGLE))
+        self.assertNotEqual(key, trajectory_key(b'G1X1\n', ENCODING_DUTY))
+        dt = cnc.config.REAL_TIME_DT
+        cnc.config.REAL_TIME_DT = dt / 2
+        try:
+            self.assertNotEqual(key,
+                                trajectory_key(b'G1X1\n', ENCODING_ANGLE))
+        finally:
+            cnc.config.REAL_TIME_DT = dt
+        path = cnc.config.RT_STREAM_PATH
+        cnc.config.RT_STREAM_PATH = '/tmp/other'
+        try:
+            self.assertEqual(key, trajectory_key(b'G1X1\n', ENCODING_ANGLE))
+        finally:
+            cnc.config.RT_STREAM_PATH = path
+        table = os.path.join(self.dir, 'calibration')
+        with open(table, 'w') as f:
+            f.write("0 0.0 1000000\n0 1.0 2000000\n")
+        cnc.config.SERVO_CALIBRATION_PATH = table
+        try:
+            calibrated = trajectory_key(b'G1X1\n', ENCODING_ANGLE)
+            self.assertNotEqual(key, calibrated)
+            with open(table, 'w') as f:
+                f.write("0 0.0 1000000\n0 1.0 2100000\n")
+            self.assertNotEqual(calibrated,
+                                trajectory_key(b'G1X1\n', ENCODING_ANGLE))
+        finally:
+            cnc.config.SERVO_CALIBRATION_PATH = None
+
+    def test_store_lookup(self):
+        cache = TrajectoryCache(self.dir, 1024)
+        self.assertIsNone(cache.lookup('a'))
+        path = cache.store('a', lambda fh: fh.write(b'stream'))
+        self.assertEqual(cache.lookup('a'), path)
+        out = BytesIO()
+        self.assertEqual(stream_file(path, out), 6)
+        self.assertEqual(out.getvalue(), b'stream')
+
+    def test_failed_store(self):
+        cache = TrajectoryCache(self.dir, 1024)
+
+        def write(fh):
+            fh.write(b'part')
+            raise ValueError("failed")
+        self.assertRaises(ValueError, cache.store, 'a', write)
+        self.assertIsNone(cache.lookup('a'))
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_eviction(self):
+        cache = TrajectoryCache(self.dir, 250)
+        now = time.time()
+        for i, key in enumerate(('a', 'b')):
+            path = cache.store(key, lambda fh: fh.write(b'x' * 100))
+            os.utime(path, (now - 100 + i, now - 100 + i))
+        # 'a' becomes the most recently used
+        cache.lookup('a')
+        cache.store('c', lambda fh: fh.write(b'x' * 100))
+        self.assertIsNotNone(cache.lookup('a'))
+        self.assertIsNone(cache.lookup('b'))
+        self.assertIsNotNone(cache.lookup('c'))
+        # the new stream is kept even if it alone is over the limit
+        cache.store('d', lambda fh: fh.write(b'x' * 300))
+        self.assertEqual(os.listdir(self.dir), ['d.rpds'])
+
+    def test_empty_stream(self):
+        cache = TrajectoryCache(self.dir, 1024)
+        path = cache.store('a', lambda fh: None)
+        out = BytesIO()
+        self.assertEqual(stream_file(path, out), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+from unittest import TestCase
+import contextlib
+import io
+import os
+import tempfile
+import cnc.rtstream
+from cnc.compiler import Compiler
+from cnc.rtstream import *
+from cnc.verifier import *
+
+PROGRAM = os.path.join(os.path.dirname(__file__), '..', 'gcode',
+                       'test2.gcode')
+
+
+class TestVerifier(TestCase):
+    def setUp(self):
+        with open(PROGRAM) as f:
+            self.lines = f.readlines()
+
+    def _compile(self, encoding):
+        stream = io.BytesIO()
+        Compiler(stream, encoding, 1).compile(self.lines)
+        return stream.getvalue()
+
+    def test_binary(self):
+        expected = len(plan_samples(self.lines))
+        for encoding in (ENCODING_ANGLE, ENCODING_DUTY):
+            result = verify(self.lines, self._compile(encoding))
+            self.assertEqual(result['frames'], expected)
+            self.assertLess(result['max_error_mm'], VERIFY_TOLERANCE_MM)
+            self.assertLessEqual(result['rms_error_mm'],
+                                 result['max_error_mm'])
+
+    def test_text(self):
+        stream = self._compile(ENCODING_ANGLE)
+        header, frames = read_stream(stream)
+        text = "ok\n" + format_text_frames(frames) + "ok\n"
+        result = verify(self.lines, text.encode('ascii'))
+        self.assertLess(result['max_error_mm'], VERIFY_TOLERANCE_MM)
+
+    def test_calibrated_duty(self):
+        fd, path = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f:
+            for channel in range(3):
+                for angle in np.linspace(-1.5, 1.5, 7):
+                    f.write("{} {} {}\n".format(
+                        channel, angle, 1550000 + 530000 * angle
+                        + 20000 * angle ** 2))
+        cnc.rtstream.SERVO_CALIBRATION_PATH = path
+        try:
+            stream = self._compile(ENCODING_DUTY)
+            result = verify(self.lines, stream)
+        finally:
+            cnc.rtstream.SERVO_CALIBRATION_PATH = None
+            os.remove(path)
+        self.assertLess(result['max_error_mm'], VERIFY_TOLERANCE_MM)
+        self.assertRaises(VerifierException, verify, self.lines, stream)
+
+    def test_detects_error(self):
+        header, frames = read_stream(self._compile(ENCODING_ANGLE))
+        frames = frames.copy()
+        frames[10, 0] += 0.01
+        stream = encode_header(ENCODING_ANGLE) \
+            + encode_frames(frames, ENCODING_ANGLE)
+        result = verify(self.lines, stream)
+        self.assertEqual(result['worst_frame'], 10)
+        self.assertGreater(result['max_error_mm'], 0.1)
+        # missing frames
+        self.assertRaises(VerifierException, verify, self.lines,
+                          stream[:-FRAME_SIZE])
+        self.assertRaises(VerifierException, verify, self.lines, b'\xff\xfe')
+
+    def test_empty(self):
+        result = verify(["G90", "exit"], b'')
+        self.assertEqual(result['frames'], 0)
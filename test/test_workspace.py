@@ -0,0 +1,41 @@
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+import numpy as np
+from cnc.deltaRobot import DeltaMechanics
+from cnc.workspace import *
+from cnc.config import *
+
+
+class TestReachabilityGrid(TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.robot = DeltaMechanics(L=DELTA_BIG_L, l=DELTA_SMALL_L,
+                                    wb=DELTA_WB, up=DELTA_UP)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_matches_inverse_kinematics(self):
+        dut = ReachabilityGrid(self.robot, 0.002)
+        tip_pos = np.random.RandomState(1).uniform(-0.08, 0.08, (20000, 3))
+        _, expected = self.robot.solve_tip_positions(tip_pos)
+        valid = dut.contains(tip_pos)
+        # reachable positions are never rejected
+        self.assertFalse((expected & ~valid).any())
+        # unreachable features thinner than a cell can be lost
+        self.assertLess(np.count_nonzero(valid != expected), 20)
+        for p, v in zip(tip_pos[:500], valid[:500]):
+            self.assertEqual(dut.contains_point(*p), v)
+        self.assertFalse(dut.contains_point(1.0, 0.0, 0.0))
+
+    def test_cache(self):
+        dut = ReachabilityGrid(self.robot, 0.002, self.cache_dir)
+        self.assertEqual(os.listdir(self.cache_dir),
+                         ['workspace-{}.npy'.format(dut.key())])
+        cached = ReachabilityGrid(self.robot, 0.002, self.cache_dir)
+        np.testing.assert_array_equal(dut.cells, cached.cells)
+        key = dut.key()
+        self.robot.motors[0].angle_max = 0.0
+        self.assertNotEqual(ReachabilityGrid(self.robot, 0.002).key(), key)